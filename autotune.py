@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_FRAGMENTS = 8
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+LIMITS = {
+    'fragments': (1, 32),
+    'chunk_size': (256 * 1024, 16 * 1024 * 1024),
+}
+
+SAMPLE_WEIGHT = 0.3
+MIN_SAMPLE_BYTES = 2 * 1024 * 1024
+ERROR_RATE_LIMIT = 0.05
+IMPROVEMENT = 1.05
+REPROBE_EVERY = 10
+CEILING_TTL = 7 * 24 * 3600
+
+
+def tuning_host(url):
+    host = urlparse(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def blend(previous, sample):
+    if previous is None:
+        return sample
+    return previous + SAMPLE_WEIGHT * (sample - previous)
+
+
+class HostTuner:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.hosts = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading download tuning: {e}")
+            self.hosts = {}
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.hosts, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving download tuning: {e}")
+
+    def settings_for(self, url):
+        with self.lock:
+            state = self.hosts.get(tuning_host(url))
+            if not state:
+                return DEFAULT_FRAGMENTS, DEFAULT_CHUNK_SIZE
+            return state['fragments'], state['chunk_size']
+
+    def record(self, url, fragments, chunk_size, downloaded, elapsed, requests, errors, fragmented):
+        # fragment concurrency only matters for HLS/DASH, chunk size only for plain HTTP
+        knob = 'fragments' if fragmented else 'chunk_size'
+        used = fragments if fragmented else chunk_size
+        low, high = LIMITS[knob]
+        error_rate = errors / max(1, requests)
+        now = time.time()
+
+        with self.lock:
+            state = self.hosts.setdefault(tuning_host(url), {
+                'fragments': DEFAULT_FRAGMENTS,
+                'chunk_size': DEFAULT_CHUNK_SIZE,
+                'speed': None,
+                'error_rate': 0.0,
+                'samples': 0,
+                'best': {},
+                'ceiling': {},
+            })
+            state['samples'] += 1
+            state['updated'] = now
+            state['error_rate'] = blend(state['error_rate'], error_rate)
+
+            ceiling = state['ceiling'].get(knob)
+            if ceiling and now - ceiling['at'] > CEILING_TTL:
+                del state['ceiling'][knob]
+                ceiling = None
+
+            if errors and error_rate > ERROR_RATE_LIMIT:
+                # throttled or flaky, back off and don't probe this high again for a while
+                state[knob] = max(low, used // 2)
+                state['ceiling'][knob] = {'value': used, 'at': now}
+                best = state['best'].get(knob)
+                if best and best['value'] >= used:
+                    del state['best'][knob]
+            elif downloaded >= MIN_SAMPLE_BYTES and elapsed > 0:
+                speed = downloaded / elapsed
+                state['speed'] = blend(state['speed'], speed)
+                best = state['best'].get(knob)
+                if best and best['value'] == used:
+                    best['speed'] = blend(best['speed'], speed)
+                upper = min(high, ceiling['value'] // 2) if ceiling else high
+                step_up = max(used, min(upper, used * 2))
+                if not best or speed >= best['speed'] * IMPROVEMENT:
+                    state['best'][knob] = {'value': used, 'speed': speed}
+                    state[knob] = step_up
+                elif best['value'] == used:
+                    # settled, but conditions change, so look one step up every now and then
+                    state[knob] = step_up if state['samples'] % REPROBE_EVERY == 0 else used
+                else:
+                    state[knob] = best['value']
+            else:
+                return
+
+            self.save()
+
+    def report(self):
+        with self.lock:
+            return [dict(state, host=host) for host, state in sorted(self.hosts.items())]
+
+    def reset(self, host=None):
+        with self.lock:
+            if host is None:
+                self.hosts.clear()
+            else:
+                self.hosts.pop(host, None)
+            self.save()
@@ -0,0 +1,218 @@
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_jobs import FFmpegCancelled, FFmpegJob, FFmpegJobGroup
+from segment_transcode import single_args
+from smart_cut import SmartCut
+
+MEDIA_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm', '.m4v', '.ts', '.mts', '.wmv', '.mpg',
+                    '.mpeg', '.3gp', '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.wav', '.flac'}
+DEFAULT_NAMING = {
+    'convert': '{name}.{ext}',
+    'trim': '{name}_trimmed.{ext}',
+    'extract-audio': '{name}.{ext}',
+}
+# results go to a folder under the source unless told otherwise, so a second run does not pick them up
+DEFAULT_FOLDERS = {
+    'convert': 'converted',
+    'trim': 'trimmed',
+    'extract-audio': 'audio',
+}
+MAX_HEAVY_WORKERS = 4
+MAX_LIGHT_WORKERS = 8
+PARTIAL_PREFIX = '.batch-'
+
+
+def find_inputs(source, recursive=False, exclude_dirs=()):
+    # a folder means every media file in it, anything else is taken as a glob pattern
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '**', '*') if recursive else os.path.join(source, '*')
+        files = [path for path in glob.glob(pattern, recursive=recursive)
+                 if os.path.splitext(path)[1].lower() in MEDIA_EXTENSIONS]
+    else:
+        files = glob.glob(os.path.expanduser(source), recursive=recursive)
+    # results of earlier runs written into a folder under the source are not inputs
+    root = source_root(source)
+    excluded = [os.path.join(os.path.abspath(folder), '') for folder in exclude_dirs if folder]
+    excluded += [os.path.join(root, folder, '') for folder in DEFAULT_FOLDERS.values()]
+    # an output folder that holds the source itself can't be left out
+    excluded = tuple(folder for folder in excluded if not os.path.join(root, '').startswith(folder))
+    return sorted(os.path.abspath(path) for path in files
+                  if os.path.isfile(path) and not os.path.basename(path).startswith(PARTIAL_PREFIX)
+                  and not os.path.abspath(path).startswith(excluded))
+
+
+def source_root(source):
+    if os.path.isdir(source):
+        return os.path.abspath(source)
+    # the part of the pattern before the first wildcard
+    fixed = []
+    for part in os.path.abspath(os.path.expanduser(source)).split(os.sep):
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    return os.sep.join(fixed) or os.sep
+
+
+def output_path(infile, output_dir, naming, ext, index, root):
+    name, in_ext = os.path.splitext(os.path.basename(infile))
+    try:
+        filename = naming.format(name=name, ext=ext or in_ext.lstrip('.'), index=index)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Bad naming pattern {naming!r}: use {{name}}, {{ext}} and {{index}} ({e})")
+    # files from subfolders keep their relative place under the output folder
+    relative = os.path.relpath(os.path.dirname(infile), root)
+    if relative.startswith(os.pardir):
+        relative = ''
+    return os.path.normpath(os.path.join(output_dir, relative, filename))
+
+
+def is_up_to_date(infile, outfile):
+    try:
+        out_stat = os.stat(outfile)
+        return out_stat.st_size > 0 and out_stat.st_mtime >= os.stat(infile).st_mtime
+    except OSError:
+        return False
+
+
+def plan_batch(inputs, output_dir, naming, ext, root, skip_up_to_date=True):
+    outputs = [output_path(infile, output_dir, naming, ext, index, root) for index, infile in enumerate(inputs, 1)]
+    # with the output folder inside the source, results of an earlier run are not inputs themselves
+    produced = {os.path.normcase(os.path.abspath(outfile)) for infile, outfile in zip(inputs, outputs)
+                if os.path.normcase(os.path.abspath(outfile)) != os.path.normcase(infile)}
+    items = []
+    claimed = {}
+    for infile, outfile in zip(inputs, outputs):
+        if os.path.normcase(infile) in produced:
+            continue
+        item = {'input': infile, 'output': outfile, 'status': 'pending', 'detail': '', 'elapsed': None}
+        key = os.path.normcase(os.path.abspath(outfile))
+        if key == os.path.normcase(infile):
+            item.update(status='failed', detail="output would overwrite the input")
+        elif key in claimed:
+            item.update(status='failed', detail=f"same output as {os.path.basename(claimed[key])}")
+        elif skip_up_to_date and is_up_to_date(infile, outfile):
+            item.update(status='skipped', detail="up to date")
+        claimed.setdefault(key, infile)
+        items.append(item)
+    return items
+
+
+def batch_workers(cpu_heavy, files):
+    # encodes already use several threads each, remuxes and audio extraction are mostly I/O
+    cpus = os.cpu_count() or 4
+    limit = max(1, min(MAX_HEAVY_WORKERS, cpus // 2)) if cpu_heavy else max(1, min(MAX_LIGHT_WORKERS, cpus))
+    return max(1, min(limit, files))
+
+
+def tool_job_factory(ffmpeg_path, probe, tool, video_args=(), audio_args=(), output_args=(),
+                     start=None, end=None, smart=True, profile='balanced', threads=None):
+    # returns make_job(infile, outfile, on_progress) for BatchJob
+    def convert(infile, outfile, on_progress):
+        return FFmpegJob(ffmpeg_path, single_args(infile, outfile, video_args, audio_args, output_args, threads),
+                         duration=probe.duration(infile), output=outfile, on_progress=on_progress)
+
+    def trim(infile, outfile, on_progress):
+        duration = probe.duration(infile)
+        if duration and start >= duration:
+            raise ValueError(f"the file is only {duration:.1f} s long")
+        if smart:
+            return SmartCut(ffmpeg_path, probe, infile, outfile, start, end, on_progress=on_progress,
+                            profile=profile)
+        length = min(end, duration or end) - start
+        return FFmpegJob(ffmpeg_path, ['-ss', str(start), '-to', str(end), '-i', infile, '-c', 'copy', outfile],
+                         duration=length, output=outfile, on_progress=on_progress)
+
+    return trim if tool == 'trim' else convert
+
+
+class BatchJob(FFmpegJobGroup):
+    def __init__(self, ffmpeg_path, probe, items, make_job, workers=None, on_progress=None):
+        super().__init__(ffmpeg_path, on_progress)
+        self.probe = probe
+        self.items = items
+        self.make_job = make_job
+        self.workers = workers or batch_workers(True, len(items))
+        self.durations = {}
+        self.files_done = 0
+        self.files_total = 0
+
+    def run(self):
+        pending = [item for item in self.items if item['status'] == 'pending']
+        infos = self.probe.probe_many([item['input'] for item in pending])
+        for item in pending:
+            self.durations[item['input']] = ((infos.get(item['input']) or {}).get('duration') or 0) or 1
+        self.total_work = sum(self.durations.values()) or 1
+        self.files_total = len(pending)
+
+        # one file failing does not stop the others, every outcome ends up in self.items
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(pending) or 1))) as pool:
+            list(pool.map(self._run_item, pending))
+        return self.items
+
+    def _run_item(self, item):
+        duration = self.durations[item['input']]
+        if self.cancelled:
+            item['status'] = 'cancelled'
+            return
+        # written under a hidden name first, so a crash never leaves a file that looks up to date
+        folder, filename = os.path.split(item['output'])
+        partial = os.path.join(folder, PARTIAL_PREFIX + filename)
+        started = time.monotonic()
+        try:
+            os.makedirs(folder, exist_ok=True)
+            job = self.make_job(item['input'], partial,
+                                lambda progress: self.report(item['input'], progress['percent'] / 100 * duration))
+            with self.lock:
+                self.jobs.append(job)
+                cancelled = self.cancelled
+            if cancelled:
+                job.cancel()
+            job.run()
+            os.replace(partial, item['output'])
+            item['status'] = 'done'
+        except FFmpegCancelled:
+            item['status'] = 'cancelled'
+        except Exception as e:
+            lines = str(e).strip().splitlines()
+            item.update(status='failed', detail=lines[-1] if lines else type(e).__name__)
+        finally:
+            item['elapsed'] = time.monotonic() - started
+            if os.path.exists(partial):
+                try:
+                    os.remove(partial)
+                except OSError:
+                    pass
+            with self.lock:
+                self.files_done += 1
+            self.report(item['input'], duration)
+
+    def report(self, key, seconds):
+        with self.lock:
+            self.done_time[key] = seconds
+            done = sum(self.done_time.values())
+            files = (self.files_done, self.files_total)
+        if self.on_progress:
+            percent = min(100, int(done / (self.total_work or 1) * 100))
+            self.on_progress({'time': done, 'percent': percent, 'fps': None, 'speed': None,
+                              'bitrate': None, 'size': None, 'done': percent >= 100, 'files': files})
+
+
+def summarize_batch(items):
+    counts = {}
+    for item in items:
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+    return ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+
+
+def describe_batch(items):
+    lines = []
+    for item in items:
+        detail = item['detail']
+        if item['status'] == 'done' and item['elapsed'] is not None:
+            detail = f"{item['elapsed']:.1f} s -> {os.path.basename(item['output'])}"
+        line = f"{item['status'].upper():<10} {os.path.basename(item['input'])}"
+        lines.append(f"{line}  ({detail})" if detail else line)
+    return lines
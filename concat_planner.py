@@ -0,0 +1,304 @@
+import os
+import shutil
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from encoder_probe import profile_args, quality_args
+from ffmpeg_jobs import FFmpegError, FFmpegJobGroup, write_concat_list
+from media_probe import first_stream
+
+CONCAT_WEIGHT = 0.1
+
+CONTAINER_CODECS = {
+    'mp4': ({'h264', 'hevc', 'mpeg4', 'av1', 'vp9'}, {'aac', 'mp3', 'alac', 'ac3', 'opus', 'flac'}),
+    'mov': ({'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'}, {'aac', 'mp3', 'alac', 'ac3', 'pcm_s16le'}),
+    'webm': ({'vp8', 'vp9', 'av1'}, {'vorbis', 'opus'}),
+    'avi': ({'mpeg4', 'h264', 'mjpeg', 'msmpeg4v3'}, {'mp3', 'ac3', 'pcm_s16le'}),
+    'mkv': (None, None),
+}
+OPUS_SAMPLE_RATE = 48000
+MATROSKA_TIME_BASE = '1/1000'
+DEFAULT_CODECS = {
+    'webm': ('vp9', 'opus'),
+    'avi': ('mpeg4', 'mp3'),
+}
+VIDEO_ENCODERS = {
+    'h264': 'libx264',
+    'hevc': 'libx265',
+    'vp8': 'libvpx',
+    'vp9': 'libvpx-vp9',
+    'av1': 'libaom-av1',
+    'mpeg4': 'mpeg4',
+    'mjpeg': 'mjpeg',
+    'prores': 'prores_ks',
+}
+AUDIO_ENCODERS = {
+    'aac': 'aac',
+    'mp3': 'libmp3lame',
+    'opus': 'libopus',
+    'vorbis': 'libvorbis',
+    'ac3': 'ac3',
+    'flac': 'flac',
+    'alac': 'alac',
+    'pcm_s16le': 'pcm_s16le',
+}
+
+
+def video_params(info):
+    stream = first_stream(info, 'video')
+    if not stream:
+        return None
+    return {
+        'codec': stream['codec'],
+        'profile': stream['profile'],
+        'width': stream['width'],
+        'height': stream['height'],
+        'pix_fmt': stream['pix_fmt'],
+        'fps': stream['fps'],
+        'time_base': stream['time_base'],
+    }
+
+
+def audio_params(info):
+    stream = first_stream(info, 'audio')
+    if not stream:
+        return None
+    return {
+        'codec': stream['codec'],
+        'sample_rate': stream['sample_rate'],
+        'channels': stream['channels'],
+        'channel_layout': stream['channel_layout'],
+        'time_base': stream['time_base'],
+    }
+
+
+def stream_order(info):
+    # the concat demuxer pairs streams by index, so video and audio must sit where the parts put them
+    indexes = [stream['index'] for stream in info.get('streams', [])]
+    video, audio = first_stream(info, 'video'), first_stream(info, 'audio')
+    return tuple(indexes.index(stream['index']) if stream else None for stream in (video, audio))
+
+
+def target_order(video, audio):
+    return (0 if video else None, (1 if video else 0) if audio else None)
+
+
+def signature(video, audio):
+    # everything the concat demuxer needs to be identical for a plain stream copy
+    return (
+        tuple(sorted(video.items())) if video else None,
+        tuple(sorted(audio.items())) if audio else None,
+    )
+
+
+def pick_target(entries, output_format):
+    # the parameter set covering the most playback time wins, so the least footage gets re-encoded
+    weights = Counter()
+    params = {}
+    for entry in entries:
+        key = signature(entry['video'], entry['audio'])
+        weights[key] += entry['duration'] or 1
+        params[key] = (entry['video'], entry['audio'])
+    video, audio = params[weights.most_common(1)[0][0]]
+    video = dict(video) if video else None
+    audio = dict(audio) if audio else None
+
+    allowed_video, allowed_audio = CONTAINER_CODECS.get(output_format, (None, None))
+    default_video, default_audio = DEFAULT_CODECS.get(output_format, ('h264', 'aac'))
+    if video and (video['codec'] not in VIDEO_ENCODERS or
+                  (allowed_video is not None and video['codec'] not in allowed_video)):
+        video.update({'codec': default_video, 'profile': None, 'pix_fmt': 'yuv420p'})
+    if audio and (audio['codec'] not in AUDIO_ENCODERS or
+                  (allowed_audio is not None and audio['codec'] not in allowed_audio)):
+        audio['codec'] = default_audio
+    if audio and audio['codec'] == 'opus':
+        audio['sample_rate'] = OPUS_SAMPLE_RATE
+    return video, audio
+
+
+def mismatch_reasons(entry, target_video, target_audio):
+    reasons = []
+    video, audio = entry['video'], entry['audio']
+    if video and not target_video:
+        reasons.append("dropping video")
+    elif video:
+        if video['codec'] != target_video['codec']:
+            reasons.append(f"{video['codec']} → {target_video['codec']}")
+        if (video['width'], video['height']) != (target_video['width'], target_video['height']):
+            reasons.append(f"{video['width']}x{video['height']} → {target_video['width']}x{target_video['height']}")
+        if video['fps'] != target_video['fps']:
+            reasons.append(f"{video['fps']} → {target_video['fps']} fps")
+        if video['pix_fmt'] != target_video['pix_fmt']:
+            reasons.append(f"{video['pix_fmt']} → {target_video['pix_fmt']}")
+        if target_video['profile'] and video['codec'] == target_video['codec'] and \
+                video['profile'] != target_video['profile']:
+            reasons.append(f"profile {video['profile']} → {target_video['profile']}")
+    if not reasons and entry['order'] != target_order(target_video, target_audio):
+        reasons.append("stream order")
+    if not reasons and (video and video['time_base'] != target_video['time_base'] or
+                        audio and target_audio and audio['time_base'] != target_audio['time_base']):
+        # the concat demuxer does not rescale timestamps between parts
+        reasons.append("time base")
+    if target_audio and not audio:
+        reasons.append("no audio, adding silence")
+    elif audio and target_audio and signature(None, audio) != signature(None, target_audio):
+        reasons.append(f"audio {audio['codec']} {audio['sample_rate']} Hz → "
+                       f"{target_audio['codec']} {target_audio['sample_rate']} Hz")
+    return reasons
+
+
+def part_format(video, audio):
+    # re-encoded parts must come out with the same time bases as the files copied next to them
+    time_base = (video or audio or {}).get('time_base')
+    if time_base == MATROSKA_TIME_BASE:
+        return 'mkv'
+    allowed_video, allowed_audio = CONTAINER_CODECS['mp4']
+    if (not video or video['codec'] in allowed_video) and (not audio or audio['codec'] in allowed_audio):
+        return 'mp4'
+    return 'mkv'
+
+
+def plan_concat(paths, output_format, probe):
+    infos = probe.probe_many(paths)
+    entries = []
+    for path in paths:
+        info = infos.get(path)
+        if info is None:
+            raise FFmpegError(f"Could not read {os.path.basename(path)}")
+        entries.append({
+            'path': path,
+            'duration': info['duration'] or 0,
+            'video': video_params(info),
+            'audio': audio_params(info),
+            'order': stream_order(info),
+        })
+
+    target_video, target_audio = pick_target(entries, output_format)
+    for entry in entries:
+        if target_video and not entry['video']:
+            raise FFmpegError(f"{os.path.basename(entry['path'])} has no video stream")
+        reasons = mismatch_reasons(entry, target_video, target_audio)
+        entry['action'] = 'transcode' if reasons else 'copy'
+        entry['reasons'] = reasons
+
+    return {
+        'output_format': output_format,
+        'video': target_video,
+        'audio': target_audio,
+        'part_format': part_format(target_video, target_audio),
+        'entries': entries,
+        'duration': sum(entry['duration'] for entry in entries),
+    }
+
+
+def describe_plan(plan):
+    lines = []
+    for number, entry in enumerate(plan['entries'], 1):
+        name = os.path.basename(entry['path'])
+        if entry['action'] == 'copy':
+            lines.append(f"{number}. COPY       {name}")
+        else:
+            lines.append(f"{number}. TRANSCODE  {name}  ({', '.join(entry['reasons'])})")
+    return lines
+
+
+def video_encoder_args(video, profile=None):
+    # encoder settings that reproduce the stream parameters the other parts were made with
+    args = ['-c:v', VIDEO_ENCODERS[video['codec']]]
+    if profile:
+        args += profile_args(VIDEO_ENCODERS[video['codec']], profile)
+    if video['pix_fmt']:
+        args += ['-pix_fmt', video['pix_fmt']]
+    if video['codec'] == 'h264' and video['profile']:
+        profile = {'High': 'high', 'Main': 'main', 'Baseline': 'baseline',
+                   'Constrained Baseline': 'baseline', 'High 4:4:4 Predictive': 'high444'}.get(video['profile'])
+        if profile:
+            args += ['-profile:v', profile]
+    return args
+
+
+def transcode_args(entry, plan, output, threads, profile=None, crf=None):
+    video, audio = plan['video'], plan['audio']
+    args = ['-i', entry['path']]
+    if audio and not entry['audio']:
+        layout = audio['channel_layout'] or 'stereo'
+        args += ['-f', 'lavfi', '-t', f"{entry['duration']:.3f}",
+                 '-i', f"anullsrc=r={audio['sample_rate'] or 48000}:cl={layout}"]
+    if video:
+        args += ['-map', '0:v:0']
+    if audio:
+        args += ['-map', '1:a:0' if not entry['audio'] else '0:a:0']
+
+    # when only the time base differs, a remux into the part container is enough
+    if video and dict(entry['video'], time_base=None) == dict(video, time_base=None):
+        args += ['-c:v', 'copy']
+    elif video:
+        width, height = video['width'], video['height']
+        filters = [f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+                   f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2", "setsar=1"]
+        if video['fps']:
+            filters.append(f"fps={video['fps']}")
+        args += ['-vf', ','.join(filters)] + video_encoder_args(video, profile)
+        if crf:
+            # without rate control vpx and aom fall back to a low default bitrate
+            args += quality_args(VIDEO_ENCODERS[video['codec']], crf)
+    if audio and entry['audio'] and dict(entry['audio'], time_base=None) == dict(audio, time_base=None):
+        args += ['-c:a', 'copy']
+    elif audio:
+        args += ['-c:a', AUDIO_ENCODERS[audio['codec']]]
+        if audio['sample_rate']:
+            args += ['-ar', str(audio['sample_rate'])]
+        if audio['channels']:
+            args += ['-ac', str(audio['channels'])]
+    if video and video['time_base'] and plan['part_format'] == 'mp4':
+        args += ['-video_track_timescale', video['time_base'].partition('/')[2]]
+    return args + ['-threads', str(threads), output]
+
+
+class ConcatJob(FFmpegJobGroup):
+    def __init__(self, ffmpeg_path, plan, output, on_progress=None, workers=None, profile=None, crf=None):
+        super().__init__(ffmpeg_path, on_progress)
+        self.plan = plan
+        self.output = output
+        self.profile = profile
+        self.crf = crf
+        cpus = os.cpu_count() or 4
+        self.workers = workers or max(1, min(4, cpus // 2))
+        self.threads = max(1, cpus // self.workers)
+
+    def run(self):
+        to_transcode = [entry for entry in self.plan['entries'] if entry['action'] == 'transcode']
+        transcode_total = sum(entry['duration'] for entry in to_transcode)
+        self.total_work = transcode_total + self.plan['duration'] * CONCAT_WEIGHT
+        work_dir = tempfile.mkdtemp(prefix='.merge_', dir=os.path.dirname(os.path.abspath(self.output)))
+        try:
+            replacements = {}
+            if to_transcode:
+                with ThreadPoolExecutor(max_workers=min(self.workers, len(to_transcode))) as pool:
+                    futures = {pool.submit(self._transcode, index, entry, work_dir): entry
+                               for index, entry in enumerate(to_transcode)}
+                    try:
+                        for future, entry in futures.items():
+                            replacements[entry['path']] = future.result()
+                    except Exception:
+                        self.cancel()
+                        raise
+
+            list_file = write_concat_list(os.path.join(work_dir, 'concat.txt'),
+                                          [replacements.get(entry['path'], entry['path'])
+                                           for entry in self.plan['entries']])
+            maps = []
+            if self.plan['video']:
+                maps += ['-map', '0:v:0']
+            if self.plan['audio']:
+                maps += ['-map', '0:a:0']
+            self.run_job(['-f', 'concat', '-safe', '0', '-i', list_file] + maps + ['-c', 'copy', self.output],
+                         self.plan['duration'], self.output, 'concat', CONCAT_WEIGHT)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _transcode(self, index, entry, work_dir):
+        output = os.path.join(work_dir, f"part_{index:04d}.{self.plan['part_format']}")
+        args = transcode_args(entry, self.plan, output, self.threads, self.profile, self.crf)
+        return self.run_job(args, entry['duration'], output, index)
@@ -0,0 +1,111 @@
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from metadata_cache import canonical_url
+
+YOUTUBE_HOSTS = ('youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com')
+YOUTUBE_WATCH = 'https://youtube.com/watch?v='
+
+
+def canonical_media_url(url):
+    parsed = urlparse(canonical_url(url))
+    host = parsed.netloc
+    query = dict(parse_qsl(parsed.query, keep_blank_values=True))
+    if host == 'youtu.be' and parsed.path.strip('/'):
+        return YOUTUBE_WATCH + parsed.path.strip('/').split('/')[0]
+    if host not in YOUTUBE_HOSTS:
+        return urlunparse(parsed)
+    parts = parsed.path.split('/')
+    if len(parts) > 2 and parts[1] in ('shorts', 'live', 'embed') and parts[2]:
+        return YOUTUBE_WATCH + parts[2]
+    # only v names the video, t, list, index and the like are where playback starts and where the link came from
+    if parsed.path == '/watch' and query.get('v'):
+        return YOUTUBE_WATCH + query['v']
+    return urlunparse(('https', 'youtube.com', parsed.path, '', urlencode(sorted(query.items())), ''))
+
+
+def media_id(url):
+    # cheap enough for every enqueue: hosts whose links are normalised above give their id, any other link is its
+    # own identity until resolve_media_id has run
+    url = canonical_media_url(url)
+    if url.startswith(YOUTUBE_WATCH):
+        return 'youtube', url[len(YOUTUBE_WATCH):]
+    return 'url', url
+
+
+def resolve_media_id(url):
+    return _extractor_media_id(canonical_media_url(url))
+
+
+@lru_cache(maxsize=4096)
+def _extractor_media_id(url):
+    # the way yt-dlp checks its own archive before extracting; every extractor is imported and tried in turn,
+    # so this belongs on a worker thread
+    from yt_dlp.extractor import gen_extractor_classes
+
+    for ie in gen_extractor_classes():
+        if ie.ie_key() != 'Generic' and ie.suitable(url):
+            video_id = ie.get_temp_id(url)
+            if video_id:
+                return ie.ie_key().lower(), video_id
+            break
+    # no extractor claims it, the link itself is the identity
+    return 'url', url
+
+
+def archive_key(extractor, video_id, profile):
+    raw = f"{extractor}\0{video_id}\0{profile}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class DownloadArchive:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                path TEXT,
+                timestamp TEXT NOT NULL
+            )
+        """)
+        # the whole index is kept in memory, a lookup at enqueue never touches the disk
+        self.entries = {row[0]: {'url': row[1], 'path': row[2]}
+                        for row in self.conn.execute("SELECT key, url, path FROM archive")}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        return dict(entry) if entry else None
+
+    def add(self, keys, url, path):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            for key in keys:
+                self.entries[key] = {'url': url, 'path': path}
+                self.conn.execute("INSERT OR REPLACE INTO archive (key, url, path, timestamp) VALUES (?, ?, ?, ?)",
+                                  (key, url, path, timestamp))
+
+    def discard(self, key):
+        with self.lock, self.conn:
+            self.entries.pop(key, None)
+            self.conn.execute("DELETE FROM archive WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.entries.clear()
+            self.conn.execute("DELETE FROM archive")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,1809 @@
+import os
+import sys
+import platform
+import atexit
+import copy
+import json
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+import shutil
+import tempfile
+from collections import Counter, deque, OrderedDict
+from datetime import datetime
+from urllib.parse import urlparse
+
+from autotune import HostTuner, DEFAULT_FRAGMENTS, DEFAULT_CHUNK_SIZE
+from batch_tools import batch_workers, tool_job_factory
+from download_archive import DownloadArchive, archive_key, media_id, resolve_media_id
+from encoder_probe import EncoderCapabilities, CANDIDATES, HARDWARE_WORKERS, is_hardware
+from media_probe import MediaProbe
+from metadata_cache import MetadataCache
+from pipeline import Stage
+from ffmpeg_jobs import FFmpegError
+from format_planner import AUDIO_CODEC_NAMES, AUDIO_TARGET_CODECS, codec_name, plan_audio, plan_video
+from stream_transcode import StreamTranscode, StreamUnsupported
+from throughput import ThroughputTracker
+from ydl_pool import YoutubeDLPool
+
+if getattr(sys, 'frozen', False):
+    BASE_DIR = sys._MEIPASS
+    ffmpeg_dir = os.path.join(BASE_DIR, 'ffmpeg', 'bin')
+else:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    ffmpeg_dir = os.path.join(BASE_DIR, 'ffmpeg', 'bin')
+
+bundled_ffmpeg_path = os.path.join(ffmpeg_dir, 'ffmpeg.exe' if platform.system() == "Windows" else 'ffmpeg')
+if os.path.isfile(bundled_ffmpeg_path):
+    ffmpeg_path = bundled_ffmpeg_path
+    os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ['PATH']
+else:
+    ffmpeg_path = shutil.which('ffmpeg')
+
+bundled_ffprobe_path = os.path.join(ffmpeg_dir, 'ffprobe.exe' if platform.system() == "Windows" else 'ffprobe')
+ffprobe_path = bundled_ffprobe_path if os.path.isfile(bundled_ffprobe_path) else shutil.which('ffprobe')
+
+if getattr(sys, 'frozen', False):
+    if platform.system() == "Windows":
+        app_data_dir = os.path.join(os.getenv('APPDATA'), 'EnhancedYouTubeDownloader')
+    else:
+        app_data_dir = os.path.join(os.path.expanduser('~'), '.EnhancedYouTubeDownloader')
+
+    os.makedirs(app_data_dir, exist_ok=True)
+    HISTORY_FILE = os.path.join(app_data_dir, 'download_history.json')
+    HISTORY_DB_FILE = os.path.join(app_data_dir, 'download_history.db')
+    ARCHIVE_DB_FILE = os.path.join(app_data_dir, 'download_archive.db')
+    QUEUE_FILE = os.path.join(app_data_dir, 'download_queue.json')
+    QUEUE_JOURNAL_FILE = os.path.join(app_data_dir, 'download_queue.journal')
+    HEADLESS_QUEUE_JOURNAL_FILE = os.path.join(app_data_dir, 'headless_queue.journal')
+    QUEUE_CHECKPOINT_FILE = os.path.join(app_data_dir, 'download_queue.checkpoints')
+    HEADLESS_QUEUE_CHECKPOINT_FILE = os.path.join(app_data_dir, 'headless_queue.checkpoints')
+    HOST_TUNING_FILE = os.path.join(app_data_dir, 'host_tuning.json')
+    ENCODER_CAPABILITIES_FILE = os.path.join(app_data_dir, 'encoder_capabilities.json')
+    SETTINGS_FILE = os.path.join(app_data_dir, 'settings.json')
+    METADATA_CACHE_DIR = os.path.join(app_data_dir, 'cache', 'metadata')
+    MEDIA_PROBE_CACHE_DIR = os.path.join(app_data_dir, 'cache', 'probe')
+else:
+    HISTORY_FILE = os.path.join(BASE_DIR, 'download_history.json')
+    HISTORY_DB_FILE = os.path.join(BASE_DIR, 'download_history.db')
+    ARCHIVE_DB_FILE = os.path.join(BASE_DIR, 'download_archive.db')
+    QUEUE_FILE = os.path.join(BASE_DIR, 'download_queue.json')
+    QUEUE_JOURNAL_FILE = os.path.join(BASE_DIR, 'download_queue.journal')
+    HEADLESS_QUEUE_JOURNAL_FILE = os.path.join(BASE_DIR, 'headless_queue.journal')
+    QUEUE_CHECKPOINT_FILE = os.path.join(BASE_DIR, 'download_queue.checkpoints')
+    HEADLESS_QUEUE_CHECKPOINT_FILE = os.path.join(BASE_DIR, 'headless_queue.checkpoints')
+    HOST_TUNING_FILE = os.path.join(BASE_DIR, 'host_tuning.json')
+    ENCODER_CAPABILITIES_FILE = os.path.join(BASE_DIR, 'encoder_capabilities.json')
+    SETTINGS_FILE = os.path.join(BASE_DIR, 'settings.json')
+    METADATA_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'metadata')
+    MEDIA_PROBE_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'probe')
+
+FILENAME_TEMPLATES = [
+    "%(title)s.%(ext)s",
+    "%(uploader)s - %(title)s.%(ext)s",
+    "%(uploader)s_%(title)s.%(ext)s",
+    "%(title)s [%(id)s].%(ext)s",
+    "%(upload_date)s - %(title)s.%(ext)s",
+    "%(uploader)s/%(title)s.%(ext)s"
+]
+
+DEFAULT_SETTINGS = {
+    'theme': 'dark',
+    'auto_update': True,
+    'check_space': True,
+    'min_space_gb': 1,
+    'default_format': 'mp4',
+    'default_quality': 'best',
+    'default_save_path': os.getcwd(),
+    'default_threads': os.cpu_count() or 4,
+    'notifications': True,
+    'hardware_accel': 'auto',
+    'filename_template': '%(title)s.%(ext)s',
+    'default_language': 'en',
+    'max_concurrent_downloads': 3,
+    'per_host_limit': 2,
+    'history_max_entries': 0,
+    'history_retention_days': 0,
+    'metadata_cache_ttl_hours': 24,
+    'ydl_pool_size': 4,
+    'autotune_downloads': True,
+    'parallel_convert': True,
+    'extract_workers': 2,
+    'postprocess_workers': 1,
+    'encoding_profile': 'balanced',
+    'smart_trim': True,
+    'stream_transcode': False,
+    'skip_downloaded': True
+}
+
+
+class AppSettings:
+    def __init__(self):
+        self.settings = DEFAULT_SETTINGS.copy()
+        self.load_settings()
+
+    def load_settings(self):
+        try:
+            if os.path.exists(SETTINGS_FILE):
+                with open(SETTINGS_FILE, 'r') as f:
+                    loaded_settings = json.load(f)
+                    for key in self.settings:
+                        if key in loaded_settings:
+                            self.settings[key] = loaded_settings[key]
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+
+    def save_settings(self):
+        try:
+            with open(SETTINGS_FILE, 'w') as f:
+                json.dump(self.settings, f, indent=2)
+        except Exception as e:
+            print(f"Error saving settings: {e}")
+
+    def get(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def set(self, key, value):
+        self.settings[key] = value
+        self.save_settings()
+
+
+class HistoryStore:
+    COLUMNS = ('url', 'media_type', 'quality', 'codec', 'save_path', 'threads', 'advanced_options', 'timestamp')
+    VACUUM_AFTER_DELETES = 1000
+
+    def __init__(self, path, legacy_json=None):
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                media_type TEXT,
+                quality TEXT,
+                codec TEXT,
+                save_path TEXT,
+                threads INTEGER,
+                advanced_options TEXT,
+                timestamp TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_downloads_url ON downloads(url);
+            CREATE INDEX IF NOT EXISTS idx_downloads_timestamp ON downloads(timestamp);
+            CREATE INDEX IF NOT EXISTS idx_downloads_media_type ON downloads(media_type);
+        """)
+        if legacy_json:
+            self.migrate_json(legacy_json)
+
+    @staticmethod
+    def _to_row(entry):
+        return (
+            entry.get('url', ''),
+            entry.get('media_type', ''),
+            entry.get('quality', ''),
+            entry.get('codec') or '',
+            entry.get('save_path', ''),
+            entry.get('threads') or 4,
+            json.dumps(entry.get('advanced_options') or {}),
+            entry.get('timestamp') or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+    @staticmethod
+    def _to_entry(row):
+        entry = dict(row)
+        try:
+            entry['advanced_options'] = json.loads(entry.get('advanced_options') or '{}')
+        except ValueError:
+            entry['advanced_options'] = {}
+        return entry
+
+    def migrate_json(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    f"INSERT INTO downloads ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                    [self._to_row(entry) for entry in entries]
+                )
+            os.replace(path, path + '.migrated')
+        except Exception as e:
+            print(f"Error migrating history: {e}")
+
+    def add(self, entry):
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                f"INSERT INTO downloads ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                self._to_row(entry)
+            )
+            entry_id = cursor.lastrowid
+        entry = dict(entry, id=entry_id)
+        for listener in self.listeners:
+            listener(entry)
+        return entry_id
+
+    @staticmethod
+    def _where(media_type=None, before_id=None):
+        clauses = []
+        params = []
+        if media_type:
+            clauses.append("media_type = ?")
+            params.append(media_type)
+        if before_id is not None:
+            clauses.append("id <= ?")
+            params.append(before_id)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def max_id(self):
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(id) FROM downloads").fetchone()
+        return row[0] or 0
+
+    def count(self, media_type=None, before_id=None):
+        where, params = self._where(media_type, before_id)
+        with self.lock:
+            row = self.conn.execute("SELECT COUNT(*) FROM downloads" + where, params).fetchone()
+        return row[0]
+
+    def page(self, offset=0, limit=100, media_type=None, before_id=None):
+        where, params = self._where(media_type, before_id)
+        query = "SELECT * FROM downloads" + where
+        query += " ORDER BY id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def get(self, entry_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM downloads WHERE id = ?", (entry_id,)).fetchone()
+        return self._to_entry(row) if row else None
+
+    def find_by_url(self, url, limit=20):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM downloads WHERE url = ? ORDER BY id DESC LIMIT ?", (url, limit)
+            ).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM downloads")
+        self.compact()
+
+    def apply_retention(self, max_entries=0, max_age_days=0):
+        deleted = 0
+        with self.lock, self.conn:
+            if max_age_days:
+                cutoff = datetime.fromtimestamp(time.time() - max_age_days * 86400).strftime("%Y-%m-%d %H:%M:%S")
+                deleted += self.conn.execute("DELETE FROM downloads WHERE timestamp < ?", (cutoff,)).rowcount
+            if max_entries:
+                deleted += self.conn.execute(
+                    "DELETE FROM downloads WHERE id <= "
+                    "(SELECT id FROM downloads ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (max_entries,)
+                ).rowcount
+        if deleted >= self.VACUUM_AFTER_DELETES:
+            self.compact()
+        return deleted
+
+    def compact(self):
+        with self.lock:
+            self.conn.execute("VACUUM")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class QueueJournal:
+    COMPACT_MIN_RECORDS = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self.file = None
+
+    def replay(self):
+        tasks = OrderedDict()
+        in_flight = []
+        if not os.path.exists(self.path):
+            return []
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn tail from a kill mid-write, everything before it is intact
+                    break
+                op = record.get('op')
+                task_id = record.get('id')
+                if op == 'enqueue':
+                    tasks[task_id] = record['task']
+                elif op == 'dequeue' and task_id in tasks:
+                    in_flight.append(task_id)
+                elif op == 'requeue' and task_id in tasks:
+                    if task_id in in_flight:
+                        in_flight.remove(task_id)
+                    tasks.move_to_end(task_id, last=False)
+                elif op == 'complete':
+                    tasks.pop(task_id, None)
+                    if task_id in in_flight:
+                        in_flight.remove(task_id)
+                elif op == 'clear':
+                    tasks = OrderedDict((i, tasks[i]) for i in in_flight if i in tasks)
+
+        # tasks that were running when the app died go back to the front
+        ordered = [tasks[i] for i in in_flight if i in tasks]
+        ordered += [task for task_id, task in tasks.items() if task_id not in in_flight]
+        return ordered
+
+    def append(self, op, task_id=None, task=None):
+        record = {'op': op}
+        if task_id is not None:
+            record['id'] = task_id
+        if task is not None:
+            record['task'] = task
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.records += 1
+
+    def needs_compaction(self, live_tasks):
+        return self.records > max(self.COMPACT_MIN_RECORDS, 2 * live_tasks)
+
+    def compact(self, active_tasks, pending_tasks):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for task in list(active_tasks) + list(pending_tasks):
+                f.write(json.dumps({'op': 'enqueue', 'id': task['id'], 'task': task}) + '\n')
+            for task in active_tasks:
+                f.write(json.dumps({'op': 'dequeue', 'id': task['id']}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.close()
+        os.replace(temp_path, self.path)
+        self.records = 2 * len(active_tasks) + len(pending_tasks)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class CheckpointStore:
+    FLUSH_INTERVAL = 2.0
+    FILE_FIELDS = ('tmpfilename', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate',
+                   'fragment_index', 'fragment_count')
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.checkpoints = {}
+        self.dirty = False
+        self.last_flush = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.checkpoints = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading download checkpoints: {e}")
+            self.checkpoints = {}
+
+    def get(self, task_id):
+        with self.lock:
+            return copy.deepcopy(self.checkpoints.get(task_id))
+
+    def progress(self, task_id):
+        with self.lock:
+            checkpoint = self.checkpoints.get(task_id)
+            if not checkpoint:
+                return None
+            downloaded = total = 0
+            for state in checkpoint['files'].values():
+                downloaded += state.get('downloaded_bytes', 0)
+                total += state.get('total_bytes') or state.get('total_bytes_estimate') or 0
+            return int(downloaded / total * 100) if total else None
+
+    def update(self, task_id, data):
+        filename = data.get('filename')
+        if not filename:
+            return
+        info = data.get('info_dict') or {}
+        # merged downloads report each part separately, pin the combined selection
+        requested = info.get('requested_formats')
+        format_id = '+'.join(f['format_id'] for f in requested) if requested else info.get('format_id')
+
+        with self.lock:
+            checkpoint = self.checkpoints.setdefault(task_id, {'files': {}})
+            if format_id:
+                checkpoint['format_id'] = format_id
+            state = checkpoint['files'].setdefault(filename, {})
+            state.update((key, data[key]) for key in self.FILE_FIELDS if data.get(key) is not None)
+            if data.get('status') == 'finished':
+                state['finished'] = True
+            checkpoint['updated'] = time.time()
+            self.dirty = True
+            due = time.time() - self.last_flush >= self.FLUSH_INTERVAL
+
+        if due:
+            self.flush()
+
+    def discard(self, task_ids):
+        with self.lock:
+            for task_id in task_ids:
+                if self.checkpoints.pop(task_id, None) is not None:
+                    self.dirty = True
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            temp_path = self.path + '.tmp'
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.checkpoints, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self.dirty = False
+            except OSError as e:
+                print(f"Error saving download checkpoints: {e}")
+            self.last_flush = time.time()
+
+
+# finished downloads allowed to wait for a conversion slot before the download workers hold off
+POSTPROCESS_BACKLOG = 2
+EXTRACT_BACKLOG = 32
+# extra attempts a failed playlist entry gets at the back of the queue
+ENTRY_RETRIES = 2
+PLAYLIST_ENTRY_LABELS = {'error': 'failed'}
+DUPLICATE_MESSAGES = {
+    'queued': "already in the queue",
+    'downloaded': "already downloaded to {path}",
+    'linked': "already downloaded, linked to {path}",
+}
+
+
+class DownloadQueue:
+    def __init__(self, max_workers=1, per_host_limit=1, journal_path=QUEUE_JOURNAL_FILE,
+                 checkpoint_path=QUEUE_CHECKPOINT_FILE, postprocess_workers=1):
+        self.pending = deque()
+        self.lock = threading.Condition()
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        # 0 converts inside the download slot, like a plain yt-dlp run
+        self.postprocess_workers = max(0, int(postprocess_workers))
+        self.postprocess_stage = Stage('postprocess', self.run_postprocess, max(1, self.postprocess_workers),
+                                       capacity=POSTPROCESS_BACKLOG)
+        self.active = {}
+        self.processing = OrderedDict()
+        self.prefetched = set()
+        self.download_stats = {'done': 0, 'failed': 0, 'busy_time': 0.0}
+        # playlist task id -> title and the status of each entry task
+        self.groups = OrderedDict()
+        self.failed = OrderedDict()
+        # archive key -> id of the task that fetches it, so the same media is never queued twice
+        self.queued = {}
+        self.workers = {}
+        self.host_counts = {}
+        self.paused = False
+        self.stop_flag = False
+        self.threads = []
+        self.running_workers = 0
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.stats = {'done': 0, 'error': 0, 'cancelled': 0}
+        self.journal = QueueJournal(journal_path)
+        self.checkpoints = CheckpointStore(checkpoint_path)
+        self.load_queue()
+        # daemon workers die without unwinding, keep whatever progress they reported last
+        atexit.register(self.checkpoints.flush)
+
+    @staticmethod
+    def task_host(task):
+        host = urlparse(task.get('url', '')).hostname or ''
+        return host[4:] if host.startswith('www.') else host
+
+    def set_limits(self, max_workers=None, per_host_limit=None, postprocess_workers=None):
+        with self.lock:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if per_host_limit is not None:
+                self.per_host_limit = max(1, int(per_host_limit))
+            if postprocess_workers is not None:
+                self.postprocess_workers = max(0, int(postprocess_workers))
+            self.lock.notify_all()
+        if postprocess_workers is not None:
+            self.postprocess_stage.set_workers(max(1, self.postprocess_workers))
+
+    @property
+    def pipelined(self):
+        return self.postprocess_workers > 0
+
+    def add_task(self, task):
+        # None once queued, otherwise (status, path) of the copy that makes it unnecessary
+        task.setdefault('id', uuid.uuid4().hex)
+        duplicate = check_archive(task)
+        if duplicate:
+            return duplicate
+        with self.lock:
+            if task.get('archive_key') in self.queued and not task.get('force'):
+                return 'queued', None
+            self.track(task)
+            self.pending.append(task)
+            self.save_queue('enqueue', task['id'], task)
+            self.lock.notify_all()
+        return None
+
+    def track(self, task):
+        if task.get('archive_key'):
+            self.queued[task['archive_key']] = task['id']
+
+    def untrack(self, task):
+        if task.get('archive_key') and self.queued.get(task['archive_key']) == task['id']:
+            del self.queued[task['archive_key']]
+
+    def get_task(self, worker_id):
+        with self.lock:
+            while not self.stop_flag:
+                if not self.pending:
+                    # a playlist that is being expanded is about to queue its entries
+                    if not any(expands_playlist(task) for task in self.active.values()):
+                        return None
+                    self.lock.wait(timeout=1)
+                    continue
+                for index, task in enumerate(self.pending):
+                    host = self.task_host(task)
+                    if self.host_counts.get(host, 0) < self.per_host_limit:
+                        del self.pending[index]
+                        self.active[worker_id] = task
+                        self.host_counts[host] = self.host_counts.get(host, 0) + 1
+                        self.mark_entry(task, 'downloading')
+                        self.save_queue('dequeue', task['id'])
+                        self.prefetch_ahead()
+                        return task
+                # every pending task belongs to a host that is already at its cap
+                self.lock.wait(timeout=1)
+            return None
+
+    def prefetch_ahead(self):
+        # metadata for the next tasks is extracted while the current ones download
+        for task in list(self.pending)[:self.max_workers]:
+            if expands_playlist(task):
+                continue
+            if task['id'] not in self.prefetched:
+                if not prefetch_metadata(task['url'], task.get('advanced_options')):
+                    break
+                self.prefetched.add(task['id'])
+
+    def release_worker(self, worker_id):
+        task = self.active.pop(worker_id, None)
+        if task is not None:
+            host = self.task_host(task)
+            self.host_counts[host] = max(0, self.host_counts.get(host, 0) - 1)
+        return task
+
+    def task_done(self, worker_id, requeue=False):
+        with self.lock:
+            task = self.release_worker(worker_id)
+            self.finish_task(task, requeue)
+
+    def finish_task(self, task, requeue=False):
+        with self.lock:
+            if task is not None:
+                self.processing.pop(task['id'], None)
+                self.prefetched.discard(task['id'])
+                if requeue:
+                    self.pending.appendleft(task)
+                else:
+                    self.untrack(task)
+                self.save_queue('requeue' if requeue else 'complete', task['id'])
+            self.lock.notify_all()
+
+        if task is None:
+            return
+        if requeue:
+            self.checkpoints.flush()
+        else:
+            self.checkpoints.discard([task['id']])
+
+    def fan_out(self, worker_id, task, title, entries):
+        # the playlist task is replaced by one task per entry, queued where the playlist was
+        candidates = []
+        skipped = []
+        for index, entry in enumerate(entries, 1):
+            entry_task = dict(task, id=uuid.uuid4().hex, url=entry['url'], title=entry['title'],
+                              group=task['id'], group_title=title, playlist_index=index, attempts=0,
+                              advanced_options=dict(task.get('advanced_options') or {}, playlist=False))
+            duplicate = check_archive(entry_task)
+            if duplicate:
+                skipped.append(duplicate)
+            else:
+                candidates.append(entry_task)
+        tasks = []
+        with self.lock:
+            self.release_worker(worker_id)
+            # overlapping playlists, or a video listed twice in this one
+            for entry_task in candidates:
+                if entry_task['archive_key'] in self.queued and not task.get('force'):
+                    skipped.append(('queued', None))
+                    continue
+                self.track(entry_task)
+                tasks.append(entry_task)
+            if tasks:
+                self.groups[task['id']] = {'title': title, 'url': task['url'],
+                                           'entries': OrderedDict((entry['id'], 'queued') for entry in tasks)}
+            self.pending.extendleft(reversed(tasks))
+            self.prefetched.discard(task['id'])
+            for entry in tasks:
+                self.save_queue('enqueue', entry['id'], entry)
+            for entry in reversed(tasks):
+                self.save_queue('requeue', entry['id'])
+            self.save_queue('complete', task['id'])
+            self.prefetch_ahead()
+            self.lock.notify_all()
+        self.checkpoints.discard([task['id']])
+        return tasks, skipped
+
+    def mark_entry(self, task, status):
+        group = self.groups.get(task.get('group'))
+        if group is not None:
+            group['entries'][task['id']] = status
+
+    def record_result(self, task, status):
+        with self.lock:
+            self.stats[status] += 1
+            if task is None:
+                return
+            # a cancelled task went back to the queue
+            self.mark_entry(task, 'queued' if status == 'cancelled' else status)
+            if status == 'error':
+                self.failed[task['id']] = task
+
+    def retry_entry(self, worker_id, task):
+        # a failed playlist entry gets another go at the back of the queue, the rest of the playlist carries on
+        with self.lock:
+            if not task.get('group') or task.get('attempts', 0) >= ENTRY_RETRIES or self.stop_flag:
+                return False
+            self.release_worker(worker_id)
+            task['attempts'] = task.get('attempts', 0) + 1
+            self.pending.append(task)
+            self.mark_entry(task, 'retrying')
+            self.save_queue('complete', task['id'])
+            self.save_queue('enqueue', task['id'], task)
+            self.lock.notify_all()
+        self.checkpoints.flush()
+        return True
+
+    def retry_failed(self):
+        with self.lock:
+            tasks = list(self.failed.values())
+            self.failed.clear()
+            for task in tasks:
+                task['attempts'] = 0
+                self.track(task)
+                self.pending.append(task)
+                self.mark_entry(task, 'queued')
+                self.save_queue('enqueue', task['id'], task)
+            self.lock.notify_all()
+        return len(tasks)
+
+    def playlist_groups(self):
+        with self.lock:
+            return [dict(group, entries=dict(group['entries'])) for group in self.groups.values()]
+
+    def hand_off(self, worker_id, postprocess, on_finished=None):
+        # the download slot and the site's connection are free again, the task stays in flight until converted
+        with self.lock:
+            task = self.release_worker(worker_id)
+            self.processing[task['id']] = {'task': task, 'status': 'queued'}
+            self.mark_entry(task, 'converting')
+            self.lock.notify_all()
+        # blocks while the backlog is full, so downloads can't run arbitrarily far ahead of the encoders
+        self.postprocess_stage.submit((task, postprocess, on_finished))
+
+    def run_postprocess(self, item):
+        task, postprocess, on_finished = item
+        with self.lock:
+            self.processing[task['id']]['status'] = 'processing'
+        success = False
+        if not self.stop_flag:
+            try:
+                success = postprocess()
+            except Exception as e:
+                print(f"Error post-processing {task.get('url', '')}: {e}")
+        # stopped before its turn: back to the queue, the downloaded file is picked up again next time
+        cancelled = self.stop_flag and not success
+        status = 'done' if success else 'cancelled' if cancelled else 'error'
+        self.finish_task(task, requeue=cancelled)
+        self.record_result(task, status)
+        if on_finished:
+            on_finished()
+        return success
+
+    def record_download(self, success, elapsed):
+        with self.lock:
+            self.download_stats['done' if success else 'failed'] += 1
+            self.download_stats['busy_time'] += elapsed
+
+    def processing_tasks(self):
+        with self.lock:
+            return [dict(entry) for entry in self.processing.values()]
+
+    def stage_metrics(self):
+        with self.lock:
+            download = dict(self.download_stats, name='download', workers=self.max_workers,
+                            active=len(self.active), queued=len(self.pending), dropped=0,
+                            blocked_time=0.0)
+        postprocess = dict(self.postprocess_stage.snapshot(), workers=self.postprocess_workers)
+        return [extract_stage.snapshot(), download, postprocess]
+
+    def has_tasks(self):
+        with self.lock:
+            return bool(self.pending or self.active or self.processing)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.workers), list(self.pending)
+
+    def record_progress(self, worker_id, data):
+        task = self.active.get(worker_id)
+        if task is None:
+            return
+        status = data.get('status')
+        if status in ('downloading', 'finished'):
+            self.checkpoints.update(task['id'], data)
+
+        view = throughput_tracker.update(task['id'], data, label=task.get('url', ''))
+        if status == 'downloading':
+            update = {'speed': view['speed'], 'eta': view['eta']}
+            if view['percent'] is not None:
+                update['percent'] = view['percent']
+            self.set_worker_status(worker_id, **update)
+        elif status == 'finished':
+            self.set_worker_status(worker_id, status='processing', percent=100, eta=None)
+
+    def set_worker_status(self, worker_id, **status):
+        with self.lock:
+            self.workers.setdefault(worker_id, {'status': 'idle', 'percent': 0, 'task': None}).update(status)
+
+    def start_workers(self, target):
+        with self.lock:
+            self.stats = {'done': 0, 'error': 0, 'cancelled': 0}
+            self.download_stats = {'done': 0, 'failed': 0, 'busy_time': 0.0}
+            # playlists from earlier runs are only kept while some of their entries are left
+            for group_id, group in list(self.groups.items()):
+                if all(status in ('done', 'error') for status in group['entries'].values()):
+                    del self.groups[group_id]
+            self.workers.clear()
+            self.threads = []
+            for worker_id in range(self.max_workers):
+                self.workers[worker_id] = {'status': 'idle', 'percent': 0, 'task': None}
+                self.threads.append(threading.Thread(target=target, args=(self, worker_id), daemon=True))
+            self.running_workers = len(self.threads)
+        for thread in self.threads:
+            thread.start()
+        with self.lock:
+            self.prefetch_ahead()
+
+    def worker_finished(self):
+        with self.lock:
+            self.running_workers -= 1
+            return self.running_workers
+
+    def is_running(self):
+        return any(t.is_alive() for t in self.threads)
+
+    def clear_queue(self):
+        with self.lock:
+            task_ids = [task['id'] for task in self.pending]
+            for task in self.pending:
+                self.untrack(task)
+                group = self.groups.get(task.get('group'))
+                if group is not None:
+                    group['entries'].pop(task['id'], None)
+                    if not group['entries']:
+                        del self.groups[task['group']]
+            self.pending.clear()
+            self.failed.clear()
+            self.prefetched.difference_update(task_ids)
+            self.save_queue('clear')
+            self.lock.notify_all()
+        self.checkpoints.discard(task_ids)
+
+    def wait_if_paused(self):
+        self.resume_event.wait()
+
+    def control_hook(self, d):
+        if self.paused:
+            self.resume_event.wait()
+        if self.stop_flag:
+            import yt_dlp
+
+            raise yt_dlp.utils.DownloadCancelled()
+
+    def pause(self):
+        self.paused = True
+        self.resume_event.clear()
+
+    def resume(self):
+        self.paused = False
+        self.resume_event.set()
+
+    def stop(self):
+        self.stop_flag = True
+        self.resume()
+        with self.lock:
+            self.lock.notify_all()
+
+    def shutdown(self, timeout=None):
+        self.stop()
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(0, deadline - time.time()))
+        self.checkpoints.flush()
+        self.journal.close()
+
+    def save_queue(self, op, task_id=None, task=None):
+        try:
+            self.journal.append(op, task_id, task)
+            in_flight = list(self.active.values()) + [entry['task'] for entry in self.processing.values()]
+            if self.journal.needs_compaction(len(self.pending) + len(in_flight)):
+                self.journal.compact(in_flight, self.pending)
+        except Exception as e:
+            print(f"Error saving queue: {e}")
+
+    def load_queue(self):
+        try:
+            tasks = self.journal.replay()
+            if not tasks and os.path.exists(QUEUE_FILE):
+                with open(QUEUE_FILE, 'r') as f:
+                    tasks = json.load(f)
+            for task in tasks:
+                task.setdefault('id', uuid.uuid4().hex)
+                self.pending.append(task)
+                self.track(task)
+                if task.get('group'):
+                    group = self.groups.setdefault(task['group'], {'title': task.get('group_title', ''),
+                                                                   'url': '', 'entries': OrderedDict()})
+                    group['entries'][task['id']] = 'queued'
+            # rewrite once on startup so appends never land after a torn record
+            self.journal.compact([], self.pending)
+            if os.path.exists(QUEUE_FILE):
+                os.remove(QUEUE_FILE)
+        except Exception as e:
+            print(f"Error loading queue: {e}")
+
+
+def optimize_process_priority():
+    try:
+        if platform.system() == "Windows":
+            import psutil
+
+            p = psutil.Process(os.getpid())
+            p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            from ctypes import windll
+            windll.kernel32.SetPriorityClass(p.pid, 0x00004000)
+        else:
+            os.nice(10)
+            os.system("renice -n 10 -p $$")
+    except Exception:
+        pass
+
+
+
+def update_yt_dlp():
+    try:
+        import yt_dlp
+        from packaging import version
+
+        current_version = version.parse(yt_dlp.version.__version__)
+        latest_version = version.parse(subprocess.check_output(
+            [sys.executable, "-m", "yt_dlp", "--version"],
+            stderr=subprocess.PIPE, text=True).strip())
+
+        if latest_version > current_version:
+            subprocess.run(
+                [sys.executable, "-m", "pip", "--disable-pip-version-check", "install", "--upgrade", "yt-dlp"],
+                check=True, capture_output=True)
+            return True
+    except Exception as e:
+        return False
+
+
+
+class YTDLPLogger:
+    def __init__(self, log_callback):
+        self.log_callback = log_callback
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def debug(self, msg):
+        # yt-dlp reports every retried request/fragment through to_screen
+        if msg.startswith('[download] Got error'):
+            with self._lock:
+                self.retries += 1
+
+    def warning(self, msg):
+        with self._lock:
+            self.log_callback(msg)
+
+    def error(self, msg):
+        with self._lock:
+            self.log_callback(f"❌ {msg}")
+
+
+class TransferMeter:
+    def __init__(self):
+        self.baseline = {}
+        self.fragment_counts = {}
+        self.downloaded = 0
+        self.elapsed = 0.0
+        self.fragmented = False
+
+    def hook(self, d):
+        filename = d.get('filename')
+        if d.get('status') == 'downloading':
+            # resumed .part files report the bytes from earlier sessions too
+            self.baseline.setdefault(filename, d.get('downloaded_bytes') or 0)
+            if d.get('fragment_count'):
+                self.fragmented = True
+                self.fragment_counts[filename] = d['fragment_count']
+        elif d.get('status') == 'finished' and d.get('elapsed'):
+            total = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+            self.downloaded += max(0, total - self.baseline.get(filename, 0))
+            self.elapsed += d['elapsed']
+
+    def requests(self, chunk_size):
+        if self.fragmented:
+            return sum(self.fragment_counts.values())
+        return max(1, self.downloaded // chunk_size)
+
+
+def format_tuning_report():
+    rows = host_tuner.report()
+    if not rows:
+        return "No downloads measured yet."
+    lines = [f"{'Site':<28}{'Fragments':>10}{'Chunk':>10}{'Speed':>14}{'Errors':>8}{'Samples':>9}"]
+    for row in rows:
+        lines.append(f"{row['host'][:27]:<28}{row['fragments']:>10}{row['chunk_size'] // 1024:>8}KB"
+                     f"{format_speed(row['speed']):>14}{row['error_rate'] * 100:>7.1f}%{row['samples']:>9}")
+    return "\n".join(lines)
+
+
+def save_to_history(url, media_type, quality, codec, save_path, threads, advanced_options):
+    try:
+        entry = {
+            'url': url,
+            'media_type': media_type,
+            'quality': quality,
+            'codec': codec if codec else '',
+            'save_path': save_path,
+            'threads': threads if threads else 4,
+            'advanced_options': advanced_options if advanced_options else {},
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+        history_store.add(entry)
+        history_store.apply_retention(
+            app_settings.get('history_max_entries', 0),
+            app_settings.get('history_retention_days', 0)
+        )
+
+    except Exception as e:
+        print(f"Error saving history: {e}")
+
+
+def get_cookies_from_file(file_path):
+    try:
+        with open(file_path, 'r') as f:
+            lines = f.readlines()
+            if not lines:
+                return None
+
+        temp_dir = tempfile.mkdtemp()
+        cookies_file = os.path.join(temp_dir, 'cookies.txt')
+        shutil.copyfile(file_path, cookies_file)
+        return cookies_file
+    except Exception as e:
+        print(f"Error processing cookies file: {e}")
+        return None
+
+
+def check_disk_space(path, min_space_gb=1):
+    try:
+        usage = shutil.disk_usage(path)
+        free_space_gb = usage.free / (1024 ** 3)
+        if free_space_gb < min_space_gb:
+            return False, free_space_gb
+        return True, free_space_gb
+    except Exception as e:
+        print(f"Error checking disk space: {e}")
+        return True, 0
+
+
+def get_hardware_acceleration_methods():
+    # only what the ffmpeg build decoded a test clip with, empty until the capability probe has run
+    return ['auto'] + encoder_capabilities.working_hwaccels()
+
+
+def probe_encoders(force=False):
+    try:
+        return encoder_capabilities.probe(force=force)
+    except Exception as e:
+        print(f"Error probing encoders: {e}")
+        return None
+
+
+def format_encoder_report():
+    matrix = encoder_capabilities.report()
+    if not matrix:
+        return "Encoders have not been tested yet."
+    lines = [f"{'Encoder':<22}{'Codec':<7}{'Type':<10}{'Speed':>10}  Result"]
+    for name, result in sorted(matrix['encoders'].items(), key=lambda item: (item[1]['codec'], item[0])):
+        speed = f"{result['fps']:.1f} fps" if result['fps'] else '-'
+        lines.append(f"{name:<22}{result['codec']:<7}{'hardware' if result['hardware'] else 'software':<10}"
+                     f"{speed:>10}  {'ok' if result['works'] else result['error']}")
+    lines.append("")
+    lines.append(f"{'Decoding':<22}Result")
+    for name, result in sorted(matrix['hwaccels'].items()):
+        lines.append(f"{name:<22}{'ok' if result['works'] else result['error']}")
+    if not matrix['hwaccels']:
+        lines.append("(none in this ffmpeg build)")
+    lines.append("")
+    lines.append("Selected: " + ", ".join(f"{codec} -> {encoder_capabilities.select(codec)}" for codec in CANDIDATES))
+    lines.append(f"Tested {datetime.fromtimestamp(matrix['probed_at']).strftime('%Y-%m-%d %H:%M')}")
+    return "\n".join(lines)
+
+
+def format_speed(speed):
+    if speed is None:
+        return "N/A"
+    speed = float(speed)
+    if speed > 1024 * 1024:
+        return f"{speed / (1024 * 1024):.2f} MB/s"
+    elif speed > 1024:
+        return f"{speed / 1024:.2f} KB/s"
+    else:
+        return f"{speed:.2f} B/s"
+
+
+EXTRACTOR_ARGS = {
+    'youtube': {
+        'player_skip': ['js'],
+        'player_client': ['android']
+    }
+}
+
+
+def build_extract_opts(advanced_options=None):
+    advanced_options = advanced_options or {}
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'socket_timeout': 15,
+        'noplaylist': not advanced_options.get('playlist', False),
+        'extractor_args': EXTRACTOR_ARGS
+    }
+    proxy = (advanced_options.get('proxy') or '').strip()
+    if proxy:
+        ydl_opts['proxy'] = proxy
+    cookies_file = advanced_options.get('cookies_file')
+    if cookies_file and os.path.exists(cookies_file):
+        ydl_opts['cookiefile'] = cookies_file
+    return ydl_opts
+
+
+def metadata_variant(ydl):
+    # extraction results differ with login state and with playlist expansion
+    return f"{'auth' if ydl.params.get('cookiefile') else 'anon'}|{'single' if ydl.params.get('noplaylist') else 'all'}"
+
+
+def extract_info_cached(ydl, url, need_formats=False):
+    variant = metadata_variant(ydl)
+    info = metadata_cache.get(url, need_formats=need_formats, variant=variant)
+    if info is not None:
+        return info, True
+
+    # unprocessed result, so the same dict can later be fed to process_ie_result
+    info = ydl.extract_info(url, download=False, process=False)
+    if info and info.get('_type', 'video') == 'video':
+        metadata_cache.put(url, ydl.sanitize_info(info), variant=variant)
+    return info, False
+
+
+def extract_metadata(item):
+    url, advanced_options = item
+    try:
+        with ydl_pool.acquire(build_extract_opts(advanced_options)) as ydl:
+            extract_info_cached(ydl, url, need_formats=True)
+    except Exception as e:
+        print(f"Error prefetching {url}: {e}")
+        return False
+
+
+def prefetch_metadata(url, advanced_options=None):
+    # best effort: with the backlog full, the download worker extracts the URL itself
+    return extract_stage.submit((url, advanced_options or {}), block=False)
+
+
+def expands_playlist(task):
+    return bool((task.get('advanced_options') or {}).get('playlist')) and not task.get('group')
+
+
+def expand_playlist(url, advanced_options=None):
+    # flat extraction only lists the entries, each one is resolved when its own task runs
+    ydl_opts = dict(build_extract_opts(dict(advanced_options or {}, playlist=True)), extract_flat='in_playlist')
+    with ydl_pool.acquire(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if not info or info.get('_type') not in ('playlist', 'multi_video'):
+        return None
+    entries = []
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        entry_url = entry.get('url')
+        # some extractors list bare ids that only their own extractor understands
+        if not entry_url or '://' not in entry_url:
+            entry_url = entry.get('webpage_url') or entry.get('original_url')
+        if entry_url:
+            entries.append({'url': entry_url, 'title': entry.get('title') or entry_url})
+    return info.get('title') or url, entries
+
+
+def format_profile(media_type, quality, codec=None, advanced_options=None):
+    # the same video in another format or quality is a different download
+    parts = [media_type or '', quality or 'best', codec or '']
+    if media_type in AUDIO_FORMATS:
+        parts.append(str((advanced_options or {}).get('audio_quality', '192')))
+    return '/'.join(parts)
+
+
+def task_profile(task):
+    return format_profile(task.get('media_type'), task.get('quality'), task.get('codec'), task.get('advanced_options'))
+
+
+def task_archive_key(task):
+    return archive_key(*media_id(task['url']), task_profile(task))
+
+
+def link_downloaded(path, save_path):
+    # a hard link costs neither space nor time, where there can't be one the file stays where it is
+    target = os.path.join(save_path, os.path.basename(path))
+    if os.path.exists(target):
+        return target
+    try:
+        os.makedirs(save_path, exist_ok=True)
+        os.link(path, target)
+    except OSError:
+        return None
+    return target
+
+
+def check_archive(task, resolve=False):
+    # ('downloaded' or 'linked', path) when the task's media is already on disk; playlists are checked per entry.
+    # resolve asks yt-dlp's extractors for the id as well, only done by a worker once the task is due
+    if expands_playlist(task):
+        return None
+    key = task.setdefault('archive_key', task_archive_key(task))
+    if task.get('force') or not app_settings.get('skip_downloaded', True):
+        return None
+    if resolve:
+        key = archive_key(*resolve_media_id(task['url']), task_profile(task))
+    entry = download_archive.get(key)
+    if entry is None:
+        return None
+    path = entry['path']
+    if not path or not os.path.exists(path):
+        # deleted since, so it is fetched again
+        download_archive.discard(key)
+        return None
+    if os.path.abspath(path).startswith(os.path.join(os.path.abspath(task['save_path']), '')):
+        return 'downloaded', path
+    linked = link_downloaded(path, task['save_path'])
+    return ('linked', linked) if linked else ('downloaded', path)
+
+
+def describe_duplicate(duplicate):
+    status, path = duplicate
+    return DUPLICATE_MESSAGES[status].format(path=path)
+
+
+def archive_download(url, media_type, quality, codec, advanced_options, info, path):
+    profile = format_profile(media_type, quality, codec, advanced_options)
+    keys = {archive_key(*media_id(url), profile), archive_key(*resolve_media_id(url), profile)}
+    # the extracted id as well, in case another link to the same video resolves the same way
+    if info.get('extractor_key') and info.get('id'):
+        keys.add(archive_key(info['extractor_key'].lower(), info['id'], profile))
+    download_archive.add(keys, url, path)
+
+
+def format_playlist_progress(group):
+    counts = Counter(group['entries'].values())
+    parts = [f"{counts['done']}/{len(group['entries'])} done"]
+    for status in ('downloading', 'converting', 'retrying', 'error'):
+        if counts[status]:
+            parts.append(f"{counts[status]} {PLAYLIST_ENTRY_LABELS.get(status, status)}")
+    return f"{group['title']}: {', '.join(parts)}"
+
+
+def format_pipeline_report(download_queue):
+    lines = [f"{'Stage':<13}{'Workers':>8}{'Active':>8}{'Queued':>8}{'Done':>7}{'Failed':>8}"
+             f"{'Busy':>10}{'Waited':>10}"]
+    for stage in download_queue.stage_metrics():
+        lines.append(f"{stage['name']:<13}{stage['workers']:>8}{stage['active']:>8}{stage['queued']:>8}"
+                     f"{stage['done']:>7}{stage['failed']:>8}{stage['busy_time']:>9.1f}s{stage['blocked_time']:>9.1f}s")
+    return "\n".join(lines)
+
+
+# speed keeps balanced's quality target and only takes a faster encoder preset (encoder_probe.PROFILE_ARGS):
+# the encode is quicker and the file bigger, the picture the same. size lowers the target to get smaller files
+ENCODING_PROFILES = {
+    'speed': {'crf': '23', 'audio_bitrate': None},
+    'balanced': {'crf': '23', 'audio_bitrate': None},
+    'size': {'crf': '27', 'audio_bitrate': '96k'},
+}
+LOSSY_AUDIO_CODECS = {'aac', 'libopus', 'libmp3lame', 'libvorbis'}
+AUDIO_FORMATS = ['mp3', 'ogg', 'wav', 'm4a', 'flac', 'aac']
+
+
+def optimize_conversion_settings(format_type, hw_accel='auto', profile='balanced'):
+    if profile not in ENCODING_PROFILES:
+        profile = 'balanced'
+    settings = {
+        'threads': os.cpu_count() or 4,
+        'profile': profile,
+        'crf': ENCODING_PROFILES[profile]['crf'],
+        'hwaccel': encoder_capabilities.decode_hwaccel(hw_accel)
+    }
+
+    if format_type in ['mp4', 'mkv', 'mov']:
+        settings.update({
+            'vcodec': encoder_capabilities.select('h264', hw_accel),
+            'acodec': 'aac',
+            'movflags': '+faststart'
+        })
+    elif format_type == 'webm':
+        settings.update({
+            'vcodec': encoder_capabilities.select('vp9', hw_accel),
+            'acodec': 'libopus'
+        })
+    elif format_type in AUDIO_FORMATS:
+        settings.update({
+            'acodec': {
+                'mp3': 'libmp3lame',
+                'ogg': 'libvorbis',
+                'wav': 'pcm_s16le',
+                'm4a': 'aac',
+                'flac': 'flac',
+                'aac': 'aac'
+            }.get(format_type, 'copy')
+        })
+        settings.pop('vcodec', None)
+        settings.pop('hwaccel', None)
+
+    if settings.get('acodec') in LOSSY_AUDIO_CODECS and ENCODING_PROFILES[profile]['audio_bitrate']:
+        settings['audio_bitrate'] = ENCODING_PROFILES[profile]['audio_bitrate']
+    return settings
+
+
+def encoding_profile(advanced_options=None):
+    return (advanced_options or {}).get('encoding_profile') or app_settings.get('encoding_profile', 'balanced')
+
+
+def conversion_args(format_type, hw_accel=None, profile=None):
+    if hw_accel is None:
+        hw_accel = app_settings.get('hardware_accel', 'auto')
+    settings = optimize_conversion_settings(format_type, hw_accel, profile or encoding_profile())
+    video_args, audio_args, output_args = [], [], []
+    if 'vcodec' in settings:
+        video_args = encoder_capabilities.encoder_args(settings['vcodec'], settings['crf'], settings['profile'])
+    elif 'acodec' in settings:
+        video_args = ['-vn']
+    if 'acodec' in settings:
+        audio_args = ['-c:a', settings['acodec']]
+    if 'audio_bitrate' in settings:
+        audio_args += ['-b:a', settings['audio_bitrate']]
+    if 'movflags' in settings and format_type in ('mp4', 'mov'):
+        output_args = ['-movflags', settings['movflags']]
+    return video_args, audio_args, output_args
+
+
+def batch_tool(tool, fmt=None, start=None, end=None, smart=True, audio_bitrate=None, files=1):
+    # job factory, worker count and output extension for running one of the tools over many files
+    if tool == 'trim':
+        # smart cuts only encode a GOP at each edge, the rest is copying
+        make_job = tool_job_factory(ffmpeg_path, media_probe, 'trim', start=start, end=end, smart=smart,
+                                    profile=encoding_profile())
+        return make_job, batch_workers(False, files), None
+
+    video_args, audio_args, output_args = conversion_args(fmt)
+    if tool == 'extract-audio':
+        video_args = ['-vn']
+        if audio_bitrate and audio_args and audio_args[1] in LOSSY_AUDIO_CODECS:
+            audio_args = audio_args[:2] + ['-b:a', f"{audio_bitrate}k"]
+    encodes_video = bool(video_args) and '-vn' not in video_args
+    workers = batch_workers(encodes_video, files)
+    if encodes_video and is_hardware(video_args[video_args.index('-c:v') + 1]):
+        workers = min(workers, HARDWARE_WORKERS)
+    threads = max(1, (os.cpu_count() or 4) // workers) if encodes_video else None
+    make_job = tool_job_factory(ffmpeg_path, media_probe, 'convert', video_args, audio_args, output_args,
+                                threads=threads)
+    return make_job, workers, fmt
+
+
+# the encoding post-processors, run by the postprocess stage when the queue hands them off
+DEFERRED_POSTPROCESSORS = ('FFmpegExtractAudio', 'FFmpegVideoConvertor')
+
+
+def downloaded_files(info):
+    if not info:
+        return
+    if info.get('_type') == 'playlist':
+        for entry in info.get('entries') or []:
+            yield from downloaded_files(entry)
+        return
+    for download in info.get('requested_downloads') or []:
+        if download.get('filepath'):
+            # yt-dlp leaves the merger it already ran in there, post_process would run it again on deleted parts
+            yield {key: value for key, value in download.items() if key not in ('__postprocessors', '__files_to_merge')}
+
+
+STREAM_PROTOCOLS = ('http', 'https')
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+def stream_download(ydl, info, media_type, input_args, output_args, progress_hooks, toast_callback):
+    # download straight into ffmpeg and write only the converted file; False means take the usual route,
+    # otherwise the converted file's path
+    import yt_dlp
+
+    resolved = ydl.process_ie_result(copy.deepcopy(info), download=False)
+    if resolved.get('requested_formats') or resolved.get('protocol') not in STREAM_PROTOCOLS \
+            or not resolved.get('url'):
+        # separate video and audio downloads, or a fragmented stream
+        return False
+    if resolved.get('ext') == media_type and media_type not in AUDIO_TARGET_CODECS:
+        # already in the target container, yt-dlp keeps it as downloaded
+        return False
+    if media_type in AUDIO_TARGET_CODECS \
+            and codec_name(resolved.get('acodec'), AUDIO_CODEC_NAMES) == AUDIO_TARGET_CODECS[media_type]:
+        output_args = ['-vn', '-c:a', 'copy']
+
+    outfile = os.path.splitext(ydl.prepare_filename(resolved))[0] + '.' + media_type
+    os.makedirs(os.path.dirname(os.path.abspath(outfile)), exist_ok=True)
+    response = ydl.urlopen(yt_dlp.networking.Request(resolved['url'], headers=resolved.get('http_headers')))
+    try:
+        total = int(response.headers.get('Content-Length') or 0) or resolved.get('filesize')
+        job = StreamTranscode(ffmpeg_path, iter(lambda: response.read(STREAM_CHUNK_SIZE), b''), input_args,
+                              output_args, outfile, total,
+                              on_progress=lambda d: [hook(d) for hook in progress_hooks])
+        job.run()
+    except StreamUnsupported as e:
+        toast_callback(f"Can't convert while downloading ({e}), downloading first")
+        return False
+    except FFmpegError as e:
+        toast_callback(f"Converting while downloading failed ({e}), downloading first", warning=True)
+        return False
+    finally:
+        response.close()
+    return outfile
+
+
+def plan_formats(url, media_type, quality, advanced_options):
+    # picks formats up front from the (usually already prefetched) metadata, so the post-processing can be fitted
+    try:
+        with ydl_pool.acquire(build_extract_opts(advanced_options)) as ydl:
+            info, _cached = extract_info_cached(ydl, url, need_formats=True)
+    except Exception as e:
+        print(f"Error planning formats for {url}: {e}")
+        return None
+    if not info or info.get('_type', 'video') != 'video':
+        return None
+    if media_type in AUDIO_FORMATS:
+        return plan_audio(info.get('formats'), media_type)
+    if quality.isdigit():
+        return plan_video(info.get('formats'), media_type, int(quality))
+    # 'best' has always meant the best single file with both streams
+    return plan_video(info.get('formats'), media_type, merge=False)
+
+
+def download_thread(url, media_type, quality, codec, save_path, threads, toast_callback,
+                    progress_callback, done_callback, advanced_options=None, control_hook=None,
+                    warning_callback=None, checkpoint=None, postprocess_callback=None):
+    import yt_dlp
+
+    autotune = app_settings.get('autotune_downloads', True)
+    if autotune:
+        fragments, chunk_size = host_tuner.settings_for(url)
+    else:
+        fragments, chunk_size = DEFAULT_FRAGMENTS, DEFAULT_CHUNK_SIZE
+    transfer = TransferMeter()
+    logger = YTDLPLogger(toast_callback)
+
+    def record_transfer():
+        if autotune:
+            host_tuner.record(url, fragments, chunk_size, transfer.downloaded, transfer.elapsed,
+                              transfer.requests(chunk_size), logger.retries, transfer.fragmented)
+
+    try:
+        if not advanced_options:
+            advanced_options = {}
+
+        if app_settings.get('check_space', True):
+            min_space = app_settings.get('min_space_gb', 1)
+            enough_space, free_space = check_disk_space(save_path, min_space)
+            if not enough_space:
+                message = (f"Warning! Only {free_space:.2f} GB free space left on target drive.\n"
+                           "Download may fail if there's not enough space for the video.")
+                if warning_callback:
+                    warning_callback(message)
+                else:
+                    toast_callback(message, warning=True)
+
+        postprocessors = []
+        stream_input_args, stream_output_args = [], []
+        merge_format = None
+        # an explicit codec means the user wants that encode, whatever the source has
+        plan = None
+        if not codec and not advanced_options.get('playlist') and media_type != 'wav':
+            plan = plan_formats(url, media_type, quality, advanced_options)
+        if media_type in ['mp3', 'ogg', 'wav', 'm4a']:
+            ydl_format = f"{plan['format']}/bestaudio" if plan else 'bestaudio'
+            postprocessors.append({
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': media_type,
+                'preferredquality': advanced_options.get('audio_quality', '192'),
+            })
+            acodec = codec or optimize_conversion_settings(media_type)['acodec']
+            stream_output_args = ['-vn', '-c:a', acodec]
+            if acodec in LOSSY_AUDIO_CODECS:
+                stream_output_args += ['-b:a', f"{advanced_options.get('audio_quality', '192')}k"]
+        elif media_type in ['mp4', 'webm', 'mkv']:
+            if quality == 'best':
+                ydl_format = 'best'
+            elif quality.isdigit():
+                ydl_format = f'bestvideo[height<={quality}]+bestaudio/best[height<={quality}]'
+            else:
+                ydl_format = 'best'
+            if plan:
+                ydl_format = f"{plan['format']}/{ydl_format}"
+
+            # keyed by post-processor, so the subtitle and thumbnail steps never pick up encoder options
+            hw_accel = advanced_options.get('hw_accel', app_settings.get('hardware_accel', 'auto'))
+            settings = optimize_conversion_settings(media_type, hw_accel, encoding_profile(advanced_options))
+            vcodec = settings['vcodec']
+            if codec and codec in CANDIDATES:
+                vcodec = encoder_capabilities.select(codec, hw_accel)
+            elif codec:
+                vcodec = codec
+            video_args = encoder_capabilities.encoder_args(vcodec, settings['crf'], settings['profile'])
+            audio_args = ['-b:a', settings['audio_bitrate']] if 'audio_bitrate' in settings else []
+            hwaccel_args = ['-hwaccel', settings['hwaccel']] if settings['hwaccel'] else []
+            if plan:
+                # streams that fit the container are copied, only the others get encoded
+                if plan['video_copy']:
+                    video_args = ['-c:v', 'copy']
+                    hwaccel_args = []
+                audio_args = ['-c:a', 'copy'] if plan['audio_copy'] else ['-c:a', settings['acodec']] + audio_args
+            convert_args = video_args + audio_args + ['-threads', str(threads)]
+            postprocessor_args = {'videoconvertor': convert_args}
+            if hwaccel_args:
+                # -hwaccel is an input option, it has no effect after the input file
+                postprocessor_args['videoconvertor+ffmpeg_i1'] = hwaccel_args
+            if plan and plan['merge']:
+                if postprocess_callback and not (plan['video_copy'] and plan['audio_copy']):
+                    # the encode must not hold the download slot: a plain remux into mkv here, the deferred
+                    # convertor makes the one encoding pass into the target in the postprocess stage
+                    merge_format = 'mkv'
+                else:
+                    merge_format = media_type
+                if not postprocess_callback:
+                    # merged straight into the target container, with any encoding done in that same pass
+                    postprocessor_args['merger'] = convert_args
+                    if hwaccel_args:
+                        postprocessor_args['merger+ffmpeg_i1'] = hwaccel_args
+            stream_input_args = hwaccel_args
+            stream_output_args = convert_args
+            if 'movflags' in settings and media_type == 'mp4':
+                stream_output_args = stream_output_args + ['-movflags', settings['movflags']]
+
+            # skips files already in the target container, so after a merge straight into it it does nothing
+            postprocessors.append({
+                'key': 'FFmpegVideoConvertor',
+                'preferedformat': media_type,
+            })
+
+        if checkpoint and checkpoint.get('format_id'):
+            # a different pick after re-extraction would leave the existing .part files orphaned
+            ydl_format = f"{checkpoint['format_id']}/{ydl_format}"
+            resumed = 0
+            for filename, state in checkpoint['files'].items():
+                path = filename if state.get('finished') else state.get('tmpfilename')
+                if path and os.path.exists(path):
+                    resumed += os.path.getsize(path)
+            if resumed:
+                toast_callback(f"Resuming download from {resumed / (1024 * 1024):.1f} MB")
+
+        filename_template = advanced_options.get('filename_template',
+                                                 app_settings.get('filename_template', '%(title)s.%(ext)s'))
+
+        ydl_opts = {
+            'format': ydl_format,
+            'outtmpl': os.path.join(save_path, filename_template),
+            'noplaylist': not advanced_options.get('playlist', False),
+            'postprocessors': postprocessors,
+            'quiet': True,
+            'logger': logger,
+            'progress_hooks': [transfer.hook, progress_callback],
+            'concurrent_fragment_downloads': fragments,
+            'http_chunk_size': chunk_size,
+            'retries': 10,
+            'fragment_retries': 10,
+            'continuedl': True,
+            'extractor_args': EXTRACTOR_ARGS
+        }
+
+        if control_hook:
+            ydl_opts['progress_hooks'].insert(0, control_hook)
+
+        if media_type in ['mp4', 'webm', 'mkv']:
+            ydl_opts['postprocessor_args'] = postprocessor_args
+        if merge_format:
+            ydl_opts['merge_output_format'] = merge_format
+
+        if advanced_options.get('proxy'):
+            proxy = advanced_options['proxy'].strip()
+            if proxy:
+                ydl_opts['proxy'] = proxy
+                toast_callback(f"Using proxy: {proxy}")
+
+        if advanced_options.get('cookies_file'):
+            cookies_file = advanced_options['cookies_file']
+            if cookies_file and os.path.exists(cookies_file):
+                ydl_opts['cookiefile'] = cookies_file
+                toast_callback("Using cookies for authentication")
+
+        if advanced_options.get('subtitles'):
+            ydl_opts.update({
+                'writesubtitles': True,
+                'subtitlesformat': advanced_options.get('subtitle_format', 'srt'),
+                'subtitleslangs': ['all'],
+                'writeautomaticsub': True,
+                'allsubtitles': True,
+                'postprocessors': postprocessors + [{
+                    'key': 'FFmpegSubtitlesConvertor',
+                    'format': advanced_options.get('subtitle_format', 'srt')
+                }]
+            })
+
+        if advanced_options.get('metadata'):
+            ydl_opts['writethumbnail'] = True
+            ydl_opts['writeinfojson'] = True
+            ydl_opts['writedescription'] = True
+            ydl_opts['writeannotations'] = True
+            ydl_opts['writeautomaticsub'] = True
+
+        if codec and media_type in ['mp3', 'ogg', 'wav', 'm4a']:
+            if 'postprocessor_args' not in ydl_opts:
+                ydl_opts['postprocessor_args'] = []
+            ydl_opts['postprocessor_args'].extend(['-c:a', codec])
+
+        deferred = []
+        if postprocess_callback:
+            deferred = [pp for pp in ydl_opts['postprocessors'] if pp['key'] in DEFERRED_POSTPROCESSORS]
+        if deferred:
+            # downloaded (and merged) here, encoded later while this slot already takes the next task
+            postprocess_opts = {'postprocessors': deferred, 'quiet': True, 'logger': logger}
+            if 'postprocessor_args' in ydl_opts:
+                postprocess_opts['postprocessor_args'] = ydl_opts['postprocessor_args']
+            ydl_opts['postprocessors'] = [pp for pp in ydl_opts['postprocessors'] if pp not in deferred]
+
+        # only a lone video with nothing but the conversion to do; anything else falls back to download first
+        stream = (advanced_options.get('stream_transcode', app_settings.get('stream_transcode', False))
+                  and stream_output_args and not checkpoint and not advanced_options.get('subtitles')
+                  and not advanced_options.get('metadata'))
+        streamed = False
+
+        with ydl_pool.acquire(ydl_opts) as ydl:
+            info, cached = extract_info_cached(ydl, url, need_formats=True)
+            title = info.get('title', 'Unknown')
+
+            if stream and info.get('_type', 'video') == 'video':
+                try:
+                    streamed = stream_download(ydl, info, media_type, stream_input_args, stream_output_args,
+                                               ydl_opts['progress_hooks'], toast_callback)
+                except yt_dlp.utils.DownloadCancelled:
+                    raise
+                except Exception as e:
+                    toast_callback(f"Converting while downloading failed ({e}), downloading first", warning=True)
+
+            if not streamed:
+                try:
+                    result = ydl.process_ie_result(info, download=True)
+                except yt_dlp.utils.DownloadError:
+                    if not cached:
+                        raise
+                    # stream URLs in the cached copy were rejected before their advertised expiry
+                    metadata_cache.invalidate(url, variant=metadata_variant(ydl))
+                    info, cached = extract_info_cached(ydl, url, need_formats=True)
+                    result = ydl.process_ie_result(info, download=True)
+
+        if streamed:
+            # a single long-lived connection says nothing about the best fragment/chunk settings
+            deferred = []
+        else:
+            record_transfer()
+
+        if advanced_options.get('cookies_file'):
+            temp_dir = os.path.dirname(advanced_options['cookies_file'])
+            if os.path.exists(temp_dir) and temp_dir.startswith(tempfile.gettempdir()):
+                try:
+                    shutil.rmtree(temp_dir)
+                except Exception as e:
+                    toast_callback(f"Failed to clean up cookies temp files: {e}", warning=True)
+
+        def finish(paths):
+            save_to_history(url, media_type, quality, codec, save_path, threads, advanced_options)
+            # one file per archive entry, a whole playlist in one go has no single file to point at
+            if len(paths) == 1 and info.get('_type', 'video') == 'video':
+                archive_download(url, media_type, quality, codec, advanced_options, info, paths[0])
+            done_callback()
+            toast_callback(f"Download complete: {title}", success=True)
+            return True
+
+        if deferred:
+            downloads = list(downloaded_files(result))
+
+            def postprocess():
+                paths = []
+                try:
+                    with ydl_pool.acquire(postprocess_opts) as postprocess_ydl:
+                        for download in downloads:
+                            paths.append(postprocess_ydl.post_process(download['filepath'], download)['filepath'])
+                except Exception as e:
+                    toast_callback(f"Error: {str(e)}", error=True)
+                    return False
+                return finish(paths)
+
+            postprocess_callback(postprocess)
+            return True
+        if streamed:
+            return finish([streamed])
+        return finish([download['filepath'] for download in downloaded_files(result)])
+
+    except yt_dlp.utils.DownloadCancelled:
+        return False
+    except Exception as e:
+        if logger.retries:
+            record_transfer()
+        toast_callback(f"Error: {str(e)}", error=True)
+        return False
+
+
+def queue_worker(download_queue, worker_id, toast_callback, progress_callback=None, status_callback=None,
+                 finished_callback=None, warning_callback=None):
+    def notify_status():
+        if status_callback:
+            status_callback(worker_id)
+
+    def on_progress(d):
+        download_queue.record_progress(worker_id, d)
+        if progress_callback:
+            progress_callback(worker_id, d)
+
+    while not download_queue.stop_flag:
+        download_queue.wait_if_paused()
+        if download_queue.stop_flag:
+            break
+
+        task = download_queue.get_task(worker_id)
+        if not task:
+            break
+
+        download_queue.set_worker_status(worker_id, status='downloading', percent=0, task=task)
+        notify_status()
+
+        deferred = []
+        started = time.monotonic()
+        success = False
+        try:
+            url = task['url']
+            media_type = task['media_type']
+            quality = task['quality']
+            codec = task.get('codec')
+            save_path = task['save_path']
+            threads = task.get('threads', 4)
+            advanced_options = task.get('advanced_options', {})
+
+            if expands_playlist(task):
+                expanded = expand_playlist(url, advanced_options)
+                # anything that isn't a playlist downloads as before
+                if expanded:
+                    title, entries = expanded
+                    if not entries:
+                        raise ValueError(f"playlist {title} has no entries")
+                    queued, skipped = download_queue.fan_out(worker_id, task, title, entries)
+                    message = f"Playlist {title}: {len(queued)} videos added to the queue"
+                    if skipped:
+                        message += f", {len(skipped)} already downloaded or queued"
+                    toast_callback(message)
+                    download_queue.set_worker_status(worker_id, status='idle', percent=0, task=None)
+                    notify_status()
+                    continue
+
+            duplicate = check_archive(task, resolve=True)
+            if duplicate:
+                toast_callback(f"Skipped {url}: {describe_duplicate(duplicate)}")
+                success = True
+            else:
+                success = download_thread(
+                    url, media_type, quality, codec, save_path, threads,
+                    toast_callback, on_progress, lambda: None,
+                    advanced_options,
+                    control_hook=download_queue.control_hook,
+                    warning_callback=warning_callback,
+                    checkpoint=download_queue.checkpoints.get(task['id']),
+                    postprocess_callback=deferred.append if download_queue.pipelined else None
+                )
+
+        except Exception as e:
+            toast_callback(f"Error processing task: {str(e)}", error=True)
+
+        download_queue.record_download(success, time.monotonic() - started)
+        if success and deferred:
+            download_queue.hand_off(worker_id, deferred[0], lambda: status_callback and status_callback(None))
+            download_queue.set_worker_status(worker_id, status='idle', percent=0, task=None)
+            notify_status()
+            continue
+
+        cancelled = download_queue.stop_flag and not success
+        if not success and not cancelled and download_queue.retry_entry(worker_id, task):
+            toast_callback(f"Retrying {task.get('title') or task['url']} later", warning=True)
+            download_queue.set_worker_status(worker_id, status='idle', percent=0, task=None)
+            notify_status()
+            continue
+        status = 'done' if success else 'cancelled' if cancelled else 'error'
+        download_queue.task_done(worker_id, requeue=cancelled)
+        download_queue.record_result(task, status)
+        download_queue.set_worker_status(
+            worker_id,
+            status=status,
+            percent=100 if success else download_queue.workers[worker_id]['percent']
+        )
+        notify_status()
+
+    download_queue.set_worker_status(worker_id, status='idle', percent=0, task=None)
+
+    if download_queue.worker_finished() == 0:
+        # the last downloads may still be converting
+        download_queue.postprocess_stage.join()
+        if finished_callback:
+            finished_callback()
+
+
+app_settings = AppSettings()
+history_store = HistoryStore(HISTORY_DB_FILE, legacy_json=HISTORY_FILE)
+ydl_pool = YoutubeDLPool(app_settings.get('ydl_pool_size', 4))
+host_tuner = HostTuner(HOST_TUNING_FILE)
+throughput_tracker = ThroughputTracker()
+metadata_cache = MetadataCache(METADATA_CACHE_DIR, ttl=app_settings.get('metadata_cache_ttl_hours', 24) * 3600)
+media_probe = MediaProbe(ffprobe_path, ffmpeg_path, MEDIA_PROBE_CACHE_DIR)
+encoder_capabilities = EncoderCapabilities(ffmpeg_path, ENCODER_CAPABILITIES_FILE)
+extract_stage = Stage('extract', extract_metadata, app_settings.get('extract_workers', 2), capacity=EXTRACT_BACKLOG)
+download_archive = DownloadArchive(ARCHIVE_DB_FILE)
@@ -0,0 +1,273 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+CAPABILITY_CACHE_VERSION = 2
+LIST_TIMEOUT = 30
+TEST_TIMEOUT = 60
+TEST_FRAMES = 60
+TEST_SOURCE = 'testsrc2=size=1280x720:rate=30'
+VAAPI_DEVICE = '/dev/dri/renderD128'
+# consumer GPUs cap concurrent encode sessions, and one session already keeps the encoder busy
+HARDWARE_WORKERS = 2
+
+# every encoder worth trying per target codec; the software one last, it is the fallback
+CANDIDATES = {
+    'h264': ['h264_nvenc', 'h264_qsv', 'h264_amf', 'h264_videotoolbox', 'h264_vaapi', 'libx264'],
+    'hevc': ['hevc_nvenc', 'hevc_qsv', 'hevc_amf', 'hevc_videotoolbox', 'hevc_vaapi', 'libx265'],
+    'vp9': ['vp9_qsv', 'vp9_vaapi', 'libvpx-vp9'],
+    'av1': ['av1_nvenc', 'av1_qsv', 'av1_amf', 'av1_vaapi', 'libsvtav1', 'libaom-av1'],
+}
+SOFTWARE_ENCODERS = {'libx264', 'libx265', 'libvpx-vp9', 'libsvtav1', 'libaom-av1'}
+HARDWARE_FAMILIES = {'nvenc', 'qsv', 'amf', 'videotoolbox', 'vaapi'}
+
+# rate control roughly equivalent to the crf the software encoders get
+QUALITY_ARGS = {
+    'libx264': ['-crf', '{crf}'],
+    'libx265': ['-crf', '{crf}'],
+    'libvpx': ['-b:v', '0', '-crf', '{crf}'],
+    'libvpx-vp9': ['-b:v', '0', '-crf', '{crf}'],
+    'libsvtav1': ['-crf', '{crf}'],
+    'libaom-av1': ['-b:v', '0', '-crf', '{crf}'],
+    'nvenc': ['-rc', 'vbr', '-cq', '{crf}', '-b:v', '0'],
+    'qsv': ['-global_quality', '{crf}'],
+    'amf': ['-rc', 'cqp', '-qp_i', '{crf}', '-qp_p', '{crf}'],
+    'videotoolbox': ['-q:v', '65'],
+    'vaapi': ['-qp', '{crf}'],
+}
+# speed/compression trade-off of each encoder family for the encoding profiles
+PROFILE_ARGS = {
+    'libx264': {'speed': ['-preset', 'veryfast'], 'balanced': ['-preset', 'fast'], 'size': ['-preset', 'slow']},
+    'libx265': {'speed': ['-preset', 'veryfast'], 'balanced': ['-preset', 'fast'], 'size': ['-preset', 'slow']},
+    'libvpx': {'speed': ['-deadline', 'realtime', '-cpu-used', '8'],
+               'balanced': ['-deadline', 'good', '-cpu-used', '4'],
+               'size': ['-deadline', 'good', '-cpu-used', '1']},
+    'libvpx-vp9': {'speed': ['-deadline', 'realtime', '-cpu-used', '8', '-row-mt', '1'],
+                   'balanced': ['-deadline', 'good', '-cpu-used', '4', '-row-mt', '1'],
+                   'size': ['-deadline', 'good', '-cpu-used', '1', '-row-mt', '1']},
+    'libsvtav1': {'speed': ['-preset', '12'], 'balanced': ['-preset', '10'], 'size': ['-preset', '6']},
+    'libaom-av1': {'speed': ['-cpu-used', '8', '-usage', 'realtime'], 'balanced': ['-cpu-used', '8'],
+                   'size': ['-cpu-used', '5']},
+    'nvenc': {'speed': ['-preset', 'p1'], 'balanced': ['-preset', 'p4'], 'size': ['-preset', 'p7']},
+    'qsv': {'speed': ['-preset', 'veryfast'], 'balanced': ['-preset', 'medium'], 'size': ['-preset', 'veryslow']},
+    'amf': {'speed': ['-quality', 'speed'], 'balanced': ['-quality', 'balanced'], 'size': ['-quality', 'quality']},
+}
+# vaapi encoders only take frames that are already on the device
+ENCODER_SETUP = {
+    'vaapi': ['-vaapi_device', VAAPI_DEVICE, '-vf', 'format=nv12,hwupload'],
+}
+# encoder family to prefer when the user picked a decoding method
+HWACCEL_FAMILIES = {
+    'cuda': 'nvenc',
+    'nvdec': 'nvenc',
+    'qsv': 'qsv',
+    'vaapi': 'vaapi',
+    'videotoolbox': 'videotoolbox',
+    'd3d11va': 'amf',
+}
+# ffmpeg keeps going in software when a hwaccel fails to initialise, so the exit code is not enough
+HWACCEL_FAILURES = ('Failed setup', 'hwaccel initialisation returned error', 'Device creation failed',
+                    'Hardware device setup failed', 'No device available')
+
+ENCODER_PATTERN = re.compile(r"^\s*V[\w.]{5}\s+(\S+)\s+(.*?)(?:\(codec (\w+)\))?\s*$")
+LOG_PREFIX = re.compile(r"^\[[^\]]+ @ 0x[0-9a-f]+\]\s*")
+
+
+def encoder_family(name):
+    if name in SOFTWARE_ENCODERS:
+        return name
+    return name.rsplit('_', 1)[-1]
+
+
+def is_hardware(name):
+    return bool(name) and encoder_family(name) in HARDWARE_FAMILIES
+
+
+def default_encoder(codec):
+    return CANDIDATES[codec][-1] if codec in CANDIDATES else codec
+
+
+def profile_args(name, profile):
+    return list(PROFILE_ARGS.get(encoder_family(name), {}).get(profile, []))
+
+
+def quality_args(name, crf):
+    return [arg.format(crf=crf) for arg in QUALITY_ARGS.get(encoder_family(name), [])]
+
+
+def first_error(stderr):
+    # the first message an ffmpeg component logged is the cause, the rest is the fallout
+    lines = [line.strip() for line in stderr.splitlines() if line.strip()]
+    for line in lines:
+        if LOG_PREFIX.match(line):
+            return LOG_PREFIX.sub('', line)
+    return lines[-1] if lines else ''
+
+
+def parse_hwaccels(output):
+    lines = output.splitlines()
+    for index, line in enumerate(lines):
+        if line.strip().startswith('Hardware acceleration methods'):
+            return [name.strip() for name in lines[index + 1:] if name.strip()]
+    return []
+
+
+def parse_encoders(output):
+    encoders = {}
+    for line in output.splitlines():
+        match = ENCODER_PATTERN.match(line)
+        if match and match.group(1) != '=':
+            encoders[match.group(1)] = match.group(3) or match.group(1)
+    return encoders
+
+
+class EncoderCapabilities:
+    def __init__(self, ffmpeg_path, path):
+        self.ffmpeg_path = ffmpeg_path
+        self.path = path
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+        self.matrix = None
+        self.load()
+
+    def key(self):
+        if not self.ffmpeg_path:
+            return None
+        try:
+            stat = os.stat(self.ffmpeg_path)
+        except OSError:
+            return None
+        return f"{os.path.abspath(self.ffmpeg_path)}|{stat.st_size}|{stat.st_mtime_ns}|{CAPABILITY_CACHE_VERSION}"
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                matrix = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading encoder capabilities: {e}")
+            return
+        # a different or updated ffmpeg build has to be tested again
+        if matrix.get('key') == self.key():
+            self.matrix = matrix
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.matrix, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving encoder capabilities: {e}")
+
+    @property
+    def probed(self):
+        return self.matrix is not None
+
+    def probe(self, force=False):
+        with self.probe_lock:
+            if self.matrix is not None and not force:
+                return self.matrix
+            key = self.key()
+            if key is None:
+                return None
+            hwaccels = parse_hwaccels(self._run(['-hwaccels'], LIST_TIMEOUT).stdout)
+            available = parse_encoders(self._run(['-encoders'], LIST_TIMEOUT).stdout)
+
+            encoders = {}
+            for codec, names in CANDIDATES.items():
+                for name in names:
+                    if name in available:
+                        encoders[name] = dict(self._test_encoder(name), codec=codec, hardware=is_hardware(name))
+
+            work_dir = tempfile.mkdtemp(prefix='hwaccel_test_')
+            try:
+                sample = self._make_sample(work_dir, encoders)
+                tested = {name: self._test_hwaccel(name, sample) for name in hwaccels}
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            matrix = {'key': key, 'probed_at': time.time(), 'hwaccels': tested, 'encoders': encoders}
+            with self.lock:
+                self.matrix = matrix
+            self.save()
+            return matrix
+
+    def _run(self, args, timeout):
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        try:
+            return subprocess.run([self.ffmpeg_path, '-hide_banner', '-nostdin'] + args,
+                                  stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                                  encoding='utf-8', errors='replace', timeout=timeout,
+                                  creationflags=creationflags)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return subprocess.CompletedProcess(args, -1, '', str(e))
+
+    def _test_encoder(self, name):
+        # a short encode tells whether the device is really there, and how fast it is
+        args = ['-f', 'lavfi', '-i', TEST_SOURCE, '-frames:v', str(TEST_FRAMES)]
+        args += self.encoder_args(name) + ['-f', 'null', '-']
+        started = time.monotonic()
+        result = self._run(args, TEST_TIMEOUT)
+        elapsed = time.monotonic() - started
+        if result.returncode != 0:
+            error = first_error(result.stderr) or f"exit code {result.returncode}"
+            return {'works': False, 'fps': None, 'error': error}
+        return {'works': True, 'fps': round(TEST_FRAMES / elapsed, 1) if elapsed else None, 'error': None}
+
+    def _make_sample(self, work_dir, encoders):
+        sample = os.path.join(work_dir, 'sample.mp4')
+        codec = 'libx264' if encoders.get('libx264', {}).get('works') else 'mpeg4'
+        self._run(['-f', 'lavfi', '-i', 'testsrc2=size=640x360:rate=30', '-frames:v', '30',
+                   '-c:v', codec, '-pix_fmt', 'yuv420p', sample], TEST_TIMEOUT)
+        return sample
+
+    def _test_hwaccel(self, name, sample):
+        if not os.path.exists(sample):
+            return {'works': False, 'error': "no test sample"}
+        result = self._run(['-hwaccel', name, '-i', sample, '-f', 'null', '-'], TEST_TIMEOUT)
+        failure = next((line for line in result.stderr.splitlines()
+                        if any(marker in line for marker in HWACCEL_FAILURES)), None)
+        if result.returncode != 0 or failure:
+            error = LOG_PREFIX.sub('', failure.strip()) if failure else first_error(result.stderr)
+            return {'works': False, 'error': error}
+        return {'works': True, 'error': None}
+
+    def working_hwaccels(self):
+        with self.lock:
+            if not self.matrix:
+                return []
+            return sorted(name for name, result in self.matrix['hwaccels'].items() if result['works'])
+
+    def decode_hwaccel(self, hw_accel):
+        # only methods that decoded the test sample, anything else silently decodes in software
+        return hw_accel if hw_accel in self.working_hwaccels() else None
+
+    def select(self, codec, hw_accel='auto'):
+        with self.lock:
+            encoders = dict(self.matrix['encoders']) if self.matrix else {}
+        working = [(name, result) for name, result in encoders.items()
+                   if result['codec'] == codec and result['works']]
+        if not working:
+            return default_encoder(codec)
+        family = HWACCEL_FAMILIES.get(hw_accel)
+        preferred = [item for item in working if encoder_family(item[0]) == family]
+        name, _result = max(preferred or working, key=lambda item: item[1]['fps'] or 0)
+        return name
+
+    def encoder_args(self, name, crf='23', profile='balanced'):
+        family = encoder_family(name)
+        args = list(ENCODER_SETUP.get(family, [])) + ['-c:v', name] + profile_args(name, profile)
+        return args + quality_args(name, crf)
+
+    def report(self):
+        with self.lock:
+            if not self.matrix:
+                return None
+            return dict(self.matrix)
@@ -0,0 +1,184 @@
+import os
+import subprocess
+import threading
+from collections import deque
+
+STDERR_TAIL_LINES = 40
+
+
+class FFmpegError(Exception):
+    def __init__(self, message, returncode=None, stderr=''):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class FFmpegCancelled(FFmpegError):
+    pass
+
+
+def parse_timestamp(value):
+    # accepts seconds ("75.5") or [[HH:]MM:]SS[.ms] like ffmpeg does
+    value = str(value).strip()
+    seconds = 0.0
+    for part in value.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_number(value, suffix=''):
+    if value is None:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def write_concat_list(path, files):
+    # input list for the concat demuxer, quotes escaped the way its parser expects
+    with open(path, 'w', encoding='utf-8') as f:
+        for file in files:
+            escaped = os.path.abspath(file).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return path
+
+
+class FFmpegJob:
+    def __init__(self, ffmpeg_path, args, duration=0, output=None, on_progress=None):
+        self.cmd = [ffmpeg_path, '-hide_banner', '-nostdin', '-nostats', '-y', '-progress', 'pipe:1'] + list(args)
+        self.duration = duration or 0
+        self.output = output
+        self.on_progress = on_progress
+        self.process = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self.progress = {'time': 0.0, 'percent': 0, 'fps': None, 'speed': None,
+                         'bitrate': None, 'size': None, 'done': False}
+
+    def run(self):
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        with self.lock:
+            if self.cancelled:
+                raise FFmpegCancelled("Cancelled")
+            self.process = subprocess.Popen(
+                self.cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                creationflags=creationflags
+            )
+
+        # stderr is read on its own thread, an unread pipe filling up would stall ffmpeg
+        stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        stderr_thread.start()
+
+        block = {}
+        for line in self.process.stdout:
+            key, sep, value = line.strip().partition('=')
+            if not sep:
+                continue
+            block[key] = value
+            if key == 'progress':
+                self._publish(block)
+                block = {}
+
+        returncode = self.process.wait()
+        stderr_thread.join()
+
+        if self.cancelled:
+            self._remove_output()
+            raise FFmpegCancelled("Cancelled", returncode, self.stderr())
+        if returncode != 0:
+            self._remove_output()
+            lines = [line for line in self.stderr_tail if line.strip()]
+            reason = lines[-1] if lines else f"ffmpeg exited with code {returncode}"
+            raise FFmpegError(reason, returncode, self.stderr())
+        return self.progress
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            process = self.process
+        if process is None or process.poll() is not None:
+            return
+        # the partial output is thrown away, so there is nothing to gain from a graceful 'q'
+        process.kill()
+
+    def stderr(self):
+        return '\n'.join(self.stderr_tail)
+
+    def _drain_stderr(self):
+        for line in self.process.stderr:
+            self.stderr_tail.append(line.rstrip())
+
+    def _publish(self, block):
+        progress = dict(self.progress)
+        out_time_us = parse_number(block.get('out_time_us'))
+        if out_time_us is not None and out_time_us >= 0:
+            progress['time'] = out_time_us / 1000000
+        progress['fps'] = parse_number(block.get('fps'))
+        progress['speed'] = parse_number(block.get('speed'), 'x')
+        progress['bitrate'] = parse_number(block.get('bitrate'), 'kbits/s')
+        progress['size'] = parse_number(block.get('total_size'))
+        progress['done'] = block.get('progress') == 'end'
+        if progress['done']:
+            progress['percent'] = 100
+        elif self.duration > 0:
+            progress['percent'] = min(99, int(progress['time'] / self.duration * 100))
+        self.progress = progress
+        if self.on_progress:
+            self.on_progress(progress)
+
+    def _remove_output(self):
+        if self.output and os.path.exists(self.output):
+            try:
+                os.remove(self.output)
+            except OSError:
+                pass
+
+
+class FFmpegJobGroup:
+    # several ffmpeg runs that report progress and get cancelled as one job
+    def __init__(self, ffmpeg_path, on_progress=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.on_progress = on_progress
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.cancelled = False
+        self.done_time = {}
+        self.total_work = 1
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+
+    def run_job(self, args, duration, output, key, weight=1):
+        job = FFmpegJob(self.ffmpeg_path, args, duration=duration, output=output,
+                        on_progress=lambda progress: self.report(key, progress['time'] * weight))
+        with self.lock:
+            if self.cancelled:
+                raise FFmpegCancelled("Cancelled")
+            self.jobs.append(job)
+        job.run()
+        self.report(key, duration * weight)
+        return output
+
+    def report(self, key, seconds):
+        with self.lock:
+            self.done_time[key] = seconds
+            done = sum(self.done_time.values())
+        if self.on_progress:
+            percent = min(100, int(done / (self.total_work or 1) * 100))
+            self.on_progress({'time': done, 'percent': percent, 'fps': None, 'speed': None,
+                              'bitrate': None, 'size': None, 'done': percent >= 100})
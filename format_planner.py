@@ -0,0 +1,108 @@
+VIDEO_CODEC_NAMES = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264',
+    'hev1': 'hevc', 'hvc1': 'hevc', 'hevc': 'hevc', 'h265': 'hevc',
+    'vp8': 'vp8', 'vp08': 'vp8',
+    'vp9': 'vp9', 'vp09': 'vp9',
+    'av01': 'av1', 'av1': 'av1',
+}
+AUDIO_CODEC_NAMES = {
+    'mp4a': 'aac', 'aac': 'aac',
+    'mp3': 'mp3', 'mp4a.40.34': 'mp3',
+    'opus': 'opus', 'vorbis': 'vorbis',
+    'ac-3': 'ac3', 'ac3': 'ac3', 'ec-3': 'eac3', 'eac3': 'eac3',
+    'flac': 'flac',
+}
+# codecs each container takes as they are, so the download only needs remuxing; None takes anything
+REMUX_CODECS = {
+    'mp4': ({'h264', 'hevc', 'av1'}, {'aac', 'mp3', 'ac3', 'eac3'}),
+    'webm': ({'vp8', 'vp9', 'av1'}, {'opus', 'vorbis'}),
+    'mkv': (None, None),
+}
+# audio target -> the source codec that extraction can copy
+AUDIO_TARGET_CODECS = {'mp3': 'mp3', 'm4a': 'aac', 'ogg': 'vorbis', 'opus': 'opus', 'flac': 'flac'}
+
+
+def codec_name(codec, names):
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    if codec in names:
+        return names[codec]
+    return names.get(codec.split('.')[0])
+
+
+def has_video(fmt):
+    return fmt.get('vcodec') != 'none' and bool(fmt.get('vcodec') or fmt.get('height'))
+
+
+def has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+
+def copies_into(fmt, container, kind):
+    allowed = REMUX_CODECS[container][0 if kind == 'video' else 1]
+    name = codec_name(fmt.get('vcodec' if kind == 'video' else 'acodec'),
+                      VIDEO_CODEC_NAMES if kind == 'video' else AUDIO_CODEC_NAMES)
+    if allowed is None:
+        return True
+    return name in allowed
+
+
+def bitrate(fmt, kind='total'):
+    key = {'video': 'vbr', 'audio': 'abr'}.get(kind)
+    return (key and fmt.get(key)) or fmt.get('tbr') or 0
+
+
+def plan_video(formats, container, max_height=None, merge=True):
+    # the best height/fps on offer, and among those the formats that need the least re-encoding
+    if container not in REMUX_CODECS:
+        return None
+    formats = [fmt for fmt in formats or [] if fmt.get('format_id') and not fmt.get('has_drm')]
+    videos = [fmt for fmt in formats if has_video(fmt) and (merge or has_audio(fmt))
+              and (not max_height or (fmt.get('height') or 0) <= max_height)]
+    audios = [fmt for fmt in formats if merge and has_audio(fmt) and not has_video(fmt)]
+    # without codec details there is nothing to rank on, yt-dlp's own choice stays
+    if not videos or not any(fmt.get('vcodec') for fmt in videos):
+        return None
+
+    tier = max((fmt.get('height') or 0, round(fmt.get('fps') or 0)) for fmt in videos)
+    audio = None
+    if audios:
+        audio = min(audios, key=lambda fmt: (not copies_into(fmt, container, 'audio'), -bitrate(fmt, 'audio')))
+
+    options = []
+    for fmt in videos:
+        if (fmt.get('height') or 0, round(fmt.get('fps') or 0)) != tier:
+            continue
+        video_copy = copies_into(fmt, container, 'video')
+        if has_audio(fmt):
+            options.append(((not video_copy) * 2 + (not copies_into(fmt, container, 'audio')), -bitrate(fmt),
+                            [fmt], video_copy, copies_into(fmt, container, 'audio')))
+        elif audio is not None:
+            audio_copy = copies_into(audio, container, 'audio')
+            options.append(((not video_copy) * 2 + (not audio_copy), -bitrate(fmt, 'video'),
+                            [fmt, audio], video_copy, audio_copy))
+    if not options:
+        return None
+
+    _cost, _rate, chosen, video_copy, audio_copy = min(options, key=lambda option: option[:2])
+    return {
+        'format': '+'.join(fmt['format_id'] for fmt in chosen),
+        'merge': len(chosen) > 1,
+        'ext': chosen[0].get('ext'),
+        'height': tier[0],
+        'video_copy': video_copy,
+        'audio_copy': audio_copy,
+    }
+
+
+def plan_audio(formats, target):
+    audios = [fmt for fmt in formats or [] if fmt.get('format_id') and has_audio(fmt) and not has_video(fmt)]
+    if not audios or target not in AUDIO_TARGET_CODECS:
+        return None
+    best = max(bitrate(fmt, 'audio') for fmt in audios)
+    # a copy is worth a small step down in bitrate, the re-encode would lose more
+    matching = [fmt for fmt in audios if bitrate(fmt, 'audio') >= best * 0.75
+                and codec_name(fmt.get('acodec'), AUDIO_CODEC_NAMES) == AUDIO_TARGET_CODECS[target]]
+    chosen = max(matching or audios, key=lambda fmt: bitrate(fmt, 'audio'))
+    return {'format': chosen['format_id']}
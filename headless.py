@@ -0,0 +1,444 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import downloader
+from batch_tools import (BatchJob, DEFAULT_FOLDERS, DEFAULT_NAMING, describe_batch, find_inputs, plan_batch,
+                         source_root, summarize_batch)
+from downloader import app_settings, DownloadQueue, queue_worker
+from ffmpeg_jobs import FFmpegJob, FFmpegError, parse_timestamp
+from media_probe import first_stream
+from segment_transcode import SegmentedTranscode, single_args
+from throughput import format_eta
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='main.py --headless',
+        description='Download a batch of URLs without the GUI.'
+    )
+    parser.add_argument('urls', nargs='*', help='URLs to download')
+    parser.add_argument('-i', '--input', help="text file with one URL per line ('-' reads stdin)")
+    parser.add_argument('-f', '--format', default=app_settings.get('default_format', 'mp4'),
+                        help='output format (mp4, webm, mkv, mp3, ogg, wav, m4a)')
+    parser.add_argument('-q', '--quality', default=app_settings.get('default_quality', 'best'),
+                        help='best or a maximum height such as 720')
+    parser.add_argument('-c', '--codec', default=None, help='codec passed to FFmpeg (optional)')
+    parser.add_argument('-o', '--output', default=app_settings.get('default_save_path', os.getcwd()),
+                        help='save directory')
+    parser.add_argument('-t', '--threads', type=int, default=app_settings.get('default_threads', os.cpu_count() or 4),
+                        help='FFmpeg threads')
+    parser.add_argument('-w', '--workers', type=int, default=app_settings.get('max_concurrent_downloads', 3),
+                        help='parallel downloads')
+    parser.add_argument('--per-host', type=int, default=app_settings.get('per_host_limit', 2),
+                        help='parallel downloads per site')
+    parser.add_argument('--extract-workers', type=int, default=app_settings.get('extract_workers', 2),
+                        help='parallel metadata lookups ahead of the downloads')
+    parser.add_argument('--postprocess-workers', type=int, default=app_settings.get('postprocess_workers', 1),
+                        help='parallel conversions after download (0 converts inside the download slot)')
+    parser.add_argument('--stage-stats', action='store_true',
+                        help='print per-stage counts and busy times of the pipeline at the end')
+    parser.add_argument('--playlist', action='store_true', help='download entire playlists')
+    parser.add_argument('--subtitles', action='store_true', help='download subtitles')
+    parser.add_argument('--subtitle-format', default='srt', choices=['srt', 'vtt', 'ass', 'lrc'])
+    parser.add_argument('--metadata', action='store_true', help='write description, thumbnail and info json')
+    parser.add_argument('--audio-quality', default='192', help='audio bitrate in kbps')
+    parser.add_argument('--proxy', help='proxy URL, e.g. http://user:pass@ip:port')
+    parser.add_argument('--cookies', help='cookies.txt file')
+    parser.add_argument('--filename-template', default=app_settings.get('filename_template', '%(title)s.%(ext)s'))
+    parser.add_argument('--hw-accel', default=app_settings.get('hardware_accel', 'auto'))
+    parser.add_argument('--profile', choices=list(downloader.ENCODING_PROFILES),
+                        default=downloader.encoding_profile(),
+                        help='encoding profile for conversions: speed encodes faster at the same quality, '
+                             'into bigger files; size trades some quality for smaller files')
+    parser.add_argument('--stream', action='store_true', default=app_settings.get('stream_transcode', False),
+                        help='convert while downloading instead of after, where the format allows it')
+    parser.add_argument('--resume', action='store_true',
+                        help='also run tasks left over from an interrupted headless run')
+    parser.add_argument('--quiet', action='store_true', help='only print errors and the summary')
+    parser.add_argument('--speed-log', help='write per-task speed samples to this CSV file on exit')
+    parser.add_argument('--tuning-report', action='store_true',
+                        help='print the learned fragment/chunk settings per site and exit')
+    parser.add_argument('--benchmark-convert', metavar='FILE',
+                        help='convert FILE to --format with one FFmpeg process and split at keyframes, '
+                             'print both timings and exit')
+    parser.add_argument('--benchmark-profiles', metavar='FILE', nargs='+',
+                        help='encode the start of each FILE to --format with every encoding profile, '
+                             'print speed and size and exit')
+    parser.add_argument('--benchmark-seconds', type=float, default=30,
+                        help='seconds of each clip to encode for --benchmark-profiles')
+    parser.add_argument('--batch', nargs=2, metavar=('TOOL', 'SOURCE'),
+                        help='run convert, trim or extract-audio over every media file in the SOURCE folder '
+                             'or glob and exit; output format from --format')
+    parser.add_argument('--batch-output', help='folder for batch results (default: a converted, trimmed or audio '
+                                               'folder in SOURCE)')
+    parser.add_argument('--naming', help='batch output file name, with {name}, {ext} and {index} '
+                                         '(default: {name}.{ext}, {name}_trimmed.{ext} for trim)')
+    parser.add_argument('--recursive', action='store_true', help='include subfolders of a batch SOURCE')
+    parser.add_argument('--start', help='trim start, HH:MM:SS or seconds')
+    parser.add_argument('--end', help='trim end, HH:MM:SS or seconds')
+    parser.add_argument('--copy-trim', action='store_true', help='cut batch trims on keyframes without re-encoding')
+    parser.add_argument('--batch-workers', type=int, help='files processed at once (default: from the CPU count)')
+    parser.add_argument('--force', action='store_true', help='redo batch outputs that are already up to date and download media that was '
+                        'downloaded before')
+    parser.add_argument('--encoder-report', action='store_true',
+                        help='print which encoders and hardware decoders work with this FFmpeg build and exit')
+    parser.add_argument('--retest-encoders', action='store_true',
+                        help='run the encoder tests again instead of using the cached results')
+    return parser.parse_args(argv)
+
+
+def read_urls(args):
+    urls = list(args.urls)
+    if args.input:
+        if args.input == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(args.input, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        urls.extend(line.strip() for line in lines)
+    return [url for url in urls if url and not url.startswith('#')]
+
+
+def build_task(url, args):
+    advanced_options = {
+        'playlist': args.playlist,
+        'subtitles': args.subtitles,
+        'subtitle_format': args.subtitle_format,
+        'metadata': args.metadata,
+        'audio_quality': args.audio_quality,
+        'filename_template': args.filename_template,
+        'hw_accel': args.hw_accel,
+        'encoding_profile': args.profile,
+        'stream_transcode': args.stream
+    }
+    if args.proxy:
+        advanced_options['proxy'] = args.proxy
+    if args.cookies:
+        cookies_file = downloader.get_cookies_from_file(args.cookies)
+        if cookies_file:
+            advanced_options['cookies_file'] = cookies_file
+
+    return {
+        'url': url,
+        'media_type': args.format,
+        'quality': args.quality,
+        'codec': args.codec,
+        'save_path': args.output,
+        'threads': args.threads,
+        'advanced_options': advanced_options,
+        'force': args.force,
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+class TerminalReporter:
+    def __init__(self, download_queue, quiet=False):
+        self.download_queue = download_queue
+        self.quiet = quiet
+        self.interactive = sys.stdout.isatty()
+        self.lock = threading.Lock()
+        self.line_width = 0
+
+    def toast(self, message, success=False, error=False, warning=False):
+        if self.quiet and not error:
+            return
+        stream = sys.stderr if error or warning else sys.stdout
+        with self.lock:
+            self.clear_line()
+            print(message, file=stream, flush=True)
+
+    def status(self, worker_id):
+        if self.quiet or self.interactive:
+            return
+        worker = self.download_queue.workers.get(worker_id, {})
+        task = worker.get('task')
+        if task and worker.get('status') == 'downloading':
+            with self.lock:
+                print(f"[#{worker_id + 1}] started {task.get('url', '')}", flush=True)
+
+    def clear_line(self):
+        if self.interactive and self.line_width:
+            sys.stdout.write('\r' + ' ' * self.line_width + '\r')
+            self.line_width = 0
+
+    def render(self):
+        if self.quiet or not self.interactive:
+            return
+        workers, pending = self.download_queue.snapshot()
+        parts = []
+        for worker_id in sorted(workers):
+            worker = workers[worker_id]
+            if worker.get('task') and worker['status'] in ('downloading', 'processing'):
+                speed = downloader.format_speed(worker.get('speed')) if worker.get('speed') else '-'
+                parts.append(f"#{worker_id + 1} {worker['percent']:3d}% {speed} ETA {format_eta(worker.get('eta'))}")
+        stats = self.download_queue.stats
+        converting = len(self.download_queue.processing_tasks())
+        line = (f"done {stats['done']}  failed {stats['error']}  pending {len(pending)}  converting {converting}  | "
+                + '  '.join(parts))
+        with self.lock:
+            self.clear_line()
+            sys.stdout.write(line)
+            sys.stdout.flush()
+            self.line_width = len(line)
+
+
+def write_speed_log(path):
+    try:
+        samples = downloader.throughput_tracker.export(path)
+        print(f"Wrote {samples} speed samples to {path}")
+    except OSError as e:
+        print(f"Error writing speed log: {e}", file=sys.stderr)
+
+
+def benchmark_profiles(paths, fmt, seconds, hw_accel):
+    work_dir = tempfile.mkdtemp(prefix='profile_benchmark_')
+    print(f"{fmt}, first {seconds:g} s of each clip, {os.cpu_count()} cores")
+    print(f"{'clip':<24} {'profile':<9} {'encoder':<12} {'time':>7} {'fps':>7} {'size':>9} {'vs balanced':>11}")
+    try:
+        for path in paths:
+            try:
+                info = downloader.media_probe.probe(path)
+            except Exception as e:
+                print(f"{os.path.basename(path)[:23]:<24} failed: {e}")
+                continue
+            length = min(seconds, info['duration'] or seconds)
+            video = first_stream(info, 'video')
+            frames = length * (video['fps'] or 0) if video else 0
+            results = {}
+            for profile in downloader.ENCODING_PROFILES:
+                video_args, audio_args, output_args = downloader.conversion_args(fmt, hw_accel, profile)
+                encoder = video_args[video_args.index('-c:v') + 1] if '-c:v' in video_args else '-'
+                out = os.path.join(work_dir, f"{profile}.{fmt}")
+                args = ['-t', f"{length:.3f}", '-i', path] + video_args + audio_args + output_args + [out]
+                started = time.monotonic()
+                try:
+                    FFmpegJob(downloader.ffmpeg_path, args, duration=length, output=out).run()
+                except FFmpegError as e:
+                    results[profile] = (encoder, None, str(e))
+                    continue
+                results[profile] = (encoder, time.monotonic() - started, os.path.getsize(out))
+
+            name = os.path.basename(path)[:23]
+            baseline = results.get('balanced', (None, None, None))
+            for profile, (encoder, elapsed, size) in results.items():
+                if elapsed is None:
+                    print(f"{name:<24} {profile:<9} {encoder:<12} failed: {size}")
+                    continue
+                fps = f"{frames / elapsed:.1f}" if frames and elapsed else '-'
+                relative = f"{size / baseline[2] * 100:.0f}%" if baseline[1] and baseline[2] else '-'
+                print(f"{name:<24} {profile:<9} {encoder:<12} {elapsed:6.1f}s {fps:>7} "
+                      f"{size / (1024 * 1024):7.2f}MB {relative:>11}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return EXIT_OK
+
+
+def benchmark_convert(path, fmt):
+    video_args, audio_args, output_args = downloader.conversion_args(fmt)
+    duration = downloader.media_probe.duration(path)
+    work_dir = tempfile.mkdtemp(prefix='convert_benchmark_')
+    runs = [
+        ('single', lambda out: FFmpegJob(downloader.ffmpeg_path,
+                                         single_args(path, out, video_args, audio_args, output_args),
+                                         duration=duration, output=out)),
+        ('segmented', lambda out: SegmentedTranscode(downloader.ffmpeg_path, downloader.media_probe, path, out,
+                                                     video_args, audio_args, output_args))
+    ]
+    print(f"{os.path.basename(path)}: {duration:.1f} s -> {fmt}, {os.cpu_count()} cores")
+    print(f"{'mode':<10} {'time':>8} {'speed':>8} {'size':>10} {'duration':>9}")
+    try:
+        for name, make_job in runs:
+            out = os.path.join(work_dir, f"{name}.{fmt}")
+            started = time.monotonic()
+            try:
+                make_job(out).run()
+            except FFmpegError as e:
+                print(f"{name:<10} failed: {e}")
+                continue
+            elapsed = time.monotonic() - started
+            size = os.path.getsize(out) / (1024 * 1024)
+            result_duration = downloader.media_probe.duration(out)
+            speed = duration / elapsed if elapsed else 0
+            print(f"{name:<10} {elapsed:7.1f}s {speed:7.2f}x {size:8.1f}MB {result_duration:8.2f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return EXIT_OK
+
+
+def run_batch(args):
+    tool, source = args.batch
+    if tool not in DEFAULT_NAMING:
+        print(f"Unknown batch tool {tool!r}, use one of: {', '.join(DEFAULT_NAMING)}", file=sys.stderr)
+        return EXIT_USAGE
+    start = end = None
+    if tool == 'trim':
+        if not args.start or not args.end:
+            print("--start and --end are required for trim", file=sys.stderr)
+            return EXIT_USAGE
+        try:
+            start, end = parse_timestamp(args.start), parse_timestamp(args.end)
+        except ValueError:
+            print("--start and --end must be HH:MM:SS or seconds", file=sys.stderr)
+            return EXIT_USAGE
+        if end <= start:
+            print("--end must be after --start", file=sys.stderr)
+            return EXIT_USAGE
+    fmt = args.format
+    if tool == 'extract-audio' and fmt not in downloader.AUDIO_FORMATS:
+        fmt = 'mp3'
+
+    output_dir = args.batch_output or os.path.join(source_root(source), DEFAULT_FOLDERS[tool])
+    inputs = find_inputs(source, args.recursive, exclude_dirs=[output_dir])
+    if not inputs:
+        print(f"No media files found in {source}", file=sys.stderr)
+        return EXIT_USAGE
+    make_job, workers, ext = downloader.batch_tool(tool, fmt, start, end, smart=not args.copy_trim,
+                                                   audio_bitrate=args.audio_quality, files=len(inputs))
+    try:
+        items = plan_batch(inputs, output_dir, args.naming or DEFAULT_NAMING[tool], ext,
+                           source_root(source), skip_up_to_date=not args.force)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return EXIT_USAGE
+
+    progress = {}
+    job = BatchJob(downloader.ffmpeg_path, downloader.media_probe, items, make_job,
+                   workers=args.batch_workers or workers, on_progress=progress.update)
+    if not args.quiet:
+        pending = sum(1 for item in items if item['status'] == 'pending')
+        print(f"{tool}: {len(items)} files, {pending} to process, {job.workers} at a time")
+    worker = threading.Thread(target=job.run, daemon=True)
+    worker.start()
+    interactive = sys.stdout.isatty() and not args.quiet
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+            if interactive and progress:
+                done, total = progress['files']
+                sys.stdout.write(f"\r{progress['percent']:3d}%  {done}/{total} files")
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        print("\nInterrupted, stopping FFmpeg...")
+        job.cancel()
+        worker.join()
+    if interactive:
+        sys.stdout.write("\r" + " " * 40 + "\r")
+
+    for line in describe_batch(items):
+        if not args.quiet or not line.startswith(('DONE', 'SKIPPED')):
+            print(line)
+    print(f"Finished: {summarize_batch(items)}")
+    if any(item['status'] == 'cancelled' for item in items):
+        return EXIT_INTERRUPTED
+    return EXIT_FAILED if any(item['status'] == 'failed' for item in items) else EXIT_OK
+
+
+def main(argv):
+    args = parse_args(argv)
+
+    if args.tuning_report:
+        print(downloader.format_tuning_report())
+        return EXIT_OK
+
+    if not downloader.ffmpeg_path:
+        print(f"FFmpeg not found at {downloader.bundled_ffmpeg_path} or on PATH", file=sys.stderr)
+        return EXIT_USAGE
+
+    needs_encoders = (args.encoder_report or args.benchmark_convert or args.benchmark_profiles or
+                      args.batch or args.format in ('mp4', 'webm', 'mkv'))
+    if args.retest_encoders or (needs_encoders and not downloader.encoder_capabilities.probed):
+        # one-off per FFmpeg build, the results are cached
+        if not args.quiet:
+            print("Testing encoders and hardware acceleration...")
+        downloader.probe_encoders(force=args.retest_encoders)
+    if args.encoder_report:
+        print(downloader.format_encoder_report())
+        return EXIT_OK
+
+    if args.benchmark_convert:
+        return benchmark_convert(args.benchmark_convert, args.format)
+
+    if args.benchmark_profiles:
+        return benchmark_profiles(args.benchmark_profiles, args.format, args.benchmark_seconds, args.hw_accel)
+
+    if args.batch:
+        return run_batch(args)
+
+    try:
+        urls = read_urls(args)
+    except OSError as e:
+        print(f"Error reading input: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    os.makedirs(args.output, exist_ok=True)
+
+    downloader.extract_stage.set_workers(args.extract_workers)
+    download_queue = DownloadQueue(args.workers, args.per_host,
+                                   journal_path=downloader.HEADLESS_QUEUE_JOURNAL_FILE,
+                                   checkpoint_path=downloader.HEADLESS_QUEUE_CHECKPOINT_FILE,
+                                   postprocess_workers=args.postprocess_workers)
+    if not args.resume:
+        download_queue.clear_queue()
+    skipped = 0
+    for url in urls:
+        duplicate = download_queue.add_task(build_task(url, args))
+        if duplicate:
+            skipped += 1
+            if not args.quiet:
+                print(f"Skipping {url}: {downloader.describe_duplicate(duplicate)}")
+
+    if not download_queue.has_tasks():
+        if skipped:
+            return EXIT_OK
+        print("No URLs to download", file=sys.stderr)
+        return EXIT_USAGE
+
+    downloader.optimize_process_priority()
+
+    reporter = TerminalReporter(download_queue, quiet=args.quiet)
+    download_queue.start_workers(lambda q, worker_id: queue_worker(
+        q, worker_id, reporter.toast,
+        status_callback=reporter.status
+    ))
+
+    try:
+        while download_queue.is_running():
+            reporter.render()
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        download_queue.stop()
+        reporter.toast("Interrupted, waiting for workers to stop...", warning=True)
+        download_queue.shutdown()
+        downloader.ydl_pool.clear()
+        if args.speed_log:
+            write_speed_log(args.speed_log)
+        return EXIT_INTERRUPTED
+
+    download_queue.shutdown()
+    downloader.ydl_pool.clear()
+    if args.speed_log:
+        write_speed_log(args.speed_log)
+    stats = download_queue.stats
+    with reporter.lock:
+        reporter.clear_line()
+    print(f"Finished: {stats['done']} downloaded, {stats['error']} failed")
+    for group in download_queue.playlist_groups():
+        print(f"Playlist {downloader.format_playlist_progress(group)}")
+    if args.stage_stats:
+        print(downloader.format_pipeline_report(download_queue))
+    return EXIT_FAILED if stats['error'] else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
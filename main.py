@@ -1,198 +1,64 @@
-import yt_dlp
+import sys
+import time
+
+startup_started = time.perf_counter()
+startup_phases = []
+
+
+def mark_startup(phase):
+    startup_phases.append((phase, time.perf_counter()))
+
+
+if __name__ == '__main__' and '--headless' in sys.argv[1:]:
+    import headless
+
+    sys.exit(headless.main([arg for arg in sys.argv[1:] if arg != '--headless']))
+
 import tkinter as tk
 from tkinter import messagebox, filedialog, simpledialog
 import threading
 import os
-import requests
 from tkinter import ttk
-import sys
+from tkinter import font as tkfont
 import platform
-import time
-import subprocess
-from packaging import version
-from ctypes import windll
-import psutil
-from PIL import Image, ImageTk
-from PIL.Image import Resampling
 from io import BytesIO
 import webbrowser
-import pyperclip
-import json
 from datetime import datetime
-import sqlite3
-import browser_cookie3
 import tempfile
 import shutil
-import hashlib
-import queue
-import ffmpeg
-import re
+import uuid
+from collections import OrderedDict
 import gettext
 
-if getattr(sys, 'frozen', False):
-    BASE_DIR = sys._MEIPASS
-    ffmpeg_dir = os.path.join(BASE_DIR, 'ffmpeg', 'bin')
-else:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    ffmpeg_dir = os.path.join(BASE_DIR, 'ffmpeg', 'bin')
-
-ffmpeg_path = os.path.join(ffmpeg_dir, 'ffmpeg.exe')
-if not os.path.isfile(ffmpeg_path):
-    messagebox.showerror("FFmpeg Missing", f"Не найден ffmpeg.exe по пути:\n{ffmpeg_path}")
+mark_startup("import stdlib and tkinter")
+
+from downloader import (
+    BASE_DIR, FILENAME_TEMPLATES, ffmpeg_path, bundled_ffmpeg_path,
+    DownloadQueue, app_settings, history_store,
+    optimize_process_priority, update_yt_dlp, check_disk_space,
+    get_cookies_from_file, get_hardware_acceleration_methods,
+    download_thread, queue_worker, format_speed,
+    build_extract_opts, extract_info_cached, prefetch_metadata, ydl_pool,
+    host_tuner, format_tuning_report, throughput_tracker, media_probe, conversion_args,
+    probe_encoders, format_encoder_report, encoding_profile, ENCODING_PROFILES, batch_tool,
+    extract_stage, format_pipeline_report, format_playlist_progress, check_archive, describe_duplicate,
+    expands_playlist
+)
+from batch_tools import (BatchJob, DEFAULT_FOLDERS, DEFAULT_NAMING, describe_batch, find_inputs, plan_batch,
+                         source_root, summarize_batch)
+from concat_planner import plan_concat, describe_plan, ConcatJob
+from ffmpeg_jobs import FFmpegJob, FFmpegCancelled, parse_timestamp
+from progress_bus import ProgressBus
+from segment_transcode import SegmentedTranscode, single_args
+from smart_cut import SmartCut
+from throughput import format_eta
+
+mark_startup("import downloader")
+
+if not ffmpeg_path:
+    messagebox.showerror("FFmpeg Missing", f"Не найден ffmpeg.exe по пути:\n{bundled_ffmpeg_path}")
     sys.exit(1)
 
-os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ['PATH']
-
-if getattr(sys, 'frozen', False):
-    if platform.system() == "Windows":
-        app_data_dir = os.path.join(os.getenv('APPDATA'), 'EnhancedYouTubeDownloader')
-    else:
-        app_data_dir = os.path.join(os.path.expanduser('~'), '.EnhancedYouTubeDownloader')
-
-    os.makedirs(app_data_dir, exist_ok=True)
-    HISTORY_FILE = os.path.join(app_data_dir, 'download_history.json')
-    QUEUE_FILE = os.path.join(app_data_dir, 'download_queue.json')
-    SETTINGS_FILE = os.path.join(app_data_dir, 'settings.json')
-else:
-    HISTORY_FILE = os.path.join(BASE_DIR, 'download_history.json')
-    QUEUE_FILE = os.path.join(BASE_DIR, 'download_queue.json')
-    SETTINGS_FILE = os.path.join(BASE_DIR, 'settings.json')
-
-FILENAME_TEMPLATES = [
-    "%(title)s.%(ext)s",
-    "%(uploader)s - %(title)s.%(ext)s",
-    "%(uploader)s_%(title)s.%(ext)s",
-    "%(title)s [%(id)s].%(ext)s",
-    "%(upload_date)s - %(title)s.%(ext)s",
-    "%(uploader)s/%(title)s.%(ext)s"
-]
-
-DEFAULT_SETTINGS = {
-    'theme': 'dark',
-    'auto_update': True,
-    'check_space': True,
-    'min_space_gb': 1,
-    'default_format': 'mp4',
-    'default_quality': 'best',
-    'default_save_path': os.getcwd(),
-    'default_threads': os.cpu_count() or 4,
-    'notifications': True,
-    'hardware_accel': 'auto',
-    'filename_template': '%(title)s.%(ext)s',
-    'default_language': 'en'
-}
-
-
-class FFmpegProgressParser:
-    def __init__(self, total_duration, progress_callback):
-        self.total_duration = total_duration
-        self.progress_callback = progress_callback
-        self.duration_pattern = re.compile(r"Duration: (\d{2}):(\d{2}):(\d{2})\.\d{2}")
-        self.time_pattern = re.compile(r"time=(\d{2}):(\d{2}):(\d{2})\.\d{2}")
-
-    def parse(self, line):
-        if "time=" in line:
-            time_match = self.time_pattern.search(line)
-            if time_match:
-                hours, minutes, seconds = map(int, time_match.groups())
-                current_time = hours * 3600 + minutes * 60 + seconds
-                if self.total_duration > 0:
-                    progress = int((current_time / self.total_duration) * 100)
-                    self.progress_callback(progress)
-
-
-class AppSettings:
-    def __init__(self):
-        self.settings = DEFAULT_SETTINGS.copy()
-        self.load_settings()
-
-    def load_settings(self):
-        try:
-            if os.path.exists(SETTINGS_FILE):
-                with open(SETTINGS_FILE, 'r') as f:
-                    loaded_settings = json.load(f)
-                    for key in self.settings:
-                        if key in loaded_settings:
-                            self.settings[key] = loaded_settings[key]
-        except Exception as e:
-            print(f"Error loading settings: {e}")
-
-    def save_settings(self):
-        try:
-            with open(SETTINGS_FILE, 'w') as f:
-                json.dump(self.settings, f, indent=2)
-        except Exception as e:
-            print(f"Error saving settings: {e}")
-
-    def get(self, key, default=None):
-        return self.settings.get(key, default)
-
-    def set(self, key, value):
-        self.settings[key] = value
-        self.save_settings()
-
-
-class DownloadQueue:
-    def __init__(self):
-        self.queue = queue.Queue()
-        self.current_task = None
-        self.paused = False
-        self.stop_flag = False
-        self.thread = None
-        self.load_queue()
-
-    def add_task(self, task):
-        self.queue.put(task)
-        self.save_queue()
-
-    def get_task(self):
-        if not self.queue.empty():
-            self.current_task = self.queue.get()
-            self.save_queue()
-            return self.current_task
-        return None
-
-    def clear_queue(self):
-        while not self.queue.empty():
-            self.queue.get()
-        self.current_task = None
-        self.save_queue()
-
-    def pause(self):
-        self.paused = True
-
-    def resume(self):
-        self.paused = False
-
-    def stop(self):
-        self.stop_flag = True
-        if self.thread and self.thread.is_alive():
-            self.thread.join()
-
-    def save_queue(self):
-        tasks = []
-        if self.current_task:
-            tasks.append(self.current_task)
-        temp_queue = queue.Queue()
-        while not self.queue.empty():
-            task = self.queue.get()
-            tasks.append(task)
-            temp_queue.put(task)
-        self.queue = temp_queue
-
-        with open(QUEUE_FILE, 'w') as f:
-            json.dump(tasks, f)
-
-    def load_queue(self):
-        try:
-            if os.path.exists(QUEUE_FILE):
-                with open(QUEUE_FILE, 'r') as f:
-                    tasks = json.load(f)
-                    for task in tasks:
-                        self.queue.put(task)
-        except Exception as e:
-            print(f"Error loading queue: {e}")
-
 
 def center_window(window):
     window.update_idletasks()
@@ -220,43 +86,36 @@ def center_window_preview(window):
     window.geometry(f'+{x}+{y}')
 
 
-def optimize_process_priority():
-    try:
-        if platform.system() == "Windows":
-            p = psutil.Process(os.getpid())
-            p.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
-            windll.kernel32.SetPriorityClass(p.pid, 0x00004000)
-        else:
-            os.nice(10)
-            os.system("renice -n 10 -p $$")
-    except Exception:
-        pass
+def print_startup_profile():
+    mark_startup("first idle")
+    previous = startup_started
+    print(f"{'phase':<32}{'ms':>10}{'total ms':>12}")
+    for phase, stamp in startup_phases:
+        print(f"{phase:<32}{(stamp - previous) * 1000:>10.1f}{(stamp - startup_started) * 1000:>12.1f}")
+        previous = stamp
+    deferred = ('yt_dlp', 'requests', 'PIL', 'pyperclip', 'browser_cookie3', 'psutil', 'packaging')
+    eager = [name for name in deferred if name in sys.modules]
+    print(f"modules loaded: {len(sys.modules)}")
+    print(f"deferred modules imported at startup: {', '.join(eager) if eager else 'none'}")
 
 
-optimize_process_priority()
+def warm_up_imports():
+    def worker():
+        try:
+            import yt_dlp  # noqa: F401
+        except Exception as e:
+            print(f"⚠️ Failed to preload yt-dlp: {e}")
 
+    threading.Thread(target=worker, daemon=True).start()
 
-def update_yt_dlp():
-    try:
-        current_version = version.parse(yt_dlp.version.__version__)
-        latest_version = version.parse(subprocess.check_output(
-            [sys.executable, "-m", "yt_dlp", "--version"],
-            stderr=subprocess.PIPE, text=True).strip())
-
-        if latest_version > current_version:
-            subprocess.run(
-                [sys.executable, "-m", "pip", "--disable-pip-version-check", "install", "--upgrade", "yt-dlp"],
-                check=True, capture_output=True)
-            return True
-    except Exception as e:
-        return False
+
+optimize_process_priority()
 
 
 root = tk.Tk()
 root.withdraw()
 center_window(root)
-
-app_settings = AppSettings()
+mark_startup("create root window")
 
 THEMES = {
     'dark': {
@@ -581,61 +440,9 @@ def apply_theme_to_widget(widget, theme):
         apply_theme_to_widget(child, theme)
 
 
-class YTDLPLogger:
-    def __init__(self, log_callback):
-        self.log_callback = log_callback
-        self._lock = threading.Lock()
-
-    def debug(self, msg):
-        pass
-
-    def warning(self, msg):
-        with self._lock:
-            root.after(0, self.log_callback, msg)
-
-    def error(self, msg):
-        with self._lock:
-            root.after(0, self.log_callback, f"❌ {msg}")
-
-
-def save_to_history(url, media_type, quality, codec, save_path, threads, advanced_options):
-    try:
-        history = load_history()
-
-        entry = {
-            'url': url,
-            'media_type': media_type,
-            'quality': quality,
-            'codec': codec if codec else '',
-            'save_path': save_path,
-            'threads': threads if threads else 4,
-            'advanced_options': advanced_options if advanced_options else {},
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-
-        history.append(entry)
-
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(history, f, indent=2)
-
-    except Exception as e:
-        print(f"Error saving history: {e}")
-
-
-def load_history():
-    try:
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, 'r') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return []
-
-
 def clear_history():
     try:
-        if os.path.exists(HISTORY_FILE):
-            os.remove(HISTORY_FILE)
+        history_store.clear()
         update_history_list()
     except Exception as e:
         messagebox.showerror("Error", f"Failed to clear history: {e}")
@@ -643,6 +450,8 @@ def clear_history():
 
 def get_cookies_from_browser(browser_name, domain="youtube.com"):
     try:
+        import browser_cookie3
+
         if browser_name == "chrome":
             cj = browser_cookie3.chrome(domain_name=domain)
         elif browser_name == "firefox":
@@ -669,279 +478,60 @@ def get_cookies_from_browser(browser_name, domain="youtube.com"):
         return None
 
 
-def get_cookies_from_file(file_path):
-    try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-            if not lines:
-                return None
-
-        temp_dir = tempfile.mkdtemp()
-        cookies_file = os.path.join(temp_dir, 'cookies.txt')
-        shutil.copyfile(file_path, cookies_file)
-        return cookies_file
-    except Exception as e:
-        print(f"Error processing cookies file: {e}")
-        return None
-
-
-def check_disk_space(path, min_space_gb=1):
-    try:
-        usage = shutil.disk_usage(path)
-        free_space_gb = usage.free / (1024 ** 3)
-        if free_space_gb < min_space_gb:
-            return False, free_space_gb
-        return True, free_space_gb
-    except Exception as e:
-        print(f"Error checking disk space: {e}")
-        return True, 0
+def ui_toast(message, **kwargs):
+    root.after(0, lambda: show_toast(message, **kwargs))
 
 
-def get_hardware_acceleration_methods():
-    methods = ['auto']
-    try:
-        if platform.system() == "Windows":
-            methods.extend(['cuda', 'dxva2', 'qsv'])
-        elif platform.system() == "Linux":
-            methods.extend(['vaapi', 'vdpau'])
-        elif platform.system() == "Darwin":
-            methods.append('videotoolbox')
-    except:
-        pass
-    return methods
+def ui_warning(message):
+    root.after(0, lambda: messagebox.showwarning("Low Disk Space", message))
 
 
-def optimize_conversion_settings(format_type, hw_accel='auto'):
-    settings = {
-        'threads': os.cpu_count() or 4,
-        'preset': 'fast',
-        'crf': '23',
-        'hwaccel': hw_accel
-    }
+main_download_key = None
 
-    if format_type in ['mp4', 'mkv']:
-        settings.update({
-            'vcodec': 'h264',
-            'acodec': 'aac',
-            'movflags': '+faststart'
-        })
-    elif format_type == 'webm':
-        settings.update({
-            'vcodec': 'libvpx-vp9',
-            'acodec': 'libopus',
-            'deadline': 'realtime'
-        })
-    elif format_type in ['mp3', 'ogg', 'wav', 'm4a', 'flac', 'aac']:
-        settings.update({
-            'acodec': {
-                'mp3': 'libmp3lame',
-                'ogg': 'libvorbis',
-                'wav': 'pcm_s16le',
-                'm4a': 'aac',
-                'flac': 'flac',
-                'aac': 'aac'
-            }.get(format_type, 'copy')
-        })
-        settings.pop('vcodec', None)
-        settings.pop('hwaccel', None)
-
-    return settings
-
-
-def download_thread_wrapper(download_queue):
-    while not download_queue.stop_flag:
-        if download_queue.paused:
-            time.sleep(1)
-            continue
-
-        task = download_queue.get_task()
-        if not task:
-            break
 
-        try:
-            url = task['url']
-            media_type = task['media_type']
-            quality = task['quality']
-            codec = task.get('codec')
-            save_path = task['save_path']
-            threads = task.get('threads', 4)
-            advanced_options = task.get('advanced_options', {})
-
-            if queue_listbox.size() > 0:
-                root.after(0, lambda: queue_listbox.itemconfig(0, {'bg': '#3ca3ff'}))
-
-            download_thread(
-                url, media_type, quality, codec, save_path, threads,
-                show_toast, update_progress,
-                lambda: on_download_complete(download_queue),
-                advanced_options
-            )
+def apply_progress(batch):
+    changed_workers = []
+    for (kind, key), data in batch:
+        if kind == 'download':
+            # an older manual download still running in the background keeps its own numbers
+            if key == main_download_key:
+                update_progress(data)
+        elif key not in changed_workers:
+            changed_workers.append(key)
+    # worker rows are drawn from the queue's own state, one redraw per batch is enough
+    for worker_id in changed_workers:
+        update_worker_row(download_queue, worker_id)
 
-            if queue_listbox.size() > 0:
-                root.after(0, lambda: queue_listbox.itemconfig(0, {'bg': '#8ef58e'}))
 
-        except Exception as e:
-            if queue_listbox.size() > 0:
-                root.after(0, lambda: queue_listbox.itemconfig(0, {'bg': '#ff6b6b'}))
-            show_toast(f"Error processing task: {str(e)}", error=True)
+# yt-dlp calls progress hooks per chunk/fragment, hand Tk at most one batch per interval
+progress_bus = ProgressBus(lambda batch: root.after(0, apply_progress, batch))
 
-    show_toast("Queue processing finished")
-    root.after(0, update_queue_buttons_state)
 
+def ui_download_complete():
+    progress_bus.flush()
+    root.after(0, on_download_complete, download_queue)
 
-def download_thread(url, media_type, quality, codec, save_path, threads, toast_callback,
-                    progress_callback, done_callback, advanced_options=None):
-    try:
-        if not advanced_options:
-            advanced_options = {}
 
-        if app_settings.get('check_space', True):
-            min_space = app_settings.get('min_space_gb', 1)
-            enough_space, free_space = check_disk_space(save_path, min_space)
-            if not enough_space:
-                root.after(0, lambda: messagebox.showwarning(
-                    "Low Disk Space",
-                    f"Warning! Only {free_space:.2f} GB free space left on target drive.\n"
-                    "Download may fail if there's not enough space for the video."
-                ))
-
-        postprocessors = []
-        if media_type in ['mp3', 'ogg', 'wav', 'm4a']:
-            ydl_format = 'bestaudio'
-            postprocessors.append({
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': media_type,
-                'preferredquality': advanced_options.get('audio_quality', '192'),
-            })
-        elif media_type in ['mp4', 'webm', 'mkv']:
-            if quality == 'best':
-                ydl_format = 'best'
-            elif quality.isdigit():
-                ydl_format = f'bestvideo[height<={quality}]+bestaudio/best[height<={quality}]'
-            else:
-                ydl_format = 'best'
-
-            postprocessor_args = [
-                '-threads', str(threads),
-                '-preset', 'fast',
-                '-crf', '23'
-            ]
-
-            hw_accel = advanced_options.get('hw_accel', app_settings.get('hardware_accel', 'auto'))
-            if hw_accel != 'auto':
-                postprocessor_args.extend(['-hwaccel', hw_accel])
-
-            postprocessors.append({
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': media_type,
-            })
-
-        filename_template = advanced_options.get('filename_template',
-                                                 app_settings.get('filename_template', '%(title)s.%(ext)s'))
-
-        ydl_opts = {
-            'format': ydl_format,
-            'outtmpl': os.path.join(save_path, filename_template),
-            'noplaylist': not advanced_options.get('playlist', False),
-            'postprocessors': postprocessors,
-            'quiet': True,
-            'logger': YTDLPLogger(toast_callback),
-            'progress_hooks': [lambda d: root.after(0, progress_callback, d)],
-            'concurrent_fragment_downloads': 8,
-            'http_chunk_size': 1048576,
-            'retries': 10,
-            'fragment_retries': 10,
-            'extractor_args': {
-                'youtube': {
-                    'player_skip': ['js'],
-                    'player_client': ['android']
-                }
-            }
-        }
-
-        if media_type in ['mp4', 'webm', 'mkv']:
-            ydl_opts['postprocessor_args'] = postprocessor_args
-
-        if advanced_options.get('proxy'):
-            proxy = advanced_options['proxy'].strip()
-            if proxy:
-                ydl_opts['proxy'] = proxy
-                toast_callback(f"Using proxy: {proxy}")
-
-        if advanced_options.get('cookies_file'):
-            cookies_file = advanced_options['cookies_file']
-            if cookies_file and os.path.exists(cookies_file):
-                ydl_opts['cookiefile'] = cookies_file
-                toast_callback("Using cookies for authentication")
-
-        if advanced_options.get('subtitles'):
-            ydl_opts.update({
-                'writesubtitles': True,
-                'subtitlesformat': advanced_options.get('subtitle_format', 'srt'),
-                'subtitleslangs': ['all'],
-                'writeautomaticsub': True,
-                'allsubtitles': True,
-                'postprocessors': postprocessors + [{
-                    'key': 'FFmpegSubtitlesConvertor',
-                    'format': advanced_options.get('subtitle_format', 'srt')
-                }]
-            })
-
-        if advanced_options.get('metadata'):
-            ydl_opts['writethumbnail'] = True
-            ydl_opts['writeinfojson'] = True
-            ydl_opts['writedescription'] = True
-            ydl_opts['writeannotations'] = True
-            ydl_opts['writeautomaticsub'] = True
-
-        if codec:
-            if media_type in ['mp3', 'ogg', 'wav', 'm4a']:
-                if 'postprocessor_args' not in ydl_opts:
-                    ydl_opts['postprocessor_args'] = []
-                ydl_opts['postprocessor_args'].extend(['-c:a', codec])
-            else:
-                if 'postprocessor_args' not in ydl_opts:
-                    ydl_opts['postprocessor_args'] = []
-                ydl_opts['postprocessor_args'].extend(['-c:v', codec])
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            title = info.get('title', 'Unknown')
-
-            template = advanced_options.get('filename_template',
-                                            app_settings.get('filename_template', '%(title)s.%(ext)s'))
-            out_filename = ydl.prepare_filename(info)
-            out_path = os.path.join(save_path, out_filename)
-
-            root.last_downloaded_file = out_path
-
-            ydl.download([url])
-
-        if advanced_options.get('cookies_file'):
-            temp_dir = os.path.dirname(advanced_options['cookies_file'])
-            if os.path.exists(temp_dir) and temp_dir.startswith(tempfile.gettempdir()):
-                try:
-                    shutil.rmtree(temp_dir)
-                except Exception as e:
-                    toast_callback(f"Failed to clean up cookies temp files: {e}", warning=True)
-
-        save_to_history(url, media_type, quality, codec, save_path, threads, advanced_options)
-        update_history_list()
+def download_thread_wrapper(download_queue, worker_id):
+    queue_worker(
+        download_queue, worker_id, ui_toast,
+        progress_callback=lambda wid, d: progress_bus.post(('worker', wid), d),
+        status_callback=lambda wid: root.after(0, update_queue_list),
+        finished_callback=lambda: root.after(0, on_queue_finished),
+        warning_callback=ui_warning
+    )
 
-        root.after(0, done_callback)
-        show_toast(f"Download complete: {title}", success=True)
 
-    except Exception as e:
-        show_toast(f"Error: {str(e)}", error=True)
+def on_queue_finished():
+    show_toast("Queue processing finished", success=True)
+    update_queue_list()
+    update_queue_buttons_state()
 
 
 def on_download_complete(download_queue):
     if app_settings.get('notifications', True):
         complete_label.place(relx=0.5, rely=0.96, anchor="s")
         root.after(3000, lambda: complete_label.place_forget())
-    if download_queue.current_task:
-        download_queue.current_task = None
-        download_queue.save_queue()
     update_queue_list()
 
 
@@ -1000,33 +590,52 @@ def add_to_queue():
         'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    download_queue.add_task(task)
+    duplicate = download_queue.add_task(task)
+    if duplicate:
+        if not download_again(url, duplicate):
+            return
+        task['force'] = True
+        download_queue.add_task(task)
+    # a playlist is expanded by the worker, its entries are prefetched once they are queued
+    if not expands_playlist(task):
+        prefetch_metadata(url, advanced_options)
     show_toast(f"Added to queue: {url}")
     update_queue_list()
     update_queue_buttons_state()
 
 
+def download_again(url, duplicate):
+    status, path = duplicate
+    if status != 'downloaded':
+        show_toast(f"Skipped {url}: {describe_duplicate(duplicate)}", success=status == 'linked')
+        return False
+    return messagebox.askyesno("Already downloaded",
+                               f"{url}\nwas already downloaded to\n{path}\n\nDownload it again?")
+
+
 def start_queue():
-    if not download_queue.thread or not download_queue.thread.is_alive():
+    if not download_queue.is_running():
         download_queue.stop_flag = False
-        download_queue.paused = False
-        download_queue.thread = threading.Thread(
-            target=download_thread_wrapper,
-            args=(download_queue,),
-            daemon=True
+        download_queue.resume()
+        download_queue.set_limits(
+            app_settings.get('max_concurrent_downloads', 3),
+            app_settings.get('per_host_limit', 2),
+            app_settings.get('postprocess_workers', 1)
         )
-        download_queue.thread.start()
+        download_queue.start_workers(download_thread_wrapper)
         show_toast("Queue processing started")
     else:
         download_queue.resume()
         show_toast("Queue resumed")
 
+    update_queue_list()
     update_queue_buttons_state()
 
 
 def pause_queue():
     download_queue.pause()
     show_toast("Queue paused")
+    update_queue_list()
     update_queue_buttons_state()
 
 
@@ -1043,29 +652,95 @@ def clear_queue():
     update_queue_buttons_state()
 
 
+def retry_failed():
+    count = download_queue.retry_failed()
+    show_toast(f"{count} failed downloads queued again" if count else "No failed downloads to retry")
+    update_queue_list()
+    update_queue_buttons_state()
+
+
+WORKER_STATUS_ICONS = {
+    'idle': '💤',
+    'downloading': '🔄',
+    'processing': '⚙',
+    'done': '✅',
+    'error': '❌',
+    'cancelled': '⏹'
+}
+
+WORKER_STATUS_COLORS = {
+    'downloading': '#3ca3ff',
+    'processing': '#3ca3ff',
+    'done': '#8ef58e',
+    'error': '#ff6b6b'
+}
+
+
+def task_label(task):
+    if task.get('group'):
+        return f"{task.get('group_title', '')} #{task.get('playlist_index')}: {task.get('title') or task.get('url', '')}"
+    return task.get('url', '')
+
+
+def format_worker_row(worker_id, worker, paused=False):
+    task = worker.get('task')
+    icon = '⏸' if paused and worker['status'] in ('downloading', 'processing') \
+        else WORKER_STATUS_ICONS.get(worker['status'], '🔄')
+    if not task:
+        return f"{icon} #{worker_id + 1} {worker['status']}"
+    rate = ""
+    if worker['status'] == 'downloading' and worker.get('speed'):
+        rate = f" {format_speed(worker['speed'])} ETA {format_eta(worker.get('eta'))}"
+    return (f"{icon} #{worker_id + 1} [{worker['percent']}%]{rate} "
+            f"{task_label(task)} ({task.get('media_type', '')})")
+
+
+def update_worker_row(download_queue, worker_id):
+    workers, _pending = download_queue.snapshot()
+    worker_ids = sorted(workers)
+    if worker_id not in workers or queue_listbox.size() < len(worker_ids):
+        update_queue_list()
+        return
+    index = worker_ids.index(worker_id)
+    worker = workers[worker_id]
+    queue_listbox.delete(index)
+    queue_listbox.insert(index, format_worker_row(worker_id, worker, download_queue.paused))
+    color = WORKER_STATUS_COLORS.get(worker['status'])
+    if color:
+        queue_listbox.itemconfig(index, {'bg': color})
+
+
 def update_queue_list():
     queue_listbox.delete(0, tk.END)
 
-    if download_queue.current_task:
-        url = download_queue.current_task.get('url', '')
-        media_type = download_queue.current_task.get('media_type', '')
-        queue_listbox.insert(tk.END, f"🔄 {url} ({media_type})")
-        queue_listbox.itemconfig(0, {'bg': '#3ca3ff'})
+    workers, pending = download_queue.snapshot()
+    for worker_id in sorted(workers):
+        worker = workers[worker_id]
+        queue_listbox.insert(tk.END, format_worker_row(worker_id, worker, download_queue.paused))
+        color = WORKER_STATUS_COLORS.get(worker['status'])
+        if color:
+            queue_listbox.itemconfig(tk.END, {'bg': color})
+
+    for entry in download_queue.processing_tasks():
+        task = entry['task']
+        icon = WORKER_STATUS_ICONS['processing'] if entry['status'] == 'processing' else '⏳'
+        queue_listbox.insert(tk.END, f"{icon} {entry['status']} {task_label(task)} ({task.get('media_type', '')})")
 
-    temp_queue = queue.Queue()
-    while not download_queue.queue.empty():
-        task = download_queue.queue.get()
-        url = task.get('url', '')
+    for group in download_queue.playlist_groups():
+        queue_listbox.insert(tk.END, f"📃 {format_playlist_progress(group)}")
+
+    for task in pending:
         media_type = task.get('media_type', '')
-        queue_listbox.insert(tk.END, f"⏳ {url} ({media_type})")
-        temp_queue.put(task)
-    download_queue.queue = temp_queue
+        saved = download_queue.checkpoints.progress(task['id'])
+        suffix = f" — {saved}% saved" if saved else ""
+        retry = f" (retry {task['attempts']})" if task.get('attempts') else ""
+        queue_listbox.insert(tk.END, f"⏳ {task_label(task)} ({media_type}){retry}{suffix}")
 
 
 def update_queue_buttons_state():
-    is_processing = download_queue.thread and download_queue.thread.is_alive()
+    is_processing = download_queue.is_running()
     is_paused = download_queue.paused
-    has_tasks = not download_queue.queue.empty() or download_queue.current_task
+    has_tasks = download_queue.has_tasks()
 
     if is_processing:
         if is_paused:
@@ -1082,6 +757,7 @@ def update_queue_buttons_state():
         queue_stop_button.config(state=tk.DISABLED)
 
     queue_clear_button.config(state=tk.NORMAL if has_tasks else tk.DISABLED)
+    queue_retry_button.config(state=tk.NORMAL if download_queue.failed else tk.DISABLED)
 
 
 def repeat_download(entry):
@@ -1138,15 +814,164 @@ def repeat_download(entry):
     root.after(0, set_values)
 
 
-def update_history_list():
-    history = load_history()
-    history_listbox.delete(0, tk.END)
+def format_history_row(entry):
+    timestamp = entry.get('timestamp', '')
+    url = entry.get('url', '')
+    media_type = entry.get('media_type', '')
+    return f"{timestamp} - {url} ({media_type})"
+
+
+class HistoryView:
+    PAGE_SIZE = 100
+    MAX_CACHED_PAGES = 20
+
+    def __init__(self, master, store):
+        self.store = store
+        self.frame = tk.Frame(master)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox = tk.Listbox(
+            self.frame,
+            font=("Segoe UI", 9),
+            height=15,
+            activestyle="none",
+            exportselection=False
+        )
+        self.listbox.pack(side=tk.LEFT, fill="both", expand=True)
+
+        self.row_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+        self.visible = 15
+        self.offset = 0
+        self.total = 0
+        self.snapshot_id = 0
+        self.fresh = []
+        self.pages = OrderedDict()
+        self.rendered_ids = []
+        self.selected_id = None
+        self.loaded = False
+
+        self.listbox.bind("<Configure>", self.on_resize)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-3 * int(e.delta / 120)))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(3))
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.listbox.bind("<Up>", lambda e: self.move_selection(-1))
+        self.listbox.bind("<Down>", lambda e: self.move_selection(1))
+        self.listbox.bind("<Prior>", lambda e: self.scroll(-self.visible))
+        self.listbox.bind("<Next>", lambda e: self.scroll(self.visible))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def show(self):
+        if self.loaded:
+            self.render()
+        else:
+            self.reload()
+
+    def reload(self):
+        # rows newer than the snapshot live in self.fresh, so cached pages never shift
+        self.snapshot_id = self.store.max_id()
+        self.fresh = []
+        self.pages.clear()
+        self.total = self.store.count(before_id=self.snapshot_id)
+        self.offset = 0
+        self.selected_id = None
+        self.loaded = True
+        self.render()
+
+    def add_entry(self, entry):
+        if not self.loaded:
+            return
+        self.fresh.insert(0, entry)
+        self.total = len(self.fresh) + self.store.count(before_id=self.snapshot_id)
+        if self.offset > 0:
+            self.offset += 1
+        self.render()
+
+    def entry_at(self, index):
+        if index < len(self.fresh):
+            return self.fresh[index]
+
+        page_no, row = divmod(index - len(self.fresh), self.PAGE_SIZE)
+        page = self.pages.get(page_no)
+        if page is None:
+            page = self.store.page(page_no * self.PAGE_SIZE, self.PAGE_SIZE, before_id=self.snapshot_id)
+            self.pages[page_no] = page
+            if len(self.pages) > self.MAX_CACHED_PAGES:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_no)
+        return page[row] if row < len(page) else None
+
+    def render(self):
+        self.offset = max(0, min(self.offset, self.total - self.visible))
+        self.listbox.delete(0, tk.END)
+        self.rendered_ids = []
+
+        for index in range(self.offset, min(self.offset + self.visible, self.total)):
+            entry = self.entry_at(index)
+            if entry is None:
+                break
+            self.listbox.insert(tk.END, format_history_row(entry))
+            self.rendered_ids.append(entry['id'])
+            if entry['id'] == self.selected_id:
+                self.listbox.selection_set(tk.END)
+
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min(1.0, (self.offset + self.visible) / self.total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        if rows:
+            self.offset += rows
+            self.render()
+        return "break"
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.offset = int(float(value) * self.total)
+        elif action == "scroll":
+            self.offset += int(value) * (self.visible if unit == "pages" else 1)
+        self.render()
+
+    def on_resize(self, event):
+        visible = max(1, (event.height - 4) // self.row_height)
+        if visible != self.visible:
+            self.visible = visible
+            if self.loaded:
+                self.render()
+
+    def on_select(self, event=None):
+        selection = self.listbox.curselection()
+        if selection and selection[0] < len(self.rendered_ids):
+            self.selected_id = self.rendered_ids[selection[0]]
+
+    def move_selection(self, step):
+        if self.selected_id in self.rendered_ids:
+            index = self.offset + self.rendered_ids.index(self.selected_id) + step
+        else:
+            index = self.offset
+        index = max(0, min(index, self.total - 1))
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.visible:
+            self.offset = index - self.visible + 1
+        entry = self.entry_at(index)
+        if entry:
+            self.selected_id = entry['id']
+        self.render()
+        return "break"
+
+    def selected_entry(self):
+        if self.selected_id is None:
+            return None
+        return self.store.get(self.selected_id)
+
 
-    for entry in reversed(history):
-        timestamp = entry.get('timestamp', '')
-        url = entry.get('url', '')
-        media_type = entry.get('media_type', '')
-        history_listbox.insert(0, f"{timestamp} - {url} ({media_type})")
+def update_history_list():
+    history_view.reload()
 
 
 def show_toast(message, success=False, error=False, warning=False):
@@ -1180,8 +1005,7 @@ def show_toast(message, success=False, error=False, warning=False):
 
 
 if not getattr(sys, 'frozen', False) and app_settings.get('auto_update', True):
-    update_thread = threading.Thread(target=update_yt_dlp, daemon=True)
-    update_thread.start()
+    root.after(5000, lambda: threading.Thread(target=update_yt_dlp, daemon=True).start())
 
 root.deiconify()
 root.title("Enhanced YouTube Downloader")
@@ -1198,7 +1022,11 @@ root.resizable(False, False)
 
 save_path = tk.StringVar(value=app_settings.get('default_save_path', os.getcwd()))
 
-download_queue = DownloadQueue()
+download_queue = DownloadQueue(
+    app_settings.get('max_concurrent_downloads', 3),
+    app_settings.get('per_host_limit', 2),
+    postprocess_workers=app_settings.get('postprocess_workers', 1)
+)
 
 main_frame = tk.Frame(root)
 search_frame = tk.Frame(root)
@@ -1225,7 +1053,7 @@ for frame in (main_frame, search_frame, advanced_frame, history_frame):
 def show_frame(f):
     f.tkraise()
     if f == history_frame:
-        update_history_list()
+        history_view.show()
     elif f == queue_frame:
         update_queue_list()
         update_queue_buttons_state()
@@ -1246,43 +1074,15 @@ def choose_folder():
                 )
 
 
-def format_speed(speed):
-    if speed is None:
-        return "N/A"
-    speed = float(speed)
-    if speed > 1024 * 1024:
-        return f"{speed / (1024 * 1024):.2f} MB/s"
-    elif speed > 1024:
-        return f"{speed / 1024:.2f} KB/s"
-    else:
-        return f"{speed:.2f} B/s"
+def update_progress(view):
+    if view['status'] == 'downloading':
+        if view['percent'] is not None:
+            progress_var.set(view['percent'])
+            progress_label.config(text=f"{view['percent']}%")
+        if view['speed'] is not None:
+            speed_label.config(text=f"Speed: {format_speed(view['speed'])}  ETA: {format_eta(view['eta'])}")
 
-
-last_update_time = 0
-last_downloaded = 0
-
-
-def update_progress(data):
-    global last_update_time, last_downloaded
-
-    if data.get('status') == 'downloading':
-        current_time = time.time()
-        elapsed = current_time - last_update_time if last_update_time and (
-                current_time - last_update_time) > 0.001 else 0.001
-        downloaded = data.get('downloaded_bytes', 0)
-        total = data.get('total_bytes') or data.get('total_bytes_estimate')
-
-        if total:
-            percent = int(downloaded / total * 100)
-            progress_var.set(percent)
-            speed = (downloaded - last_downloaded) / elapsed if last_downloaded and elapsed > 0 else 0
-            speed_label.config(text=f"Speed: {format_speed(speed)}")
-            progress_label.config(text=f"{percent}%")
-
-        last_update_time = current_time
-        last_downloaded = downloaded
-
-    elif data.get('status') == 'finished':
+    elif view['status'] == 'finished':
         progress_var.set(100)
         speed_label.config(text="Speed: Completed")
         progress_label.config(text="100%")
@@ -1290,6 +1090,8 @@ def update_progress(data):
 
 def paste_from_clipboard():
     try:
+        import pyperclip
+
         clipboard_content = pyperclip.paste()
         if clipboard_content.startswith(('http://', 'https://')):
             url_entry.delete(0, tk.END)
@@ -1338,39 +1140,19 @@ def preview_video():
         video_info_label.config(text=info_text)
 
     def fetch_info():
-        try:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'force_generic_extractor': True,
-                'socket_timeout': 10,
-                'extractor_args': {
-                    'youtube': {
-                        'skip': ['dash', 'hls'],
-                        'player_client': ['android']
-                    }
-                },
-                'noplaylist': True,
-                'simulate': True,
-                'forceurl': True,
-                'forcetitle': True,
-                'forceduration': True,
-                'forcethumbnail': True
-            }
+        import yt_dlp
 
+        try:
+            advanced_options = {}
             if hasattr(security_frame, 'proxy_var'):
-                proxy = security_frame.proxy_var.get().strip()
-                if proxy:
-                    ydl_opts['proxy'] = proxy
-
+                advanced_options['proxy'] = security_frame.proxy_var.get().strip()
             if hasattr(security_frame, 'cookies_file'):
-                cookies_file = security_frame.cookies_file
-                if cookies_file and os.path.exists(cookies_file):
-                    ydl_opts['cookiefile'] = cookies_file
+                advanced_options['cookies_file'] = security_frame.cookies_file
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+            with ydl_pool.acquire(build_extract_opts(advanced_options)) as ydl:
+                info, _cached = extract_info_cached(ydl, url)
+                if info and info.get('_type', 'video') != 'video':
+                    info = ydl.process_ie_result(info, download=False)
 
             if not info:
                 preview_window.after(0, lambda: update_ui("❌ Failed to get video info"))
@@ -1401,6 +1183,10 @@ def preview_video():
                                 'https': proxy
                             }
 
+                    import requests
+                    from PIL import Image, ImageTk
+                    from PIL.Image import Resampling
+
                     response = requests.get(thumbnail_url, timeout=10, proxies=proxies)
                     if response.status_code == 200:
                         img = Image.open(BytesIO(response.content))
@@ -1414,9 +1200,9 @@ def preview_video():
             preview_window.after(0, lambda: update_ui(info_text))
 
         except yt_dlp.utils.DownloadError as e:
-            preview_window.after(0, lambda: update_ui(f"❌ Download Error: {str(e)}"))
+            preview_window.after(0, update_ui, f"❌ Download Error: {str(e)}")
         except Exception as e:
-            preview_window.after(0, lambda: update_ui(f"❌ Unexpected error: {str(e)}"))
+            preview_window.after(0, update_ui, f"❌ Unexpected error: {str(e)}")
 
     threading.Thread(target=fetch_info, daemon=True).start()
 
@@ -1490,9 +1276,7 @@ def clear_cookies():
 
 
 def start_download():
-    global last_update_time, last_downloaded
-    last_update_time = 0
-    last_downloaded = 0
+    global main_download_key
 
     url = url_entry.get().strip()
     media_type = format_var.get().strip()
@@ -1537,14 +1321,27 @@ def start_download():
         messagebox.showerror("Error", "Please fill all required fields and select a folder.")
         return
 
+    duplicate = check_archive({'url': url, 'media_type': media_type, 'quality': quality, 'codec': codec,
+                               'save_path': folder, 'advanced_options': advanced_options})
+    if duplicate and not download_again(url, duplicate):
+        return
+
     progress_var.set(0)
     speed_label.config(text="Speed: -")
     progress_label.config(text="0%")
 
+    download_key = main_download_key = uuid.uuid4().hex
+
+    def on_progress(d):
+        view = throughput_tracker.update(download_key, d, label=url)
+        progress_bus.post(('download', download_key), view)
+
     threading.Thread(
         target=download_thread,
-        args=(url, media_type, quality, codec, folder, threads, show_toast,
-              update_progress, lambda: on_download_complete(download_queue), advanced_options),
+        args=(url, media_type, quality, codec, folder, threads, ui_toast,
+              on_progress,
+              ui_download_complete, advanced_options),
+        kwargs={'warning_callback': ui_warning},
         daemon=True
     ).start()
 
@@ -1736,6 +1533,8 @@ video_info_label.pack(padx=28, pady=(3, 5), anchor="w")
 complete_label = tk.Label(main_frame, text=_("✅ Download complete!"),
                           font=("Segoe UI", 12, "bold"))
 
+mark_startup("build main frame")
+
 advanced_frame_inner = tk.Frame(advanced_frame)
 advanced_frame_inner.place(relwidth=1, relheight=1)
 
@@ -1820,10 +1619,34 @@ hw_accel_menu.config(highlightthickness=0)
 hw_accel_menu['menu'].config()
 add_advanced_row(advanced_form_frame, _("⚡ Hardware acceleration:"), hw_accel_menu)
 
+
+def refresh_hw_accel_menu():
+    methods = get_hardware_acceleration_methods()
+    menu = hw_accel_menu['menu']
+    menu.delete(0, tk.END)
+    for method in methods:
+        menu.add_command(label=method, command=lambda value=method: advanced_frame.hw_accel_var.set(value))
+    if advanced_frame.hw_accel_var.get() not in methods:
+        # the saved method did not survive the test on this machine
+        advanced_frame.hw_accel_var.set('auto')
+
+
+def start_encoder_probe(force=False, on_done=None):
+    def worker():
+        probe_encoders(force=force)
+        root.after(0, refresh_hw_accel_menu)
+        if on_done:
+            root.after(0, on_done)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+
 tk.Button(advanced_frame_inner, text=_("⬅ Back"), command=lambda: show_frame(main_frame),
           relief="flat",
           font=("Segoe UI", 10)).pack(padx=28, pady=20, fill="x")
 
+mark_startup("build advanced frame")
+
 security_frame_inner = tk.Frame(security_frame)
 security_frame_inner.place(relwidth=1, relheight=1)
 
@@ -1893,6 +1716,8 @@ tk.Button(security_frame_inner, text=_("⬅ Back"), command=lambda: show_frame(m
           relief="flat",
           font=("Segoe UI", 10)).pack(padx=28, pady=20, fill="x")
 
+mark_startup("build security frame")
+
 queue_frame_inner = tk.Frame(queue_frame)
 queue_frame_inner.place(relwidth=1, relheight=1)
 
@@ -1942,6 +1767,15 @@ queue_stop_button = tk.Button(
 )
 queue_stop_button.pack(side=tk.LEFT, expand=True, fill="x", padx=2)
 
+queue_retry_button = tk.Button(
+    queue_buttons_frame,
+    text=_("🔁 Retry failed"),
+    command=retry_failed,
+    relief="flat",
+    font=("Segoe UI", 10)
+)
+queue_retry_button.pack(side=tk.LEFT, expand=True, fill="x", padx=2)
+
 queue_clear_button = tk.Button(
     queue_buttons_frame,
     text=_("🗑 Clear"),
@@ -1952,6 +1786,26 @@ queue_clear_button = tk.Button(
 queue_clear_button.pack(side=tk.LEFT, expand=True, fill="x", padx=2)
 queue_clear_button.config(bg="#f43535", fg="white")
 
+
+def export_speed_log():
+    path = filedialog.asksaveasfilename(
+        title="Export speed log",
+        defaultextension=".csv",
+        filetypes=[("CSV files", "*.csv")],
+        initialfile=f"speed_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    )
+    if not path:
+        return
+    try:
+        samples = throughput_tracker.export(path)
+        show_toast(f"Exported {samples} speed samples", success=True)
+    except OSError as e:
+        messagebox.showerror("Error", f"Failed to export speed log: {e}")
+
+
+tk.Button(queue_frame_inner, text="📤 Export speed log", command=export_speed_log,
+          relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(5, 0), fill="x")
+
 tk.Button(queue_frame_inner, text=_("⬅ Back"), command=lambda: show_frame(main_frame),
           relief="flat",
           font=("Segoe UI", 10)).pack(padx=28, pady=20, fill="x")
@@ -1961,6 +1815,8 @@ search_results = tk.StringVar()
 
 
 def search_sites():
+    import requests
+
     query = search_input.get().strip()
     if not query:
         search_results.set("Please enter a search query.")
@@ -1991,6 +1847,8 @@ def search_sites():
         search_results.set(f"An unexpected error occurred: {e}")
 
 
+mark_startup("build queue frame")
+
 search_frame_inner = tk.Frame(search_frame)
 search_frame_inner.place(relwidth=1, relheight=1)
 
@@ -2027,6 +1885,8 @@ tk.Button(search_frame_inner, text=_("⬅ Back"), command=lambda: show_frame(mai
           relief="flat",
           font=("Segoe UI", 10)).pack(padx=28, pady=(0, 30), fill="x")
 
+mark_startup("build search frame")
+
 history_frame_inner = tk.Frame(history_frame)
 history_frame_inner.place(relwidth=1, relheight=1)
 
@@ -2039,12 +1899,9 @@ tk.Label(
     justify="left"
 ).pack(padx=28, pady=(20, 10), fill="x", anchor="w")
 
-history_listbox = tk.Listbox(
-    history_frame_inner,
-    font=("Segoe UI", 9),
-    height=15
-)
-history_listbox.pack(padx=28, pady=10, fill="both", expand=True)
+history_view = HistoryView(history_frame_inner, history_store)
+history_view.pack(padx=28, pady=10, fill="both", expand=True)
+history_store.listeners.append(lambda entry: root.after(0, history_view.add_entry, entry))
 
 history_buttons_frame = tk.Frame(history_frame_inner)
 history_buttons_frame.pack(padx=28, pady=5, fill="x")
@@ -2061,14 +1918,11 @@ tk.Button(history_buttons_frame, text=_("🗑 Clear History"),
 
 
 def repeat_selected_download():
-    selection = history_listbox.curselection()
-    if not selection:
+    entry = history_view.selected_entry()
+    if not entry:
         messagebox.showwarning("No Selection", "Please select an item from history")
         return
 
-    history = load_history()
-    index = len(history) - 1 - selection[0]
-    entry = history[index]
     repeat_download(entry)
 
 
@@ -2076,6 +1930,8 @@ tk.Button(history_frame_inner, text=_("⬅ Back"), command=lambda: show_frame(ma
           relief="flat",
           font=("Segoe UI", 10)).pack(padx=28, pady=20, fill="x")
 
+mark_startup("build history frame")
+
 tk.Label(tools_frame,
          text=_("🎬 Tools"),
          justify="left",
@@ -2146,6 +2002,113 @@ audio_quality_menu['menu'].config(
 audio_quality_menu.pack(padx=28, pady=5, fill="x")
 
 
+class FFmpegJobWindow:
+    def __init__(self, title, message):
+        self.job = None
+        self.cancelled = False
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.geometry("400x170")
+        center_window_preview(self.window)
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        tk.Label(self.window, text=message, font=("Segoe UI", 10)).pack(pady=10)
+
+        self.progress_var = tk.IntVar()
+        ttk.Progressbar(
+            self.window,
+            variable=self.progress_var,
+            maximum=100,
+            style="TProgressbar"
+        ).pack(fill="x", padx=20, pady=10)
+
+        self.status_label = tk.Label(self.window, text="0%", font=("Segoe UI", 10))
+        self.status_label.pack()
+
+        self.cancel_button = tk.Button(self.window, text="⏹ Cancel", command=self.cancel,
+                                       relief="flat", font=("Segoe UI", 10))
+        self.cancel_button.pack(pady=5)
+
+    def update(self, progress):
+        if not self.window.winfo_exists():
+            return
+        self.progress_var.set(progress['percent'])
+        details = [f"{progress['percent']}%"]
+        if progress['speed']:
+            details.append(f"{progress['speed']:.2f}x")
+        if progress['fps']:
+            details.append(f"{progress['fps']:.0f} fps")
+        if progress.get('files'):
+            details.append("{}/{} files".format(*progress['files']))
+        self.status_label.config(text="  ·  ".join(details))
+
+    def cancel(self):
+        if self.job:
+            self.cancel_button.config(state=tk.DISABLED, text="Cancelling...")
+            threading.Thread(target=self.job.cancel, daemon=True).start()
+        else:
+            self.cancelled = True
+            self.close()
+
+    def close(self):
+        if self.window.winfo_exists():
+            self.window.destroy()
+
+    def succeed(self, message):
+        self.close()
+        messagebox.showinfo("Success", message)
+
+    def fail(self, message):
+        self.close()
+        messagebox.showerror("Error", message)
+
+
+def run_tool_job(title, message, success_message, make_job, error_prefix="An error occurred", cleanup=None,
+                 on_success=None):
+    window = FFmpegJobWindow(title, message)
+
+    def job_thread():
+        try:
+            window.job = make_job(lambda progress: root.after(0, window.update, progress))
+            if window.cancelled:
+                window.job.cancel()
+            result = window.job.run()
+            if on_success:
+                root.after(0, window.close)
+                root.after(0, on_success, result)
+            else:
+                root.after(0, window.succeed, success_message)
+        except FFmpegCancelled:
+            root.after(0, window.close)
+        except Exception as e:
+            root.after(0, window.fail, f"{error_prefix}: {e}")
+        finally:
+            if cleanup:
+                cleanup()
+
+    threading.Thread(target=job_thread, daemon=True).start()
+    return window
+
+
+def run_ffmpeg_job(title, message, success_message, args, output_file, duration=None, duration_files=(),
+                   error_prefix="An error occurred", cleanup=None):
+    def make_job(on_progress):
+        total = duration if duration is not None else media_probe.total_duration(duration_files)
+        return FFmpegJob(ffmpeg_path, args, duration=total, output=output_file, on_progress=on_progress)
+
+    return run_tool_job(title, message, success_message, make_job, error_prefix=error_prefix, cleanup=cleanup)
+
+
+AUDIO_CODECS = {
+    "mp3": "libmp3lame",
+    "wav": "pcm_s16le",
+    "ogg": "libvorbis",
+    "m4a": "aac",
+    "flac": "flac",
+    "aac": "aac"
+}
+
+
 def run_audio_extraction():
     video_file = filedialog.askopenfilename(
         title="Select video file",
@@ -2154,32 +2117,6 @@ def run_audio_extraction():
     if not video_file:
         return
 
-    progress_window = tk.Toplevel(root)
-    progress_window.title("Extracting Audio")
-    progress_window.geometry("400x150")
-    center_window_preview(progress_window)
-
-    tk.Label(progress_window, text="Extracting audio...", font=("Segoe UI", 10)).pack(pady=10)
-
-    progress_var = tk.IntVar()
-    progress_bar = ttk.Progressbar(
-        progress_window,
-        variable=progress_var,
-        maximum=100,
-        style="TProgressbar"
-    )
-    progress_bar.pack(fill="x", padx=20, pady=10)
-
-    status_label = tk.Label(progress_window, text="0%", font=("Segoe UI", 10))
-    status_label.pack()
-
-    def update_progress(percent):
-        progress_var.set(percent)
-        status_label.config(text=f"{percent}%")
-        if percent >= 100:
-            progress_window.destroy()
-            messagebox.showinfo("Success", "Audio extraction completed successfully!")
-
     base_name = os.path.splitext(os.path.basename(video_file))[0]
     audio_format = audio_format_var.get()
 
@@ -2189,60 +2126,18 @@ def run_audio_extraction():
         defaultextension=f".{audio_format}",
         filetypes=[(f"{audio_format.upper()} files", f"*.{audio_format}"), ("All files", "*.*")]
     )
-
     if not output_file:
-        progress_window.destroy()
         return
 
-    def extract_audio_thread():
-        try:
-            duration = get_video_duration(video_file)
-            quality = audio_quality_var.get()
-
-            codec_map = {
-                "mp3": "libmp3lame",
-                "wav": "pcm_s16le",
-                "ogg": "libvorbis",
-                "m4a": "aac",
-                "flac": "flac",
-                "aac": "aac"
-            }
-
-            cmd = [
-                ffmpeg_path,
-                '-y',
-                '-i', video_file,
-                '-vn',
-                '-acodec', codec_map[audio_format],
-                '-b:a', f"{quality}k",
-                '-progress', 'pipe:1',
-                output_file
-            ]
-
-            process = subprocess.Popen(
-                cmd,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                universal_newlines=True
-            )
-
-            for line in process.stderr:
-                if 'time=' in line:
-                    time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2})\.\d{2}', line)
-                    if time_match and duration > 0:
-                        h, m, s = map(int, time_match.groups())
-                        current_time = h * 3600 + m * 60 + s
-                        percent = int((current_time / duration) * 100)
-                        root.after(0, update_progress, percent)
-
-            process.wait()
-            root.after(0, lambda: update_progress(100))
-
-        except Exception as e:
-            root.after(0, progress_window.destroy)
-            root.after(0, lambda: messagebox.showerror("Error", f"An error occurred: {str(e)}"))
-
-    threading.Thread(target=extract_audio_thread, daemon=True).start()
+    args = [
+        '-i', video_file,
+        '-vn',
+        '-acodec', AUDIO_CODECS[audio_format],
+        '-b:a', f"{audio_quality_var.get()}k",
+        output_file
+    ]
+    run_ffmpeg_job("Extracting Audio", "Extracting audio...", "Audio extraction completed successfully!",
+                   args, output_file, duration_files=[video_file])
 
 
 tk.Button(
@@ -2253,6 +2148,14 @@ tk.Button(
     font=("Segoe UI", 11)
 ).pack(padx=28, pady=20, fill="x")
 
+tk.Button(
+    tools_extract_frame,
+    text=_("📂 Extract from a folder..."),
+    command=lambda: open_batch_dialog('extract-audio'),
+    relief="flat",
+    font=("Segoe UI", 10)
+).pack(padx=28, pady=(0, 10), fill="x")
+
 tk.Button(
     tools_extract_frame,
     text=_("⬅ Back"),
@@ -2273,24 +2176,11 @@ tk.Label(tools_convert_frame, text=_("Enter output format (e.g., mp4, mkv, avi):
 convert_format_var = tk.StringVar(value="mp4")
 tk.Entry(tools_convert_frame, textvariable=convert_format_var, **entry_style).pack(padx=28, pady=5, fill="x")
 
-
-def get_video_duration(file_path):
-    try:
-        result = subprocess.run(
-            [ffmpeg_path, '-i', file_path],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            text=True
-        )
-
-        for line in result.stderr.split('\n'):
-            if 'Duration:' in line:
-                time_str = line.split('Duration:')[1].split(',')[0].strip()
-                h, m, s = time_str.split(':')
-                return int(h) * 3600 + int(m) * 60 + float(s)
-        return 0
-    except Exception:
-        return 0
+convert_parallel_var = tk.BooleanVar(value=app_settings.get('parallel_convert', True))
+tk.Checkbutton(tools_convert_frame, text=_("⚡ Encode in parallel (split at keyframes)"), variable=convert_parallel_var,
+               activebackground="#0b1a2f", font=("Segoe UI", 10),
+               command=lambda: app_settings.set('parallel_convert', convert_parallel_var.get())
+               ).pack(padx=28, pady=5, anchor="w")
 
 
 def convert_video():
@@ -2298,92 +2188,38 @@ def convert_video():
     if not infile:
         return
 
-    progress_window = tk.Toplevel(root)
-    progress_window.title("Converting Video")
-    progress_window.geometry("400x150")
-    center_window_preview(progress_window)
-
-    tk.Label(progress_window, text="Converting video...", font=("Segoe UI", 10)).pack(pady=10)
-
-    progress_var = tk.IntVar()
-    progress_bar = ttk.Progressbar(
-        progress_window,
-        variable=progress_var,
-        maximum=100,
-        style="TProgressbar"
-    )
-    progress_bar.pack(fill="x", padx=20, pady=10)
-
-    status_label = tk.Label(progress_window, text="0%", font=("Segoe UI", 10))
-    status_label.pack()
-
-    def update_progress(percent):
-        progress_var.set(percent)
-        status_label.config(text=f"{percent}%")
-        if percent >= 100:
-            progress_window.destroy()
-            messagebox.showinfo("Success", "Video converted successfully!")
-
     fmt = convert_format_var.get().strip().lower()
     if not fmt:
-        progress_window.destroy()
         messagebox.showerror("Format Error", "Please enter a valid output format (e.g., mp4, mkv).")
         return
 
     base_filename = os.path.splitext(os.path.basename(infile))[0]
-    default_outfile = os.path.join(os.path.dirname(infile), f"{base_filename}.{fmt}")
-
     outfile = filedialog.asksaveasfilename(
         title="Save converted video as",
         defaultextension=f".{fmt}",
         initialfile=f"{base_filename}.{fmt}",
         filetypes=[(f"{fmt.upper()} files", f"*.{fmt}"), ("All files", "*.*")]
     )
-
     if not outfile:
-        progress_window.destroy()
         return
 
-    def convert_thread():
-        try:
-            duration = get_video_duration(infile)
-
-            cmd = [
-                ffmpeg_path,
-                '-y',
-                '-i', infile,
-                '-progress', 'pipe:1',
-                outfile
-            ]
-
-            process = subprocess.Popen(
-                cmd,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                universal_newlines=True
-            )
-
-            for line in process.stderr:
-                if 'time=' in line:
-                    time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2})\.\d{2}', line)
-                    if time_match and duration > 0:
-                        h, m, s = map(int, time_match.groups())
-                        current_time = h * 3600 + m * 60 + s
-                        percent = int((current_time / duration) * 100)
-                        root.after(0, update_progress, percent)
-
-            process.wait()
-            root.after(0, lambda: update_progress(100))
-
-        except Exception as e:
-            root.after(0, progress_window.destroy)
-            root.after(0, lambda: messagebox.showerror("Error", f"An error occurred: {str(e)}"))
-
-    threading.Thread(target=convert_thread, daemon=True).start()
+    video_args, audio_args, output_args = conversion_args(fmt)
+    if convert_parallel_var.get() and video_args and '-vn' not in video_args:
+        run_tool_job("Converting Video", "Converting video...", "Video converted successfully!",
+                     lambda on_progress: SegmentedTranscode(ffmpeg_path, media_probe, infile, outfile,
+                                                            video_args, audio_args, output_args,
+                                                            on_progress=on_progress),
+                     error_prefix="Failed to convert video")
+    else:
+        run_ffmpeg_job("Converting Video", "Converting video...", "Video converted successfully!",
+                       single_args(infile, outfile, video_args, audio_args, output_args), outfile,
+                       duration_files=[infile])
 
 
 tk.Button(tools_convert_frame, text=_("🔄 Convert video"), command=convert_video,
           relief="flat", font=("Segoe UI", 11)).pack(padx=28, pady=10, fill="x")
+tk.Button(tools_convert_frame, text=_("📂 Convert a folder..."), command=lambda: open_batch_dialog('convert'),
+          relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(0, 10), fill="x")
 
 tk.Button(tools_convert_frame, text=_("⬅ Back"), command=lambda: show_frame(tools_frame),
           relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(30, 0), fill="x")
@@ -2405,42 +2241,36 @@ tk.Label(tools_trim_frame, text=_("End time (format HH:MM:SS or seconds):"),
 trim_end_var = tk.StringVar()
 tk.Entry(tools_trim_frame, textvariable=trim_end_var, **entry_style).pack(padx=28, pady=5, fill="x")
 
+smart_trim_var = tk.BooleanVar(value=app_settings.get('smart_trim', True))
+tk.Checkbutton(tools_trim_frame, text=_("🎯 Frame-accurate cut (re-encode only the edges)"), variable=smart_trim_var,
+               activebackground="#0b1a2f", font=("Segoe UI", 10),
+               command=lambda: app_settings.set('smart_trim', smart_trim_var.get())
+               ).pack(padx=28, pady=5, anchor="w")
+
 
 def trim_video():
     infile = filedialog.askopenfilename(title="Select video")
     if not infile:
         return
 
-    progress_window = tk.Toplevel(root)
-    progress_window.title("Trimming Video")
-    progress_window.geometry("400x150")
-    center_window_preview(progress_window)
-
-    tk.Label(progress_window, text="Trimming video...", font=("Segoe UI", 10)).pack(pady=10)
-
-    progress_var = tk.IntVar()
-    progress_bar = ttk.Progressbar(
-        progress_window,
-        variable=progress_var,
-        maximum=100,
-        style="TProgressbar"
-    )
-    progress_bar.pack(fill="x", padx=20, pady=10)
-
-    status_label = tk.Label(progress_window, text="0%", font=("Segoe UI", 10))
-    status_label.pack()
+    start = trim_start_var.get().strip()
+    end = trim_end_var.get().strip()
+    if not start or not end:
+        messagebox.showerror("Error", "Please specify both start and end time.")
+        return
 
-    def update_progress(percent):
-        progress_var.set(percent)
-        status_label.config(text=f"{percent}%")
-        if percent >= 100:
-            progress_window.destroy()
-            messagebox.showinfo("Success", "Video trimmed successfully!")
+    try:
+        start_seconds, end_seconds = parse_timestamp(start), parse_timestamp(end)
+        length = end_seconds - start_seconds
+    except ValueError:
+        messagebox.showerror("Error", "Start and end must be HH:MM:SS or seconds.")
+        return
+    if length <= 0:
+        messagebox.showerror("Error", "End time must be after the start time.")
+        return
 
     fmt = convert_format_var.get().strip().lower() or "mp4"
     base_filename = os.path.splitext(os.path.basename(infile))[0]
-    default_outfile = os.path.join(os.path.dirname(infile), f"{base_filename}_trimmed.{fmt}")
-
     outfile = filedialog.asksaveasfilename(
         title="Save trimmed video as",
         defaultextension=f".{fmt}",
@@ -2448,62 +2278,25 @@ def trim_video():
         filetypes=[(f"{fmt.upper()} files", f"*.{fmt}"), ("All files", "*.*")]
     )
     if not outfile:
-        progress_window.destroy()
         return
 
-    start = trim_start_var.get().strip()
-    end = trim_end_var.get().strip()
-
-    if not start or not end:
-        progress_window.destroy()
-        messagebox.showerror("Error", "Please specify both start and end time.")
+    if smart_trim_var.get():
+        run_tool_job("Trimming Video", "Trimming video...", "Video trimmed successfully!",
+                     lambda on_progress: SmartCut(ffmpeg_path, media_probe, infile, outfile,
+                                                  start_seconds, end_seconds, on_progress=on_progress,
+                                                  profile=encoding_profile()),
+                     error_prefix="Failed to trim video")
         return
 
-    def trim_thread():
-        try:
-            duration = get_video_duration(infile)
-
-            cmd = [
-                ffmpeg_path,
-                '-y',
-                '-ss', start,
-                '-to', end,
-                '-i', infile,
-                '-c', 'copy',
-                '-progress', 'pipe:1',
-                outfile
-            ]
-
-            process = subprocess.Popen(
-                cmd,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                universal_newlines=True,
-                encoding='utf-8',
-                errors='replace'
-            )
-
-            for line in process.stderr:
-                if 'time=' in line:
-                    time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2})\.\d{2}', line)
-                    if time_match and duration > 0:
-                        h, m, s = map(int, time_match.groups())
-                        current_time = h * 3600 + m * 60 + s
-                        percent = int((current_time / duration) * 100)
-                        root.after(0, update_progress, percent)
-
-            process.wait()
-            root.after(0, lambda: update_progress(100))
-
-        except Exception as e:
-            root.after(0, progress_window.destroy)
-            root.after(0, lambda: messagebox.showerror("Error", f"Failed to trim video: {str(e)}"))
-
-    threading.Thread(target=trim_thread, daemon=True).start()
+    args = ['-ss', start, '-to', end, '-i', infile, '-c', 'copy', outfile]
+    run_ffmpeg_job("Trimming Video", "Trimming video...", "Video trimmed successfully!",
+                   args, outfile, duration=length, error_prefix="Failed to trim video")
 
 
 tk.Button(tools_trim_frame, text=_("✂ Trim"), command=trim_video,
           relief="flat", font=("Segoe UI", 11)).pack(padx=28, pady=10, fill="x")
+tk.Button(tools_trim_frame, text=_("📂 Trim a folder..."), command=lambda: open_batch_dialog('trim'),
+          relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(0, 10), fill="x")
 
 tk.Button(tools_trim_frame, text=_("⬅️ Back"), command=lambda: show_frame(tools_frame),
           relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(30, 0), fill="x")
@@ -2625,91 +2418,66 @@ def merge_videos():
         messagebox.showerror("Error", "Please select at least 2 video files to merge")
         return
 
-    progress_window = tk.Toplevel(root)
-    progress_window.title("Merging Videos")
-    progress_window.geometry("400x150")
-    center_window_preview(progress_window)
-
-    tk.Label(progress_window, text="Merging videos...", font=("Segoe UI", 10)).pack(pady=10)
-
-    progress_var = tk.IntVar()
-    progress_bar = ttk.Progressbar(
-        progress_window,
-        variable=progress_var,
-        maximum=100,
-        style="TProgressbar"
-    )
-    progress_bar.pack(fill="x", padx=20, pady=10)
-
-    status_label = tk.Label(progress_window, text="0%", font=("Segoe UI", 10))
-    status_label.pack()
-
-    def update_progress(percent):
-        progress_var.set(percent)
-        status_label.config(text=f"{percent}%")
-        if percent >= 100:
-            progress_window.destroy()
-            messagebox.showinfo("Success", "Videos merged successfully!")
-
-    list_file = os.path.join(os.path.dirname(merge_files[0]), "ffmpeg_concat_list.txt")
-    with open(list_file, "w", encoding="utf-8") as f:
-        for file in merge_files:
-            f.write(f"file '{file}'\n")
-
     output_format = merge_format_var.get()
     output_file = filedialog.asksaveasfilename(
         title="Save merged video as",
         defaultextension=f".{output_format}",
         filetypes=[(f"{output_format.upper()} files", f"*.{output_format}"), ("All files", "*.*")]
     )
-
     if not output_file:
-        progress_window.destroy()
         return
 
-    def merge_thread():
+    files = list(merge_files)
+    show_toast(f"Analyzing {len(files)} files...")
+
+    def plan_thread():
         try:
-            total_duration = 0
-            for file in merge_files:
-                duration = get_video_duration(file)
-                if duration > 0:
-                    total_duration += duration
-
-            cmd = [
-                ffmpeg_path,
-                '-f', 'concat',
-                '-safe', '0',
-                '-i', list_file,
-                '-c', 'copy',
-                '-progress', 'pipe:1',
-                output_file
-            ]
-
-            process = subprocess.Popen(
-                cmd,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                universal_newlines=True
-            )
+            plan = plan_concat(files, output_format, media_probe)
+        except Exception as e:
+            message = f"Failed to analyze videos: {e}"
+            root.after(0, messagebox.showerror, "Error", message)
+            return
+        root.after(0, show_merge_plan, plan, output_file)
 
-            for line in process.stderr:
-                if 'time=' in line:
-                    time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2})\.\d{2}', line)
-                    if time_match and total_duration > 0:
-                        h, m, s = map(int, time_match.groups())
-                        current_time = h * 3600 + m * 60 + s
-                        percent = int((current_time / total_duration) * 100)
-                        root.after(0, update_progress, percent)
+    threading.Thread(target=plan_thread, daemon=True).start()
 
-            process.wait()
-            os.remove(list_file)
-            root.after(0, lambda: update_progress(100))
 
-        except Exception as e:
-            root.after(0, progress_window.destroy)
-            root.after(0, lambda: messagebox.showerror("Error", f"Failed to merge videos: {str(e)}"))
+def show_merge_plan(plan, output_file):
+    transcoded = [entry for entry in plan['entries'] if entry['action'] == 'transcode']
+    window = tk.Toplevel(root)
+    window.title("Merge plan")
+    window.geometry("620x360")
+    center_window_preview(window)
 
-    threading.Thread(target=merge_thread, daemon=True).start()
+    if transcoded:
+        summary = (f"{len(plan['entries']) - len(transcoded)} file(s) will be copied as is, "
+                   f"{len(transcoded)} re-encoded to match the rest.")
+    else:
+        summary = "All files match, they will be joined without re-encoding."
+    tk.Label(window, text=summary, font=("Segoe UI", 10), wraplength=580, justify="left").pack(padx=10, pady=(10, 5), anchor="w")
+
+    list_frame = tk.Frame(window)
+    list_frame.pack(fill="both", expand=True, padx=10, pady=5)
+    plan_scrollbar = tk.Scrollbar(list_frame)
+    plan_scrollbar.pack(side="right", fill="y")
+    plan_listbox = tk.Listbox(list_frame, font=("Consolas", 9), yscrollcommand=plan_scrollbar.set)
+    plan_listbox.pack(side="left", fill="both", expand=True)
+    plan_scrollbar.config(command=plan_listbox.yview)
+    for line in describe_plan(plan):
+        plan_listbox.insert(tk.END, line)
+
+    def start():
+        window.destroy()
+        run_tool_job("Merging Videos", "Merging videos...", "Videos merged successfully!",
+                     lambda on_progress: ConcatJob(ffmpeg_path, plan, output_file, on_progress=on_progress,
+                                                   profile=encoding_profile(),
+                                                   crf=ENCODING_PROFILES[encoding_profile()]['crf']),
+                     error_prefix="Failed to merge videos")
+
+    buttons = tk.Frame(window)
+    buttons.pack(pady=10)
+    tk.Button(buttons, text="▶ Start", command=start, relief="flat", font=("Segoe UI", 10)).pack(side="left", padx=5)
+    tk.Button(buttons, text="Cancel", command=window.destroy, relief="flat", font=("Segoe UI", 10)).pack(side="left", padx=5)
 
 
 tk.Button(tools_merge_frame, text="🔀 Merge Videos", command=merge_videos,
@@ -2718,6 +2486,124 @@ tk.Button(tools_merge_frame, text="🔀 Merge Videos", command=merge_videos,
 tk.Button(tools_merge_frame, text="⬅️ Back", command=lambda: show_frame(tools_frame),
           relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(30, 0), fill="x")
 
+BATCH_TITLES = {
+    'convert': "Convert",
+    'trim': "Trim",
+    'extract-audio': "Extract audio",
+}
+
+
+def open_batch_dialog(tool):
+    window = tk.Toplevel(root)
+    window.title(f"Batch: {BATCH_TITLES[tool]}")
+    window.geometry("560x330")
+    center_window_preview(window)
+    form = tk.Frame(window)
+    form.pack(fill="x", padx=15, pady=10)
+    form.columnconfigure(1, weight=1)
+
+    source_var = tk.StringVar()
+    output_var = tk.StringVar()
+    naming_var = tk.StringVar(value=DEFAULT_NAMING[tool])
+    recursive_var = tk.BooleanVar(value=False)
+    skip_var = tk.BooleanVar(value=True)
+
+    def browse(var):
+        folder = filedialog.askdirectory(parent=window)
+        if folder:
+            var.set(folder)
+
+    rows = [
+        (_("Folder or pattern (e.g. D:/rec/*.mkv):"), source_var),
+        (_("Output folder (empty: a '{}' folder in the source):").format(DEFAULT_FOLDERS[tool]), output_var),
+    ]
+    for row, (label, var) in enumerate(rows):
+        tk.Label(form, text=label, font=("Segoe UI", 10)).grid(row=row * 2, column=0, columnspan=2, sticky="w")
+        tk.Entry(form, textvariable=var, **entry_style).grid(row=row * 2 + 1, column=0, columnspan=2, sticky="ew",
+                                                             pady=(0, 5))
+        tk.Button(form, text="📁", command=lambda var=var: browse(var), relief="flat").grid(row=row * 2 + 1, column=2,
+                                                                                          padx=(5, 0))
+    tk.Label(form, text=_("File names ({name}, {ext}, {index}):"), font=("Segoe UI", 10)).grid(
+        row=4, column=0, columnspan=2, sticky="w")
+    tk.Entry(form, textvariable=naming_var, **entry_style).grid(row=5, column=0, columnspan=2, sticky="ew")
+    tk.Checkbutton(form, text=_("Include subfolders"), variable=recursive_var, font=("Segoe UI", 10)).grid(
+        row=6, column=0, columnspan=2, sticky="w", pady=(5, 0))
+    tk.Checkbutton(form, text=_("Skip files whose output is newer than the input"), variable=skip_var,
+                   font=("Segoe UI", 10)).grid(row=7, column=0, columnspan=2, sticky="w")
+
+    def start():
+        source = source_var.get().strip()
+        if not source:
+            messagebox.showerror("Error", "Please choose a folder or enter a file pattern.", parent=window)
+            return
+        start_seconds = end_seconds = None
+        fmt = None
+        if tool == 'trim':
+            try:
+                start_seconds = parse_timestamp(trim_start_var.get())
+                end_seconds = parse_timestamp(trim_end_var.get())
+            except ValueError:
+                messagebox.showerror("Error", "Set the start and end time on the trim page first.", parent=window)
+                return
+            if end_seconds <= start_seconds:
+                messagebox.showerror("Error", "End time must be after the start time.", parent=window)
+                return
+        elif tool == 'extract-audio':
+            fmt = audio_format_var.get()
+        else:
+            fmt = convert_format_var.get().strip().lower()
+            if not fmt:
+                messagebox.showerror("Format Error", "Please enter a valid output format (e.g., mp4, mkv).",
+                                     parent=window)
+                return
+
+        output_dir = output_var.get().strip() or os.path.join(source_root(source), DEFAULT_FOLDERS[tool])
+        inputs = find_inputs(source, recursive_var.get(), exclude_dirs=[output_dir])
+        if not inputs:
+            messagebox.showerror("Error", f"No media files found in {source}", parent=window)
+            return
+        make_job, workers, ext = batch_tool(tool, fmt, start_seconds, end_seconds, smart=smart_trim_var.get(),
+                                            audio_bitrate=audio_quality_var.get(), files=len(inputs))
+        try:
+            items = plan_batch(inputs, output_dir, naming_var.get().strip() or DEFAULT_NAMING[tool], ext,
+                               source_root(source), skip_up_to_date=skip_var.get())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=window)
+            return
+        window.destroy()
+        run_tool_job(f"Batch: {BATCH_TITLES[tool]}", f"Processing {len(items)} files, {workers} at a time...", None,
+                     lambda on_progress: BatchJob(ffmpeg_path, media_probe, items, make_job, workers=workers,
+                                                  on_progress=on_progress),
+                     error_prefix="Batch failed", on_success=lambda result: show_batch_summary(tool, items))
+
+    buttons = tk.Frame(window)
+    buttons.pack(pady=10)
+    tk.Button(buttons, text="▶ Start", command=start, relief="flat", font=("Segoe UI", 10)).pack(side="left", padx=5)
+    tk.Button(buttons, text="Cancel", command=window.destroy, relief="flat", font=("Segoe UI", 10)).pack(side="left", padx=5)
+
+
+def show_batch_summary(tool, items):
+    window = tk.Toplevel(root)
+    window.title(f"Batch: {BATCH_TITLES[tool]}")
+    window.geometry("620x360")
+    center_window_preview(window)
+    tk.Label(window, text=summarize_batch(items), font=("Segoe UI", 10)).pack(padx=10, pady=(10, 5), anchor="w")
+
+    list_frame = tk.Frame(window)
+    list_frame.pack(fill="both", expand=True, padx=10, pady=5)
+    summary_scrollbar = tk.Scrollbar(list_frame)
+    summary_scrollbar.pack(side="right", fill="y")
+    summary_listbox = tk.Listbox(list_frame, font=("Consolas", 9), yscrollcommand=summary_scrollbar.set)
+    summary_listbox.pack(side="left", fill="both", expand=True)
+    summary_scrollbar.config(command=summary_listbox.yview)
+    for line in describe_batch(items):
+        summary_listbox.insert(tk.END, line)
+
+    tk.Button(window, text="OK", command=window.destroy, relief="flat", font=("Segoe UI", 10)).pack(pady=10)
+
+
+mark_startup("build tools frames")
+
 help_frame_inner = tk.Frame(help_frame)
 help_frame_inner.place(relwidth=1, relheight=1)
 
@@ -2788,6 +2674,8 @@ tk.Button(
     font=("Segoe UI", 10)
 ).pack(padx=28, pady=20, fill="x")
 
+mark_startup("build help frame")
+
 settings_frame_inner = tk.Frame(settings_frame)
 settings_frame_inner.place(relwidth=1, relheight=1)
 
@@ -2878,17 +2766,173 @@ lang_menu = tk.OptionMenu(
 lang_menu.grid(row=add_settings_row.row, column=1, sticky="w", pady=5)
 add_settings_row.row += 1
 
+
+
+def change_queue_limits(_value=None):
+    max_workers = workers_slider.get()
+    per_host = per_host_slider.get()
+    extract_workers = extract_slider.get()
+    postprocess_workers = postprocess_slider.get()
+    app_settings.set('max_concurrent_downloads', max_workers)
+    app_settings.set('per_host_limit', per_host)
+    app_settings.set('extract_workers', extract_workers)
+    app_settings.set('postprocess_workers', postprocess_workers)
+    download_queue.set_limits(max_workers, per_host, postprocess_workers)
+    extract_stage.set_workers(extract_workers)
+
+
+workers_slider = tk.Scale(
+    settings_form_frame,
+    from_=1,
+    to=16,
+    orient=tk.HORIZONTAL,
+    highlightthickness=0,
+    sliderrelief="flat",
+    command=change_queue_limits
+)
+workers_slider.set(app_settings.get('max_concurrent_downloads', 3))
+add_settings_row(settings_form_frame, _("⚡ Parallel downloads:"), workers_slider)
+
+per_host_slider = tk.Scale(
+    settings_form_frame,
+    from_=1,
+    to=8,
+    orient=tk.HORIZONTAL,
+    highlightthickness=0,
+    sliderrelief="flat",
+    command=change_queue_limits
+)
+per_host_slider.set(app_settings.get('per_host_limit', 2))
+add_settings_row(settings_form_frame, _("🌐 Downloads per site:"), per_host_slider)
+
+extract_slider = tk.Scale(
+    settings_form_frame,
+    from_=1,
+    to=8,
+    orient=tk.HORIZONTAL,
+    highlightthickness=0,
+    sliderrelief="flat",
+    command=change_queue_limits
+)
+extract_slider.set(app_settings.get('extract_workers', 2))
+add_settings_row(settings_form_frame, _("🔎 Parallel lookups:"), extract_slider)
+
+# 0 converts inside the download slot, one task at a time
+postprocess_slider = tk.Scale(
+    settings_form_frame,
+    from_=0,
+    to=4,
+    orient=tk.HORIZONTAL,
+    highlightthickness=0,
+    sliderrelief="flat",
+    command=change_queue_limits
+)
+postprocess_slider.set(app_settings.get('postprocess_workers', 1))
+add_settings_row(settings_form_frame, _("⚙ Parallel conversions:"), postprocess_slider)
+
+autotune_var = tk.BooleanVar(value=app_settings.get('autotune_downloads', True))
+autotune_check = tk.Checkbutton(settings_form_frame, variable=autotune_var, activebackground="#0b1a2f",
+                                command=lambda: app_settings.set('autotune_downloads', autotune_var.get()))
+add_settings_row(settings_form_frame, _("📈 Auto-tune per site:"), autotune_check)
+
+encoding_profile_var = tk.StringVar(value=encoding_profile())
+encoding_profile_menu = tk.OptionMenu(settings_form_frame, encoding_profile_var, *ENCODING_PROFILES,
+                                      command=lambda value: app_settings.set('encoding_profile', value))
+encoding_profile_menu.config(highlightthickness=0)
+add_settings_row(settings_form_frame, _("🎚 Encoding profile:"), encoding_profile_menu)
+
+stream_transcode_var = tk.BooleanVar(value=app_settings.get('stream_transcode', False))
+stream_transcode_check = tk.Checkbutton(settings_form_frame, variable=stream_transcode_var, activebackground="#0b1a2f",
+                                        command=lambda: app_settings.set('stream_transcode',
+                                                                         stream_transcode_var.get()))
+add_settings_row(settings_form_frame, _("📡 Convert while downloading:"), stream_transcode_check)
+
+skip_downloaded_var = tk.BooleanVar(value=app_settings.get('skip_downloaded', True))
+skip_downloaded_check = tk.Checkbutton(settings_form_frame, variable=skip_downloaded_var, activebackground="#0b1a2f",
+                                       command=lambda: app_settings.set('skip_downloaded', skip_downloaded_var.get()))
+add_settings_row(settings_form_frame, _("🗂 Skip already downloaded:"), skip_downloaded_check)
+
+
+def show_tuning_report():
+    report_window = tk.Toplevel(root)
+    report_window.title("Download tuning per site")
+    report_window.geometry("640x320")
+    center_window_preview(report_window)
+
+    report_text = tk.Text(report_window, font=("Consolas", 10), wrap="none", relief="flat")
+    report_text.pack(padx=10, pady=10, fill="both", expand=True)
+
+    def refresh():
+        report_text.config(state=tk.NORMAL)
+        report_text.delete("1.0", tk.END)
+        report_text.insert("1.0", format_tuning_report() + "\n\n" + format_pipeline_report(download_queue))
+        report_text.config(state=tk.DISABLED)
+
+    def reset():
+        host_tuner.reset()
+        refresh()
+
+    tk.Button(report_window, text="♻ Reset learned values", command=reset,
+              relief="flat", font=("Segoe UI", 10)).pack(padx=10, pady=(0, 10), fill="x")
+    refresh()
+
+
+def show_encoder_report():
+    report_window = tk.Toplevel(root)
+    report_window.title("Encoders and hardware acceleration")
+    report_window.geometry("720x400")
+    center_window_preview(report_window)
+
+    report_text = tk.Text(report_window, font=("Consolas", 10), wrap="none", relief="flat")
+    report_text.pack(padx=10, pady=10, fill="both", expand=True)
+
+    def show(text):
+        if not report_window.winfo_exists():
+            return
+        report_text.config(state=tk.NORMAL)
+        report_text.delete("1.0", tk.END)
+        report_text.insert("1.0", text)
+        report_text.config(state=tk.DISABLED)
+
+    def done():
+        retest_button.config(state=tk.NORMAL)
+        show(format_encoder_report())
+
+    def retest():
+        retest_button.config(state=tk.DISABLED)
+        show("Testing encoders, this takes up to a minute...")
+        start_encoder_probe(force=True, on_done=lambda: report_window.winfo_exists() and done())
+
+    retest_button = tk.Button(report_window, text="🔁 Test again", command=retest,
+                              relief="flat", font=("Segoe UI", 10))
+    retest_button.pack(padx=10, pady=(0, 10), fill="x")
+    show(format_encoder_report())
+
+
 filename_template_menu.config(highlightthickness=0)
 filename_template_menu.grid(row=add_settings_row.row, column=1, sticky="ew", pady=5)
 add_settings_row.row += 1
 
+tk.Button(settings_frame_inner, text="📊 Download tuning per site", command=show_tuning_report,
+          relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(10, 0), fill="x")
+tk.Button(settings_frame_inner, text="🧪 Encoders and hardware acceleration", command=show_encoder_report,
+          relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=(10, 0), fill="x")
+
 tk.Button(settings_frame_inner, text=_("⬅ Back"), command=lambda: show_frame(main_frame),
           relief="flat", font=("Segoe UI", 10)).pack(padx=28, pady=20, fill="x")
 
-update_history_list()
+mark_startup("build settings frame")
+
 show_frame(main_frame)
 
 apply_theme(app_settings.get('theme', 'dark'))
+mark_startup("apply theme")
+
+if '--startup-profile' in sys.argv[1:]:
+    root.after_idle(print_startup_profile)
+root.after(2000, warm_up_imports)
+# test encodes only run once per ffmpeg build, after that the cached results are reused
+root.after(8000, start_encoder_probe)
 
 
 def on_focus_in(event):
@@ -2905,4 +2949,23 @@ root.bind("<F1>", lambda e: show_frame(help_frame))
 root.bind("<Control-q>", lambda e: preview_video())
 
 url_entry.bind("<FocusIn>", on_focus_in)
+
+
+def on_close():
+    download_queue.stop()
+    deadline = time.time() + 5
+
+    # poll instead of joining, workers post their last status through root.after
+    def wait_for_workers():
+        if download_queue.is_running() and time.time() < deadline:
+            root.after(100, wait_for_workers)
+            return
+        download_queue.shutdown(timeout=0)
+        ydl_pool.clear()
+        root.destroy()
+
+    wait_for_workers()
+
+
+root.protocol("WM_DELETE_WINDOW", on_close)
 root.mainloop()
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import re
+import statistics
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PROBE_CACHE_VERSION = 1
+PROBE_TIMEOUT = 60
+PROBE_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+KEYFRAME_SCAN_SECONDS = 120
+KEYFRAME_INDEX_TIMEOUT = 600
+
+STREAM_PATTERN = re.compile(r"Stream #\d+:(\d+)[^:]*: (Video|Audio|Subtitle|Data): (\w+)")
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def frame_rate(value):
+    # ffprobe reports rates as fractions, "0/0" when unknown
+    numerator, _sep, denominator = (value or '').partition('/')
+    numerator, denominator = to_float(numerator), to_float(denominator or 1)
+    if not numerator or not denominator:
+        return None
+    return round(numerator / denominator, 3)
+
+
+def summarize_stream(stream):
+    return {
+        'index': stream.get('index'),
+        'type': stream.get('codec_type'),
+        'codec': stream.get('codec_name'),
+        'profile': stream.get('profile'),
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'pix_fmt': stream.get('pix_fmt'),
+        'fps': frame_rate(stream.get('avg_frame_rate')) or frame_rate(stream.get('r_frame_rate')),
+        'sample_rate': to_int(stream.get('sample_rate')),
+        'channels': stream.get('channels'),
+        'channel_layout': stream.get('channel_layout'),
+        'time_base': stream.get('time_base'),
+        'bit_rate': to_int(stream.get('bit_rate')),
+        'duration': to_float(stream.get('duration')),
+        'attached_pic': bool((stream.get('disposition') or {}).get('attached_pic'))
+    }
+
+
+def first_stream(info, stream_type):
+    for stream in info.get('streams', []):
+        if stream['type'] == stream_type and not stream.get('attached_pic'):
+            return stream
+    return None
+
+
+class MediaProbe:
+    def __init__(self, ffprobe_path, ffmpeg_path, cache_dir):
+        self.ffprobe_path = ffprobe_path
+        self.ffmpeg_path = ffmpeg_path
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.memory = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path, stat):
+        raw = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{PROBE_CACHE_VERSION}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def probe(self, path, keyframes=False):
+        stat = os.stat(path)
+        key = self.key(path, stat)
+        info = self._cached(key)
+        if info is None:
+            info = self._run_ffprobe(path) if self.ffprobe_path else self._run_ffmpeg(path)
+            info.update({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+        elif not keyframes or info.get('keyframes_checked'):
+            return info
+
+        if keyframes and not info.get('keyframes_checked'):
+            info['keyframe_interval'] = self._keyframe_interval(path, info)
+            info['keyframes_checked'] = True
+        self._store(key, info)
+        return info
+
+    def probe_many(self, paths, keyframes=False, workers=PROBE_WORKERS):
+        unique = list(dict.fromkeys(paths))
+
+        def probe_one(path):
+            try:
+                return path, self.probe(path, keyframes=keyframes)
+            except Exception as e:
+                print(f"Error probing {path}: {e}")
+                return path, None
+
+        if len(unique) <= 1:
+            return dict(probe_one(path) for path in unique)
+        # each probe is an external process, threads are enough to keep them all busy
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique)))) as pool:
+            return dict(pool.map(probe_one, unique))
+
+    def keyframes(self, path):
+        # full keyframe index of the first video stream, kept in the probe cache entry
+        stat = os.stat(path)
+        key = self.key(path, stat)
+        info = self.probe(path)
+        if info.get('keyframe_times') is None:
+            info['keyframe_times'] = self._scan_keyframes(path, info)
+            self._store(key, info)
+        return info['keyframe_times']
+
+    def duration(self, path):
+        try:
+            return self.probe(path)['duration'] or 0
+        except Exception:
+            return 0
+
+    def total_duration(self, paths):
+        return sum((info or {}).get('duration') or 0 for info in self.probe_many(paths).values())
+
+    def _cached(self, key):
+        with self.lock:
+            info = self.memory.get(key)
+        if info is None:
+            try:
+                with open(self.cache_path(key), 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                return None
+            with self.lock:
+                self.memory[key] = info
+        return info
+
+    def _store(self, key, info):
+        with self.lock:
+            self.memory[key] = info
+        temp_path = f"{self.cache_path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(info, f)
+            os.replace(temp_path, self.cache_path(key))
+        except OSError as e:
+            print(f"Error caching probe result: {e}")
+
+    def _run(self, cmd, timeout=PROBE_TIMEOUT):
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        return subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                              encoding='utf-8', errors='replace', timeout=timeout,
+                              creationflags=creationflags)
+
+    def _run_ffprobe(self, path):
+        result = self._run([self.ffprobe_path, '-v', 'error', '-print_format', 'json',
+                            '-show_format', '-show_streams', path])
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"ffprobe exited with code {result.returncode}")
+        data = json.loads(result.stdout or '{}')
+        fmt = data.get('format') or {}
+        streams = [summarize_stream(stream) for stream in data.get('streams', [])]
+        duration = to_float(fmt.get('duration'))
+        if duration is None:
+            duration = max((s['duration'] for s in streams if s['duration']), default=None)
+        return self._summary(duration, fmt.get('format_name'), to_int(fmt.get('bit_rate')), streams)
+
+    def _run_ffmpeg(self, path):
+        # no ffprobe next to ffmpeg: fall back to the banner `ffmpeg -i` prints, minus keyframe data
+        result = self._run([self.ffmpeg_path, '-hide_banner', '-i', path])
+        duration = None
+        streams = []
+        for line in result.stderr.splitlines():
+            match = DURATION_PATTERN.search(line)
+            if match and duration is None:
+                hours, minutes, seconds = match.groups()
+                duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            match = STREAM_PATTERN.search(line)
+            if match:
+                size = re.search(r", (\d{2,5})x(\d{2,5})", line)
+                fps = re.search(r"([\d.]+) fps", line)
+                rate = re.search(r"(\d+) Hz, ([^,]+)", line)
+                streams.append({
+                    'index': int(match.group(1)),
+                    'type': match.group(2).lower(),
+                    'codec': match.group(3),
+                    'profile': None,
+                    'width': int(size.group(1)) if size else None,
+                    'height': int(size.group(2)) if size else None,
+                    'pix_fmt': None,
+                    'fps': float(fps.group(1)) if fps else None,
+                    'sample_rate': int(rate.group(1)) if rate else None,
+                    'channels': None,
+                    'channel_layout': rate.group(2).strip() if rate else None,
+                    'time_base': None,
+                    'bit_rate': None,
+                    'duration': None,
+                    'attached_pic': '(attached pic)' in line
+                })
+        if duration is None and not streams:
+            lines = [line for line in result.stderr.splitlines() if line.strip()]
+            raise RuntimeError(lines[-1] if lines else "ffmpeg could not read the file")
+        return self._summary(duration, None, None, streams)
+
+    def _summary(self, duration, format_name, bit_rate, streams):
+        info = {
+            'duration': duration,
+            'format': format_name,
+            'bit_rate': bit_rate,
+            'streams': streams,
+            'keyframe_interval': None,
+            'keyframes_checked': False
+        }
+        video = first_stream(info, 'video')
+        audio = first_stream(info, 'audio')
+        info['video_codec'] = video['codec'] if video else None
+        info['audio_codec'] = audio['codec'] if audio else None
+        return info
+
+    def _keyframe_interval(self, path, info):
+        times = info.get('keyframe_times') or self._scan_keyframes(path, info, KEYFRAME_SCAN_SECONDS)
+        gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+        return round(statistics.median(gaps), 3) if gaps else None
+
+    def _scan_keyframes(self, path, info, seconds=None):
+        if not self.ffprobe_path or not info.get('video_codec'):
+            return []
+        cmd = [self.ffprobe_path, '-v', 'error', '-select_streams', 'v:0',
+               '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0']
+        if seconds:
+            cmd += ['-read_intervals', f"%+{seconds}"]
+        result = self._run(cmd + [path], timeout=PROBE_TIMEOUT if seconds else KEYFRAME_INDEX_TIMEOUT)
+        times = []
+        for line in result.stdout.splitlines():
+            pts_time, _sep, flags = line.partition(',')
+            pts_time = to_float(pts_time)
+            if pts_time is not None and 'K' in flags:
+                times.append(pts_time)
+        times.sort()
+        return times
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+METADATA_TTL = 24 * 3600
+FORMAT_URL_TTL = 30 * 60
+EXPIRY_MARGIN = 5 * 60
+MEMORY_ENTRIES = 64
+
+TRACKING_PARAMS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'feature', 'si')
+EXPIRY_PARAMS = ('expire', 'expires', 'Expires', 'exp')
+
+
+def canonical_url(url):
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parsed.port:
+        host = f"{host}:{parsed.port}"
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k not in TRACKING_PARAMS]
+    return urlunparse((parsed.scheme.lower() or 'https', host, parsed.path.rstrip('/') or '/', '',
+                       urlencode(sorted(query)), ''))
+
+
+def format_urls_expire_at(info, saved_at):
+    # signed CDN links usually carry their own deadline, e.g. googlevideo's ?expire=<epoch>
+    expiries = []
+    for fmt in info.get('formats') or []:
+        for key in ('url', 'manifest_url'):
+            params = dict(parse_qsl(urlparse(fmt.get(key) or '').query))
+            for name in EXPIRY_PARAMS:
+                if params.get(name, '').isdigit():
+                    expiries.append(int(params[name]))
+    if expiries:
+        return min(expiries)
+    return saved_at + FORMAT_URL_TTL
+
+
+class MetadataCache:
+    def __init__(self, cache_dir, ttl=METADATA_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, url, variant=''):
+        raw = canonical_url(url) + '|' + variant
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, url, need_formats=False, variant=''):
+        key = self.key(url, variant)
+        with self.lock:
+            record = self.memory.get(key)
+            if record is not None:
+                self.memory.move_to_end(key)
+        if record is None:
+            try:
+                with open(self.path(key), 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._remember(key, record)
+
+        now = time.time()
+        if now - record['saved_at'] > self.ttl:
+            self.invalidate(url, variant)
+            return None
+        if need_formats and now > record['formats_expire_at'] - EXPIRY_MARGIN:
+            return None
+        # callers hand the dict to yt-dlp, which mutates it while processing
+        return json.loads(json.dumps(record['info']))
+
+    def put(self, url, info, variant=''):
+        key = self.key(url, variant)
+        saved_at = time.time()
+        record = {
+            'url': url,
+            'saved_at': saved_at,
+            'formats_expire_at': format_urls_expire_at(info, saved_at),
+            'info': info
+        }
+        temp_path = self.path(key) + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(temp_path, self.path(key))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error caching metadata: {e}")
+            return
+        self._remember(key, record)
+
+    def invalidate(self, url, variant=''):
+        key = self.key(url, variant)
+        with self.lock:
+            self.memory.pop(key, None)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def prune(self):
+        now = time.time()
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _remember(self, key, record):
+        with self.lock:
+            self.memory[key] = record
+            self.memory.move_to_end(key)
+            while len(self.memory) > MEMORY_ENTRIES:
+                self.memory.popitem(last=False)
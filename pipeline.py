@@ -0,0 +1,82 @@
+import queue
+import threading
+import time
+
+POLL_INTERVAL = 1
+
+
+class Stage:
+    def __init__(self, name, handler, workers=1, capacity=0):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        # a bounded queue makes whoever feeds the stage wait, instead of piling up work behind it
+        self.items = queue.Queue(maxsize=max(0, int(capacity)))
+        self.lock = threading.Lock()
+        self.running = 0
+        self.active = 0
+        self.stats = {'done': 0, 'failed': 0, 'dropped': 0, 'busy_time': 0.0, 'blocked_time': 0.0}
+
+    def set_workers(self, workers):
+        with self.lock:
+            self.workers = max(1, int(workers))
+            start = self.running > 0
+        if start:
+            self._spawn()
+
+    def _spawn(self):
+        with self.lock:
+            missing = self.workers - self.running
+            self.running += max(0, missing)
+        for _index in range(missing):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, item, block=True):
+        if self.running < self.workers:
+            self._spawn()
+        if not block:
+            try:
+                self.items.put_nowait(item)
+                return True
+            except queue.Full:
+                with self.lock:
+                    self.stats['dropped'] += 1
+                return False
+        started = time.monotonic()
+        self.items.put(item)
+        with self.lock:
+            self.stats['blocked_time'] += time.monotonic() - started
+        return True
+
+    def join(self):
+        self.items.join()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                # lowered limit: extra workers leave once they are between items
+                if self.running > self.workers:
+                    self.running -= 1
+                    return
+            try:
+                item = self.items.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            with self.lock:
+                self.active += 1
+            started = time.monotonic()
+            try:
+                ok = self.handler(item) is not False
+            except Exception as e:
+                print(f"Error in {self.name} stage: {e}")
+                ok = False
+            with self.lock:
+                self.active -= 1
+                self.stats['busy_time'] += time.monotonic() - started
+                self.stats['done' if ok else 'failed'] += 1
+            self.items.task_done()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, name=self.name, workers=self.workers, active=self.active,
+                        queued=self.items.qsize())
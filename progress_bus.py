@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+PUBLISH_INTERVAL = 0.1
+TERMINAL_STATUSES = ('finished', 'error')
+
+
+def is_terminal(event):
+    return event.get('status') in TERMINAL_STATUSES
+
+
+class ProgressBus:
+    def __init__(self, publish, interval=PUBLISH_INTERVAL):
+        self.publish = publish
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.publish_lock = threading.Lock()
+        self.events = OrderedDict()
+        self.wakeup = threading.Event()
+        self.last_publish = 0
+        self.thread = None
+        self.stats = {'received': 0, 'published': 0, 'batches': 0}
+
+    def post(self, key, event):
+        with self.lock:
+            self.stats['received'] += 1
+            queued = self.events.setdefault(key, [])
+            # only the newest in-flight update matters, but terminal states are never overwritten
+            if queued and not is_terminal(queued[-1]):
+                queued[-1] = event
+            else:
+                queued.append(event)
+            self.wakeup.set()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def flush(self):
+        # held across publish so a caller's flush can't overtake a batch the bus thread already drained
+        with self.publish_lock:
+            with self.lock:
+                batch = self._drain()
+            self._publish(batch)
+
+    def _drain(self):
+        batch = [(key, event) for key, queued in self.events.items() for event in queued]
+        self.events.clear()
+        self.wakeup.clear()
+        return batch
+
+    def _publish(self, batch):
+        if not batch:
+            return
+        self.last_publish = time.monotonic()
+        self.stats['published'] += len(batch)
+        self.stats['batches'] += 1
+        try:
+            self.publish(batch)
+        except Exception as e:
+            print(f"Error publishing progress: {e}")
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            delay = self.last_publish + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.flush()
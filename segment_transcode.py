@@ -0,0 +1,147 @@
+import bisect
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from encoder_probe import HARDWARE_WORKERS, is_hardware
+from ffmpeg_jobs import FFmpegCancelled, FFmpegError, FFmpegJobGroup, write_concat_list
+from media_probe import first_stream
+
+MIN_SEGMENT_SECONDS = 10
+SEGMENTS_PER_WORKER = 2
+SEGMENT_RETRIES = 2
+COPY_WEIGHT = 0.02
+AUDIO_WEIGHT = 0.05
+
+
+def split_points(keyframes, duration, count):
+    # cut into pieces as close to equal length as the keyframes allow
+    points = []
+    for number in range(1, count):
+        target = duration * number / count
+        point = target
+        if keyframes:
+            index = bisect.bisect_left(keyframes, target)
+            nearby = keyframes[max(0, index - 1):index + 1]
+            point = min(nearby, key=lambda time: abs(time - target))
+        previous = points[-1] if points else 0
+        if point - previous >= MIN_SEGMENT_SECONDS / 2 and duration - point >= MIN_SEGMENT_SECONDS / 2:
+            points.append(point)
+    return points
+
+
+def single_args(infile, outfile, video_args, audio_args, output_args, threads=None):
+    args = ['-i', infile] + list(video_args) + list(audio_args) + list(output_args)
+    if threads:
+        args += ['-threads', str(threads)]
+    return args + [outfile]
+
+
+class SegmentedTranscode(FFmpegJobGroup):
+    def __init__(self, ffmpeg_path, probe, infile, outfile, video_args, audio_args, output_args=(),
+                 workers=None, on_progress=None):
+        super().__init__(ffmpeg_path, on_progress)
+        self.probe = probe
+        self.infile = infile
+        self.outfile = outfile
+        self.video_args = list(video_args)
+        self.audio_args = list(audio_args)
+        self.output_args = list(output_args)
+        self.workers = workers or os.cpu_count() or 4
+        if is_hardware(self.video_encoder()):
+            self.workers = min(self.workers, HARDWARE_WORKERS)
+        self.segments = []
+        self.retries = 0
+
+    def video_encoder(self):
+        if '-c:v' in self.video_args[:-1]:
+            return self.video_args[self.video_args.index('-c:v') + 1]
+        return None
+
+    def run(self):
+        info = self.probe.probe(self.infile)
+        duration = info['duration'] or 0
+        count = min(self.workers * SEGMENTS_PER_WORKER, int(duration // MIN_SEGMENT_SECONDS))
+        if not first_stream(info, 'video') or '-vn' in self.video_args or count < 2:
+            # nothing to split: audio only, or too short to be worth it
+            return self._run_single(duration)
+
+        points = split_points(self.probe.keyframes(self.infile), duration, count)
+        if not points:
+            return self._run_single(duration)
+
+        bounds = [0] + points + [duration]
+        self.segments = [end - start for start, end in zip(bounds, bounds[1:])]
+        has_audio = first_stream(info, 'audio') is not None
+        self.total_work = duration * (1 + COPY_WEIGHT * 2 + (AUDIO_WEIGHT if has_audio else 0))
+
+        work_dir = tempfile.mkdtemp(prefix='.convert_', dir=os.path.dirname(os.path.abspath(self.outfile)))
+        try:
+            self._split(work_dir, points, duration)
+            pieces = sorted(name for name in os.listdir(work_dir) if name.startswith('segment_'))
+            threads = max(1, (os.cpu_count() or 4) // min(self.workers, len(pieces)))
+
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(pieces)) + (1 if has_audio else 0)) as pool:
+                futures = []
+                if has_audio:
+                    futures.append(pool.submit(self._encode_audio, work_dir, duration))
+                futures += [pool.submit(self._encode_segment, work_dir, name, index, threads)
+                            for index, name in enumerate(pieces)]
+                try:
+                    results = [future.result() for future in futures]
+                except Exception:
+                    self.cancel()
+                    raise
+
+            audio_file = results.pop(0) if has_audio else None
+            self._join(work_dir, results, audio_file, duration)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _run_single(self, duration):
+        self.total_work = duration
+        self.segments = [duration]
+        args = single_args(self.infile, self.outfile, self.video_args, self.audio_args, self.output_args)
+        self.run_job(args, duration, self.outfile, 'single')
+
+    def _split(self, work_dir, points, duration):
+        # the segment muxer only cuts on keyframes, so this is a plain stream copy;
+        # the offset keeps float rounding from pushing a cut past the keyframe it was aimed at
+        times = ','.join(f"{max(0, point - 0.001):.3f}" for point in points)
+        args = ['-i', self.infile, '-map', '0:v:0', '-c', 'copy', '-f', 'segment', '-segment_times', times,
+                '-reset_timestamps', '1', os.path.join(work_dir, 'segment_%04d.mkv')]
+        self.run_job(args, duration, None, 'split', COPY_WEIGHT)
+
+    def _encode_segment(self, work_dir, name, index, threads):
+        source = os.path.join(work_dir, name)
+        output = os.path.join(work_dir, f"encoded_{index:04d}.mkv")
+        length = self.segments[index] if index < len(self.segments) else 0
+        args = ['-i', source, '-map', '0:v:0'] + self.video_args + ['-threads', str(threads), output]
+        for attempt in range(SEGMENT_RETRIES + 1):
+            try:
+                return self.run_job(args, length, output, index)
+            except FFmpegCancelled:
+                raise
+            except FFmpegError as e:
+                if attempt == SEGMENT_RETRIES:
+                    raise FFmpegError(f"Segment {index + 1} failed: {e}", e.returncode, e.stderr)
+                with self.lock:
+                    self.retries += 1
+                print(f"Segment {index + 1} failed, retrying: {e}")
+
+    def _encode_audio(self, work_dir, duration):
+        output = os.path.join(work_dir, 'audio.mka')
+        # audio is encoded in one piece: codec priming at every segment boundary would add gaps
+        args = ['-i', self.infile, '-map', '0:a', '-vn'] + self.audio_args + [output]
+        return self.run_job(args, duration, output, 'audio', AUDIO_WEIGHT)
+
+    def _join(self, work_dir, pieces, audio_file, duration):
+        list_file = write_concat_list(os.path.join(work_dir, 'segments.txt'), pieces)
+        args = ['-f', 'concat', '-safe', '0', '-i', list_file]
+        maps = ['-map', '0:v:0']
+        if audio_file:
+            args += ['-i', audio_file]
+            maps += ['-map', '1:a']
+        args += maps + ['-c', 'copy'] + self.output_args + [self.outfile]
+        self.run_job(args, duration, self.outfile, 'join', COPY_WEIGHT)
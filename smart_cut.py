@@ -0,0 +1,124 @@
+import bisect
+import os
+import shutil
+import tempfile
+
+from concat_planner import VIDEO_ENCODERS, video_encoder_args, video_params
+from ffmpeg_jobs import FFmpegJobGroup, write_concat_list
+from media_probe import first_stream
+
+COPY_WEIGHT = 0.02
+KEYFRAME_TOLERANCE = 0.001
+BOUNDARY_QUALITY = {
+    'libx264': ['-crf', '18'],
+    'libx265': ['-crf', '20'],
+    'libvpx': ['-crf', '10', '-b:v', '0'],
+    'libvpx-vp9': ['-crf', '20', '-b:v', '0'],
+    'libaom-av1': ['-crf', '24', '-b:v', '0'],
+}
+
+
+def seconds(value):
+    return f"{max(0.0, value):.6f}"
+
+
+def plan_cut(keyframes, start, end):
+    # (first keyframe at or after start, last keyframe at or before end, keyframe to seek to for start)
+    first = bisect.bisect_left(keyframes, start - KEYFRAME_TOLERANCE)
+    last = bisect.bisect_right(keyframes, end + KEYFRAME_TOLERANCE) - 1
+    before = bisect.bisect_right(keyframes, start + KEYFRAME_TOLERANCE) - 1
+    copy_from = keyframes[first] if first < len(keyframes) else None
+    copy_to = keyframes[last] if last >= 0 else None
+    seek_to = keyframes[before] if before >= 0 else 0.0
+    if copy_from is None or copy_to is None or copy_to <= copy_from:
+        return None, None, seek_to
+    return copy_from, copy_to, seek_to
+
+
+class SmartCut(FFmpegJobGroup):
+    def __init__(self, ffmpeg_path, probe, infile, outfile, start, end, on_progress=None, profile='balanced'):
+        super().__init__(ffmpeg_path, on_progress)
+        self.profile = profile
+        self.probe = probe
+        self.infile = infile
+        self.outfile = outfile
+        self.start = start
+        self.end = end
+        self.mode = None
+
+    def run(self):
+        info = self.probe.probe(self.infile)
+        if info['duration']:
+            self.end = min(self.end, info['duration'])
+        length = self.end - self.start
+        video = video_params(info)
+        has_audio = first_stream(info, 'audio') is not None
+        if not video or video['codec'] not in VIDEO_ENCODERS:
+            # nothing we can re-encode to match: fall back to a cut on the nearest keyframes
+            self.mode = 'copy'
+            self.total_work = length
+            return self.run_job(['-ss', seconds(self.start), '-to', seconds(self.end), '-i', self.infile,
+                                 '-c', 'copy', self.outfile], length, self.outfile, 'copy')
+
+        copy_from, copy_to, seek_to = plan_cut(self.probe.keyframes(self.infile), self.start, self.end)
+        # half a frame, to stop an encoded part before the keyframe the copied part starts with
+        margin = 0.5 / video['fps'] if video['fps'] else 0.01
+        if copy_from is None:
+            # no whole GOP inside the range, the edges are the whole cut
+            copy_from = copy_to = self.end
+            margin = 0
+        self.mode = 'smart'
+        head = copy_from - self.start - margin
+        tail = self.end - copy_to
+        middle = copy_to - copy_from
+        self.total_work = head + tail + middle * COPY_WEIGHT + length * COPY_WEIGHT * (2 if has_audio else 1)
+
+        work_dir = tempfile.mkdtemp(prefix='.trim_', dir=os.path.dirname(os.path.abspath(self.outfile)))
+        try:
+            parts = []
+            # shorter than another half frame means no frame sits between start and the keyframe
+            if head > max(KEYFRAME_TOLERANCE, margin - KEYFRAME_TOLERANCE):
+                parts.append(self._encode(work_dir, 'head', video, self.start, head))
+            if middle > KEYFRAME_TOLERANCE:
+                parts.append(self._copy_middle(work_dir, copy_from, middle, margin))
+            if tail > KEYFRAME_TOLERANCE:
+                parts.append(self._encode(work_dir, 'tail', video, copy_to, tail))
+            audio_file = self._copy_audio(work_dir, seek_to, length) if has_audio else None
+            self._join(work_dir, parts, audio_file, length)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _encode(self, work_dir, name, video, start, length):
+        # a decoding seek is frame exact, so the part starts on the first frame at or after start;
+        # the input-side -t is measured from the seek point rather than from the first frame kept
+        output = os.path.join(work_dir, f"{name}.mkv")
+        args = ['-ss', seconds(start), '-t', seconds(length), '-i', self.infile, '-map', '0:v:0']
+        # the profile only picks the encoder speed, the edges keep the quality of the copied middle
+        args += video_encoder_args(video, self.profile) + BOUNDARY_QUALITY.get(VIDEO_ENCODERS[video['codec']], [])
+        return self.run_job(args + [output], length, output, name)
+
+    def _copy_middle(self, work_dir, copy_from, length, margin):
+        # -t on a stream copy counts decode order and drags in reordered B-frames from the next GOP,
+        # the segment muxer splits exactly on the keyframe packet instead
+        pattern = os.path.join(work_dir, 'middle_%d.mkv')
+        args = ['-ss', seconds(copy_from + KEYFRAME_TOLERANCE), '-i', self.infile, '-t', seconds(length + 1),
+                '-map', '0:v:0', '-c', 'copy', '-f', 'segment', '-segment_times', seconds(length - margin),
+                '-reset_timestamps', '1', pattern]
+        self.run_job(args, length, None, 'middle', COPY_WEIGHT)
+        return pattern % 0
+
+    def _copy_audio(self, work_dir, seek_to, length):
+        # coarse seek to the keyframe before the cut, then drop audio packets up to the exact start
+        output = os.path.join(work_dir, 'audio.mka')
+        args = ['-ss', seconds(seek_to), '-i', self.infile, '-ss', seconds(self.start - seek_to),
+                '-t', seconds(length), '-map', '0:a', '-vn', '-c', 'copy', output]
+        return self.run_job(args, length, output, 'audio', COPY_WEIGHT)
+
+    def _join(self, work_dir, parts, audio_file, length):
+        list_file = write_concat_list(os.path.join(work_dir, 'parts.txt'), parts)
+        args = ['-f', 'concat', '-safe', '0', '-i', list_file]
+        maps = ['-map', '0:v:0']
+        if audio_file:
+            args += ['-i', audio_file]
+            maps += ['-map', '1:a']
+        self.run_job(args + maps + ['-c', 'copy', self.outfile], length, self.outfile, 'join', COPY_WEIGHT)
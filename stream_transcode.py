@@ -0,0 +1,150 @@
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+from ffmpeg_jobs import FFmpegCancelled, FFmpegError, STDERR_TAIL_LINES
+
+HEAD_SIZE = 64 * 1024
+PARTIAL_PREFIX = '.stream-'
+
+
+class StreamUnsupported(Exception):
+    pass
+
+
+def mp4_index_first(head):
+    # a piped mp4 is only readable when the moov box comes before the media data; None means not an mp4
+    if head[4:8] != b'ftyp':
+        return None
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos:pos + 4], 'big')
+        kind = head[pos + 4:pos + 8]
+        if kind == b'moov':
+            return True
+        if kind == b'mdat':
+            return False
+        if size == 1 and pos + 16 <= len(head):
+            size = int.from_bytes(head[pos + 8:pos + 16], 'big')
+        if size < 8:
+            return False
+        pos += size
+    # the first boxes alone are bigger than the head, nothing tells where moov is
+    return False
+
+
+class StreamTranscode:
+    def __init__(self, ffmpeg_path, chunks, input_args, output_args, outfile, total_bytes=None, on_progress=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.chunks = iter(chunks)
+        self.input_args = list(input_args)
+        self.output_args = list(output_args)
+        self.outfile = outfile
+        self.total_bytes = total_bytes
+        self.on_progress = on_progress
+        folder, filename = os.path.split(outfile)
+        # the extension stays, ffmpeg picks the muxer from it
+        self.partial = os.path.join(folder, PARTIAL_PREFIX + filename)
+        self.process = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self.downloaded = 0
+        self.started = None
+
+    def run(self):
+        head = b''
+        for chunk in self.chunks:
+            head += chunk
+            if len(head) >= HEAD_SIZE:
+                break
+        if not head:
+            raise StreamUnsupported("the server sent no data")
+        if mp4_index_first(head) is False:
+            raise StreamUnsupported("the mp4 index is at the end of the file")
+
+        cmd = [self.ffmpeg_path, '-hide_banner', '-nostats', '-y'] + self.input_args + ['-i', 'pipe:0']
+        cmd += self.output_args + [self.partial]
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        with self.lock:
+            if self.cancelled:
+                raise FFmpegCancelled("Cancelled")
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.PIPE, creationflags=creationflags)
+        stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        stderr_thread.start()
+
+        self.started = time.monotonic()
+        try:
+            self._write(head)
+            for chunk in self.chunks:
+                if not self._write(chunk):
+                    break
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            returncode = self.process.wait()
+        except BaseException:
+            # cancelled from a progress hook, or the connection broke
+            self.process.kill()
+            self.process.wait()
+            self._remove_partial()
+            raise
+        finally:
+            stderr_thread.join()
+
+        if self.cancelled:
+            self._remove_partial()
+            raise FFmpegCancelled("Cancelled", returncode, self.stderr())
+        if returncode != 0:
+            self._remove_partial()
+            lines = [line for line in self.stderr_tail if line.strip()]
+            reason = lines[-1] if lines else f"ffmpeg exited with code {returncode}"
+            raise FFmpegError(reason, returncode, self.stderr())
+        os.replace(self.partial, self.outfile)
+        self._report('finished')
+        return self.outfile
+
+    def _write(self, chunk):
+        try:
+            self.process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            # ffmpeg gave up on the input, its exit code says why
+            return False
+        self.downloaded += len(chunk)
+        self._report('downloading')
+        return True
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def stderr(self):
+        return '\n'.join(self.stderr_tail)
+
+    def _drain_stderr(self):
+        for line in self.process.stderr:
+            self.stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+
+    def _report(self, status):
+        if not self.on_progress:
+            return
+        elapsed = time.monotonic() - self.started
+        speed = self.downloaded / elapsed if elapsed > 0 else None
+        total = self.total_bytes if status == 'downloading' else self.downloaded
+        eta = (total - self.downloaded) / speed if total and speed else None
+        self.on_progress({'status': status, 'downloaded_bytes': self.downloaded, 'total_bytes': total,
+                          'elapsed': elapsed, 'speed': speed, 'eta': eta})
+
+    def _remove_partial(self):
+        if os.path.exists(self.partial):
+            try:
+                os.remove(self.partial)
+            except OSError:
+                pass
@@ -0,0 +1,124 @@
+import csv
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+SMOOTHING_SECONDS = 3.0
+MIN_SAMPLE_INTERVAL = 0.2
+PAUSE_GAP = 5.0
+HISTORY_SECONDS = 60
+MAX_TASKS = 64
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class ThroughputTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = OrderedDict()
+
+    def update(self, key, data, label=''):
+        now = time.monotonic()
+        status = data.get('status')
+        filename = data.get('filename')
+        downloaded = data.get('downloaded_bytes') or 0
+        total = data.get('total_bytes') or data.get('total_bytes_estimate')
+
+        with self.lock:
+            task = self.tasks.get(key)
+            if task is None:
+                task = self.tasks[key] = {
+                    'label': label,
+                    'status': status,
+                    'filename': None,
+                    'downloaded': 0,
+                    'total': None,
+                    'speed': None,
+                    'eta': None,
+                    'files_done': 0,
+                    'sample_at': now,
+                    'sample_bytes': 0,
+                    'history': deque()
+                }
+                while len(self.tasks) > MAX_TASKS:
+                    self.tasks.popitem(last=False)
+            else:
+                self.tasks.move_to_end(key)
+
+            task['status'] = status
+            if status == 'downloading':
+                if filename != task['filename'] or now - task['sample_at'] > PAUSE_GAP:
+                    # new file (playlist entry, merged format, resumed .part) or back from a pause:
+                    # restart the sample window instead of averaging over bytes we didn't just receive
+                    task['filename'] = filename
+                    task['sample_at'] = now
+                    task['sample_bytes'] = downloaded
+                elapsed = now - task['sample_at']
+                if elapsed >= MIN_SAMPLE_INTERVAL:
+                    rate = max(0, downloaded - task['sample_bytes']) / elapsed
+                    # time-based weight so irregular hook intervals smooth the same way
+                    weight = 1 - math.exp(-elapsed / SMOOTHING_SECONDS)
+                    task['speed'] = rate if task['speed'] is None else task['speed'] + weight * (rate - task['speed'])
+                    task['sample_at'] = now
+                    task['sample_bytes'] = downloaded
+                    wall_time = time.time()
+                    history = task['history']
+                    history.append((wall_time, downloaded, rate, task['speed']))
+                    while history and history[0][0] < wall_time - HISTORY_SECONDS:
+                        history.popleft()
+                task['downloaded'] = downloaded
+                task['total'] = total
+                task['eta'] = (total - downloaded) / task['speed'] if total and task['speed'] else None
+            elif status == 'finished':
+                task['files_done'] += 1
+                task['filename'] = None
+                task['downloaded'] = downloaded or task['downloaded']
+                task['total'] = total or task['total']
+                task['eta'] = 0
+
+            return self._view(task)
+
+    def _view(self, task):
+        total = task['total']
+        return {
+            'label': task['label'],
+            'status': task['status'],
+            'downloaded': task['downloaded'],
+            'total': total,
+            'percent': int(task['downloaded'] / total * 100) if total else None,
+            'speed': task['speed'],
+            'eta': task['eta'],
+            'files_done': task['files_done']
+        }
+
+    def snapshot(self, key):
+        with self.lock:
+            task = self.tasks.get(key)
+            return self._view(task) if task else None
+
+    def history(self, key):
+        with self.lock:
+            task = self.tasks.get(key)
+            return list(task['history']) if task else []
+
+    def export(self, path):
+        with self.lock:
+            rows = [(key, task['label'], list(task['history'])) for key, task in self.tasks.items()]
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['task', 'label', 'time', 'downloaded_bytes', 'rate_bps', 'smoothed_bps'])
+            for key, label, history in rows:
+                for wall_time, downloaded, rate, speed in history:
+                    writer.writerow([key, label, datetime.fromtimestamp(wall_time).isoformat(timespec='milliseconds'),
+                                     downloaded, round(rate), round(speed)])
+        return sum(len(history) for _key, _label, history in rows)
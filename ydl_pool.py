@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+PER_TASK_KEYS = ('logger', 'progress_hooks', 'postprocessor_hooks')
+
+
+class YoutubeDLPool:
+    def __init__(self, max_size=4):
+        self.max_size = max(0, int(max_size))
+        self.lock = threading.Lock()
+        self.idle = OrderedDict()
+        self.stats = {'created': 0, 'reused': 0, 'evicted': 0}
+
+    @staticmethod
+    def fingerprint(ydl_opts):
+        shared = {k: v for k, v in ydl_opts.items() if k not in PER_TASK_KEYS}
+        raw = json.dumps(shared, sort_keys=True, default=repr)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def acquire(self, ydl_opts):
+        import yt_dlp
+
+        key = self.fingerprint(ydl_opts)
+        ydl = None
+        with self.lock:
+            instances = self.idle.get(key)
+            if instances:
+                ydl = instances.pop()
+                if not instances:
+                    del self.idle[key]
+                self.stats['reused'] += 1
+
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL({k: v for k, v in ydl_opts.items() if k not in PER_TASK_KEYS})
+            with self.lock:
+                self.stats['created'] += 1
+
+        self._attach(ydl, ydl_opts)
+        try:
+            yield ydl
+        except yt_dlp.utils.YoutubeDLError:
+            self._detach(ydl)
+            self._release(key, ydl)
+            raise
+        except BaseException:
+            # anything else may have left the instance half-way through a request, don't hand it out again
+            self._detach(ydl)
+            self._close(ydl)
+            raise
+        else:
+            self._detach(ydl)
+            self._release(key, ydl)
+
+    def _attach(self, ydl, ydl_opts):
+        ydl.params['logger'] = ydl_opts.get('logger')
+        for hook in ydl_opts.get('progress_hooks') or []:
+            ydl.add_progress_hook(hook)
+        for hook in ydl_opts.get('postprocessor_hooks') or []:
+            ydl.add_postprocessor_hook(hook)
+
+    def _detach(self, ydl):
+        ydl.params['logger'] = None
+        ydl._progress_hooks.clear()
+        ydl._postprocessor_hooks.clear()
+
+    def _release(self, key, ydl):
+        evicted = []
+        with self.lock:
+            self.idle.setdefault(key, []).append(ydl)
+            self.idle.move_to_end(key)
+            while sum(len(v) for v in self.idle.values()) > self.max_size:
+                old_key, instances = next(iter(self.idle.items()))
+                evicted.append(instances.pop(0))
+                if not instances:
+                    del self.idle[old_key]
+                self.stats['evicted'] += 1
+        for old in evicted:
+            self._close(old)
+
+    @staticmethod
+    def _close(ydl):
+        try:
+            ydl.close()
+        except Exception as e:
+            print(f"Error closing YoutubeDL instance: {e}")
+
+    def clear(self):
+        with self.lock:
+            instances = [ydl for group in self.idle.values() for ydl in group]
+            self.idle.clear()
+        for ydl in instances:
+            self._close(ydl)